@@ -0,0 +1,455 @@
+# config/bench.py
+"""
+Бенчмарк горячих страниц и сервисов на синтетической сети отелей.
+
+seed() заводит N отелей с номерами, проживаниями, ночами, операциями ДДС
+с движениями кассы и компаниями с фолио за несколько лет — детерминированно
+(random.Random(seed)), так что одинаковые параметры дают одинаковые данные.
+Пишет пачками через те же сервисы, что и импорт (dds.importer.write_operations),
+в конце — остатки фолио, старение долга и снимки остатков кассы.
+
+run() прогоняет сценарии (шахматка, дашборд ДДС, карточка отеля, сводный
+отчёт, Excel-выгрузки, заселение) и для каждого пишет время (min/медиана/max
+по повторам), число SQL и пик памяти (отдельный прогон под tracemalloc).
+Результат — JSON с параметрами окружения и масштабом данных; compare()
+сравнивает два таких файла.
+
+Гонять на отдельной базе: seed пишет много строк, а run по умолчанию
+чистит кэш перед каждым повтором (холодный кэш).
+"""
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import perf_counter
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from dds.exports import write_hotel_detail, write_unified_report
+from dds.importer import write_operations
+from dds.ledger import build_snapshots
+from dds.models import CashMovement, DDSArticle, DDSCategory, DDSOperation, Hotel
+from pms.aging import refresh_aging
+from pms.kpi import rebuild_kpi
+from pms.models import (
+    Company, CompanyFolio, CompanyFolioItem, HotelPMSSettings, Room, RoomNight, RoomType, Stay,
+)
+from pms.services import build_room_nights, check_in_stay, ensure_default_stay_income_article, recalc_folio_balances
+
+PREFIX = "Bench"
+BENCH_USER = "bench"
+BATCH = 2000
+
+ROOM_TYPES = (("Стандарт", Decimal("2500.00")), ("Люкс", Decimal("4500.00")))
+
+EXPENSE_ARTICLES = {
+    "Хозяйственные": ("Моющие средства", "Бельё", "Ремонт"),
+    "Коммунальные": ("Электричество", "Вода", "Интернет"),
+    "Персонал": ("Зарплата", "Аванс"),
+}
+
+GUESTS = ("Иванов", "Петров", "Асанов", "Токтогулов", "Смирнова", "Абдыкадыров", "Ким", "Орлова")
+
+# способ оплаты -> вес
+GUEST_METHODS = ((DDSOperation.CASH, 5), (DDSOperation.MKASSA, 3), (DDSOperation.OPTIMA, 2))
+EXPENSE_METHODS = ((DDSOperation.CASH, 7), (DDSOperation.MKASSA, 3))
+
+STAY_NIGHTS = (1, 1, 2, 2, 3, 4, 5, 7)
+STAY_GAPS = (0, 0, 0, 1, 2, 3)
+
+
+def bench_hotels(prefix: str = PREFIX):
+    return Hotel.objects.filter(name__startswith=f"{prefix} ").order_by("id")
+
+
+def bench_user():
+    user, created = get_user_model().objects.get_or_create(
+        username=BENCH_USER, defaults={"is_superuser": True, "is_staff": True},
+    )
+    if created:
+        user.set_unusable_password()
+        user.save(update_fields=["password"])
+    return user
+
+
+# ---------------------------------------------------------------
+# Данные
+# ---------------------------------------------------------------
+
+def _pick(rnd, weighted):
+    return rnd.choices([v for v, _ in weighted], weights=[w for _, w in weighted])[0]
+
+
+def _at(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+
+def _expense_articles():
+    arts = []
+    for cat_name, names in EXPENSE_ARTICLES.items():
+        cat, _ = DDSCategory.objects.get_or_create(
+            kind=DDSCategory.EXPENSE, parent=None, name=cat_name, defaults={"is_active": True},
+        )
+        for name in names:
+            art, _ = DDSArticle.objects.get_or_create(
+                kind=DDSArticle.EXPENSE, category=cat, name=name, defaults={"is_active": True},
+            )
+            arts.append(art)
+    return arts
+
+
+def _stays_for_room(rnd, *, hotel, room, rate, start, end, now, companies, user):
+    """Проживания номера подряд с паузами — без пересечений."""
+    stays = []
+    day = start + timedelta(days=rnd.randint(0, 3))
+    while day < end:
+        nights = rnd.choice(STAY_NIGHTS)
+        check_in, check_out = _at(day, 14), _at(day + timedelta(days=nights), 12)
+
+        if check_out <= now:
+            status = rnd.choices((Stay.OUT, Stay.CANCELED, Stay.NO_SHOW), weights=(93, 5, 2))[0]
+        elif check_in <= now:
+            status = Stay.IN
+        else:
+            status = Stay.BOOKED
+
+        company = rnd.choice(companies) if companies and rnd.random() < 0.2 else None
+        stays.append(Stay(
+            hotel=hotel, room=room,
+            stay_type=Stay.CORPORATE if company else Stay.PRIVATE,
+            company=company,
+            guest_name=f"{rnd.choice(GUESTS)} {rnd.randint(1, 999)}",
+            check_in=check_in, check_out=check_out,
+            amount=rate * nights,
+            discount=Decimal("0.00"),
+            status=status,
+            created_by=user,
+        ))
+        day += timedelta(days=nights + rnd.choice(STAY_GAPS))
+    return stays
+
+
+def _write_ops(ops, user):
+    for i in range(0, len(ops), BATCH):
+        write_operations(ops[i:i + BATCH], user)
+
+
+def _folio_payments(rnd, folio, charges, *, user, article, until):
+    """Раз в месяц компания гасит 80-100% накопленного долга."""
+    payments = []
+    charges = sorted(charges, key=lambda c: c.happened_at)
+    if not charges:
+        return payments
+
+    debt = Decimal("0.00")
+    i = 0
+    month = charges[0].happened_at.date().replace(day=1)
+    while True:
+        month = (month + timedelta(days=32)).replace(day=1)
+        pay_at = _at(month, 11)
+        if pay_at > until:
+            break
+        while i < len(charges) and charges[i].happened_at < pay_at:
+            debt += charges[i].amount
+            i += 1
+        amount = (debt * Decimal(rnd.randint(80, 100)) / 100).quantize(Decimal("0.01"))
+        if amount <= 0:
+            continue
+        debt -= amount
+        op = DDSOperation(
+            hotel=folio.hotel, article=article, amount=amount, happened_at=pay_at,
+            method=_pick(rnd, ((DDSOperation.MKASSA, 1), (DDSOperation.OPTIMA, 1))),
+            counterparty=folio.company.name, source="company_folio",
+            comment=f"Оплата по фолио компании: {folio.company.name}", created_by=user,
+        )
+        payments.append((op, CompanyFolioItem(
+            folio=folio, item_type=CompanyFolioItem.PAYMENT, happened_at=pay_at,
+            amount=amount, signed_amount=-amount, description="Оплата", created_by=user,
+        )))
+    return payments
+
+
+def seed(*, hotels: int = 3, rooms: int = 20, years: int = 2, companies: int = 10,
+         expenses_per_day: int = 4, seed: int = 42, prefix: str = PREFIX, log=None) -> dict:
+    """Сгенерировать сеть отелей. Возвращает масштаб (см. scale())."""
+    log = log or (lambda msg: None)
+    rnd = random.Random(seed)
+    user = bench_user()
+    income_article = ensure_default_stay_income_article()
+    expense_articles = _expense_articles()
+
+    now = timezone.now()
+    today = timezone.localdate()
+    start = today - timedelta(days=365 * years)
+    end = today + timedelta(days=30)
+
+    company_objs = Company.objects.bulk_create([
+        Company(name=f"{prefix} Компания {i + 1}", pay_terms=rnd.choice((Company.PAY_WEEKLY, Company.PAY_INVOICE)))
+        for i in range(companies)
+    ])
+
+    for h in range(hotels):
+        hotel = Hotel.objects.create(name=f"{prefix} {h + 1}")
+        HotelPMSSettings.objects.update_or_create(hotel=hotel, defaults={"is_enabled": True})
+
+        types = [
+            RoomType.objects.create(hotel=hotel, name=name, default_day_rate=rate)
+            for name, rate in ROOM_TYPES
+        ]
+        room_objs = Room.objects.bulk_create([
+            Room(
+                hotel=hotel, number=f"{r // 10 + 1}{r % 10 + 1:02d}", floor=r // 10 + 1,
+                room_type=types[0] if r % 4 else types[1],
+            )
+            for r in range(rooms)
+        ])
+
+        # проживания и ночи
+        stays = []
+        for room in room_objs:
+            rate = room.room_type.default_day_rate
+            stays += _stays_for_room(
+                rnd, hotel=hotel, room=room, rate=rate, start=start, end=end,
+                now=now, companies=company_objs, user=user,
+            )
+        stays = Stay.objects.bulk_create(stays, batch_size=BATCH)
+        nights = [n for stay in stays for n in build_room_nights(stay)]
+        RoomNight.objects.bulk_create(nights, batch_size=BATCH)
+
+        # деньги: оплаты гостей, начисления компаний, расходы
+        ops = []
+        folios = {}
+        charges = {}
+        for stay in stays:
+            if stay.status not in (Stay.IN, Stay.OUT) or stay.total_to_pay <= 0:
+                continue
+            if stay.company_id:
+                folio = folios.get(stay.company_id)
+                if folio is None:
+                    folio = folios[stay.company_id] = CompanyFolio.objects.create(hotel=hotel, company=stay.company)
+                charges.setdefault(folio.id, []).append(CompanyFolioItem(
+                    folio=folio, item_type=CompanyFolioItem.CHARGE, happened_at=stay.check_in,
+                    amount=stay.total_to_pay, signed_amount=stay.total_to_pay,
+                    description=f"Начисление проживания (Stay #{stay.id})", stay_id=stay.id, created_by=user,
+                ))
+                continue
+            ops.append(DDSOperation(
+                hotel=hotel, article=income_article, amount=stay.total_to_pay, happened_at=stay.check_in,
+                method=_pick(rnd, GUEST_METHODS), counterparty=stay.guest_name,
+                source=f"pms:stay:{stay.id}", created_by=user,
+            ))
+
+        day = start
+        while day <= today:
+            for _ in range(rnd.randint(0, expenses_per_day * 2)):
+                ops.append(DDSOperation(
+                    hotel=hotel, article=rnd.choice(expense_articles),
+                    amount=Decimal(rnd.randrange(300, 15000)), happened_at=_at(day, rnd.randint(8, 20), rnd.randint(0, 59)),
+                    method=_pick(rnd, EXPENSE_METHODS), created_by=user,
+                ))
+            day += timedelta(days=1)
+
+        payments = []
+        for folio in folios.values():
+            payments += _folio_payments(rnd, folio, charges.get(folio.id, []), user=user, article=income_article, until=now)
+
+        ops += [op for op, _ in payments]
+        ops.sort(key=lambda op: op.happened_at)
+        _write_ops(ops, user)
+
+        items = [item for folio_charges in charges.values() for item in folio_charges]
+        for op, item in payments:
+            item.dds_operation = op
+            items.append(item)
+        CompanyFolioItem.objects.bulk_create(items, batch_size=BATCH)
+
+        log(f"{hotel.name}: номеров {len(room_objs)}, проживаний {len(stays)}, операций {len(ops)}, строк фолио {len(items)}")
+
+    hotel_ids = list(bench_hotels(prefix).values_list("id", flat=True))
+    recalc_folio_balances(list(CompanyFolio.objects.filter(hotel_id__in=hotel_ids).values_list("id", flat=True)))
+    refresh_aging(hotel_ids=hotel_ids, full=True)
+    build_snapshots(hotel_ids=hotel_ids)
+    rebuild_kpi(hotel_ids=hotel_ids)
+    return scale(prefix)
+
+
+def scale(prefix: str = PREFIX) -> dict:
+    """Сколько данных у бенчмарк-отелей — пишется в результат рядом с цифрами."""
+    hotel_ids = list(bench_hotels(prefix).values_list("id", flat=True))
+    return {
+        "hotels": len(hotel_ids),
+        "rooms": Room.objects.filter(hotel_id__in=hotel_ids).count(),
+        "stays": Stay.objects.filter(hotel_id__in=hotel_ids).count(),
+        "room_nights": RoomNight.objects.filter(hotel_id__in=hotel_ids).count(),
+        "dds_operations": DDSOperation.objects.filter(hotel_id__in=hotel_ids).count(),
+        "cash_movements": CashMovement.objects.filter(hotel_id__in=hotel_ids).count(),
+        "folios": CompanyFolio.objects.filter(hotel_id__in=hotel_ids).count(),
+        "folio_items": CompanyFolioItem.objects.filter(folio__hotel_id__in=hotel_ids).count(),
+    }
+
+
+# ---------------------------------------------------------------
+# Прогон
+# ---------------------------------------------------------------
+
+def _host() -> str:
+    hosts = [h for h in settings.ALLOWED_HOSTS if h not in ("*", "") and not h.startswith(".")]
+    return hosts[0] if hosts else "localhost"
+
+
+def scenarios(*, prefix: str = PREFIX, days: int = 365) -> dict:
+    """{имя: функция} — каждая делает одно обращение и возвращает HTTP-статус (или None)."""
+    hotels = bench_hotels(prefix)
+    hotel = hotels.first()
+    if hotel is None:
+        raise ValueError(f"Нет отелей «{prefix} …» — сначала bench_seed.")
+    user = bench_user()
+
+    client = Client(HTTP_HOST=_host())
+    client.force_login(user)
+
+    date_to = timezone.localdate()
+    date_from = date_to - timedelta(days=days)
+    period = {"date_from": date_from.isoformat(), "date_to": date_to.isoformat()}
+
+    def get(url, params=None):
+        return lambda: client.get(url, params or {}).status_code
+
+    def export_hotel_detail():
+        write_hotel_detail(io.BytesIO(), hotel=hotel, date_from=date_from, date_to=date_to)
+
+    def export_unified_report():
+        write_unified_report(io.BytesIO(), hotels=hotels, date_from=date_from, date_to=date_to)
+
+    def check_in():
+        # заселение с оплатой — в транзакции, которую откатываем: данные не меняются между повторами
+        stay = Stay.objects.filter(hotel=hotel, status=Stay.BOOKED, stay_type=Stay.PRIVATE).order_by("check_in").first()
+        if stay is None:
+            raise ValueError("Нет брони для заселения — нужен seed с будущими датами.")
+        with transaction.atomic():
+            check_in_stay(stay=stay, user=user, pay_now=True, method=DDSOperation.CASH)
+            transaction.set_rollback(True)
+
+    return {
+        "board_week": get(reverse("pms:board"), {"hotel": hotel.id}),
+        "board_month": get(reverse("pms:board"), {"hotel": hotel.id, "view": "month"}),
+        "dds_dashboard": get(reverse("dds:dds_dashboard"), period),
+        "hotel_detail": get(reverse("dds:hotel_detail", args=[hotel.id]), period),
+        "unified_report": get(reverse("dds:unified_report"), period),
+        "pms_kpi": get(reverse("pms:kpi"), {"hotel": hotel.id, "by": "room_type", **period}),
+        "export_hotel_detail": export_hotel_detail,
+        "export_unified_report": export_unified_report,
+        "check_in_stay": check_in,
+    }
+
+
+def measure(fn, *, repeat: int = 5, warm: bool = False) -> dict:
+    """Время по повторам, SQL и пик памяти одного сценария."""
+    if warm:
+        fn()
+
+    times = []
+    queries = None
+    status = None
+    for _ in range(repeat):
+        if not warm:
+            cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            start = perf_counter()
+            status = fn()
+            times.append(perf_counter() - start)
+        queries = len(ctx.captured_queries)
+
+    # память отдельно: tracemalloc сам замедляет код в разы
+    if not warm:
+        cache.clear()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        "wall_ms": {
+            "min": round(min(times) * 1000, 2),
+            "median": round(statistics.median(times) * 1000, 2),
+            "max": round(max(times) * 1000, 2),
+        },
+        "queries": queries,
+        "peak_kb": round(peak / 1024, 1),
+    }
+    if status is not None:
+        result["status"] = status
+    return result
+
+
+def _git_rev() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def run(*, repeat: int = 5, warm: bool = False, only=None, prefix: str = PREFIX, days: int = 365, log=None) -> dict:
+    log = log or (lambda msg: None)
+    results = {}
+    for name, fn in scenarios(prefix=prefix, days=days).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(fn, repeat=repeat, warm=warm)
+        r = results[name]
+        log(f"{name}: {r['wall_ms']['median']} мс, SQL {r['queries']}, пик {r['peak_kb']} КБ")
+
+    return {
+        "meta": {
+            "started_at": timezone.now().isoformat(timespec="seconds"),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "db": connection.vendor,
+            "repeat": repeat,
+            "cache": "warm" if warm else "cold",
+            "period_days": days,
+            "scale": scale(prefix),
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> list:
+    """[(сценарий, метрика, было, стало, изменение %)] по общим сценариям."""
+    rows = []
+    for name, cur in new["results"].items():
+        prev = old.get("results", {}).get(name)
+        if not prev:
+            continue
+        for metric, a, b in (
+            ("wall_ms", prev["wall_ms"]["median"], cur["wall_ms"]["median"]),
+            ("queries", prev["queries"], cur["queries"]),
+            ("peak_kb", prev["peak_kb"], cur["peak_kb"]),
+        ):
+            delta = round((b - a) * 100 / a, 1) if a else None
+            rows.append((name, metric, a, b, delta))
+    return rows
+
+
+def dump(result: dict, fh):
+    json.dump(result, fh, ensure_ascii=False, indent=2)
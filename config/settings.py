@@ -50,6 +50,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # request.hotel_scope — доступные отели пользователя (dds/scope.py)
+    'dds.scope.HotelScopeMiddleware',
+    # число/время SQL на страницу + бюджеты (config/sql_profiler.py)
+    'config.sql_profiler.SQLProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -131,6 +135,9 @@ STATIC_ROOT = BASE_DIR.parent / "public_html" / "static"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR.parent / "public_html" / "media"
 
+# выгрузки и отчёты импорта — НЕ в public_html: отдаются только через вьюхи с проверкой прав
+PRIVATE_MEDIA_ROOT = BASE_DIR.parent / "private_media"
+
 # STATIC_URL = '/static/'
  
 # STATIC_ROOT = os.path.join(BASE_DIR, 'static')
@@ -142,4 +149,22 @@ MEDIA_ROOT = BASE_DIR.parent / "public_html" / "media"
 CSRF_TRUSTED_ORIGINS = [
     "https://173b9765dbb1.ngrok-free.app",
     "https://*.ngrok-free.app",  # чтобы не менять каждый раз при новом URL
-]
\ No newline at end of file
+]
+
+
+# Профилировщик SQL: бюджет — максимум запросов на страницу,
+# превышение пишется в лог "sql_profiler" (в тестах можно ON_EXCEEDED="raise")
+SQL_PROFILER = {
+    "HEADER": DEBUG,
+    "BUDGETS": {
+        "dds:dds_dashboard": 12,
+        "dds:hotel_detail": 12,
+        "dds:dds_list": 8,
+        "dds:accounting": 10,
+        "pms:board": 15,
+        "pms:folio_list": 6,
+        "pms:folio_aging": 10,
+        "pms:stay_edit": 15,
+    },
+    "ON_EXCEEDED": "log",
+}
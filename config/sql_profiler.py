@@ -0,0 +1,185 @@
+# config/sql_profiler.py
+"""
+Профилировщик SQL на уровне запроса.
+
+SQLProfilerMiddleware через connection.execute_wrapper считает для каждого
+HTTP-запроса число SQL, суммарное время и самые медленные выражения,
+а также повторы одного и того же SQL (признак N+1). Дальше:
+  - заголовки X-SQL-Queries / X-SQL-Time-Ms (DEBUG или staff);
+  - сводка по view в кэше — страница /admin/sql-profile/ для staff;
+  - бюджет запросов на view из settings.SQL_PROFILER["BUDGETS"]:
+    превышение пишется в лог, а в режиме "raise" (тесты) — исключение.
+
+Настройки (все ключи необязательны):
+    SQL_PROFILER = {
+        "ENABLED": True,
+        "HEADER": DEBUG,
+        "SLOWEST": 5,             # сколько медленных SQL хранить
+        "BUDGETS": {"dds:hotel_detail": 12},
+        "DEFAULT_BUDGET": None,   # для view без своего бюджета
+        "ON_EXCEEDED": "log",     # или "raise"
+        "STATS_TTL": 24 * 3600,
+    }
+"""
+import heapq
+import logging
+from collections import Counter
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.shortcuts import redirect, render
+
+logger = logging.getLogger("sql_profiler")
+
+STATS_KEY = "sqlprof:view:{}"
+INDEX_KEY = "sqlprof:views"
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def _conf() -> dict:
+    conf = {
+        "ENABLED": True,
+        "HEADER": settings.DEBUG,
+        "SLOWEST": 5,
+        "BUDGETS": {},
+        "DEFAULT_BUDGET": None,
+        "ON_EXCEEDED": "log",
+        "STATS_TTL": 24 * 3600,
+    }
+    conf.update(getattr(settings, "SQL_PROFILER", {}))
+    return conf
+
+
+class QueryProfile:
+    """execute_wrapper: число, время, медленные и повторяющиеся SQL."""
+
+    def __init__(self, keep_slowest: int = 5):
+        self.keep_slowest = keep_slowest
+        self.count = 0
+        self.time = 0.0
+        self.slowest = []  # куча (время, sql)
+        self.by_sql = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            took = perf_counter() - start
+            self.count += 1
+            self.time += took
+            # SQL с плейсхолдерами — N+1 даёт одну и ту же строку
+            self.by_sql[sql] += 1
+            item = (took, sql)
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def slowest_sql(self):
+        return [(round(t * 1000, 2), sql) for t, sql in sorted(self.slowest, reverse=True)]
+
+    def repeated_sql(self, min_count: int = 3):
+        return [(n, sql) for sql, n in self.by_sql.most_common(5) if n >= min_count]
+
+
+def budget_for(view_name: str, conf=None):
+    conf = conf or _conf()
+    return conf["BUDGETS"].get(view_name, conf["DEFAULT_BUDGET"])
+
+
+def record_stats(view_name: str, profile: QueryProfile, ttl: int):
+    """Сводка по view в кэше (последний запрос, максимум, средние)."""
+    key = STATS_KEY.format(view_name)
+    st = cache.get(key) or {"view": view_name, "hits": 0, "queries": 0, "time_ms": 0.0, "max_queries": 0}
+    st["hits"] += 1
+    st["queries"] += profile.count
+    st["time_ms"] += profile.time * 1000
+    if profile.count >= st["max_queries"]:
+        st["max_queries"] = profile.count
+        st["slowest"] = profile.slowest_sql()
+        st["repeated"] = profile.repeated_sql()
+    st["last_queries"] = profile.count
+    cache.set(key, st, ttl)
+
+    views = cache.get(INDEX_KEY) or set()
+    if view_name not in views:
+        views.add(view_name)
+        cache.set(INDEX_KEY, views, ttl)
+
+
+class SQLProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.conf = _conf()
+        if not self.conf["ENABLED"]:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        profile = QueryProfile(self.conf["SLOWEST"])
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(profile))
+            response = self.get_response(request)
+
+        user = getattr(request, "user", None)
+        if self.conf["HEADER"] or (user is not None and user.is_staff):
+            response["X-SQL-Queries"] = str(profile.count)
+            response["X-SQL-Time-Ms"] = f"{profile.time * 1000:.1f}"
+
+        # 404 и прочее без view в сводку не пишем — иначе ключей по числу URL
+        match = getattr(request, "resolver_match", None)
+        if match is None or not match.view_name:
+            return response
+        view_name = match.view_name
+
+        record_stats(view_name, profile, self.conf["STATS_TTL"])
+
+        budget = budget_for(view_name, self.conf)
+        if budget is not None and profile.count > budget:
+            msg = f"{view_name}: {profile.count} SQL при бюджете {budget}"
+            repeated = profile.repeated_sql()
+            if repeated:
+                msg += f"; повторы: {repeated[0][0]}× {repeated[0][1][:200]}"
+            if self.conf["ON_EXCEEDED"] == "raise":
+                raise QueryBudgetExceeded(msg)
+            logger.warning(msg)
+
+        return response
+
+
+@staff_member_required
+def sql_profile_view(request):
+    if request.method == "POST":
+        for view_name in cache.get(INDEX_KEY) or ():
+            cache.delete(STATS_KEY.format(view_name))
+        cache.delete(INDEX_KEY)
+        return redirect(request.path)
+
+    conf = _conf()
+    rows = []
+    for view_name in cache.get(INDEX_KEY) or ():
+        st = cache.get(STATS_KEY.format(view_name))
+        if not st:
+            continue
+        st["avg_queries"] = round(st["queries"] / st["hits"], 1)
+        st["avg_time_ms"] = round(st["time_ms"] / st["hits"], 1)
+        st["budget"] = budget_for(view_name, conf)
+        st["over_budget"] = st["budget"] is not None and st["max_queries"] > st["budget"]
+        rows.append(st)
+    rows.sort(key=lambda r: (-r["max_queries"], r["view"]))
+
+    return render(request, "admin/sql_profile.html", {
+        **admin.site.each_context(request),
+        "title": "SQL по страницам",
+        "rows": rows,
+    })
@@ -17,7 +17,9 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from .views1 import home 
+from .sql_profiler import sql_profile_view
 urlpatterns = [
+    path('admin/sql-profile/', sql_profile_view, name="sql_profile"),
     path('admin/', admin.site.urls),
     path('',home),
     path("dds/", include("dds.urls")),
@@ -1,8 +1,19 @@
 # dds/admin.py
-from django.contrib import admin
+import io
+import os
+import re
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.files.base import ContentFile
 from django.db.models import Sum
+from django.http import FileResponse, Http404
+from django.shortcuts import redirect, render
+from django.urls import path, reverse
 from django.utils.html import format_html
-from django.utils import timezone
+
+from .importer import ImportRowError, import_operations
+from .storage import private_storage, random_name
 
 from .models import (
     Hotel,
@@ -13,8 +24,13 @@ from .models import (
     CashMovement,
     CashIncasso,
     CashTransfer,
+    ExportJob,
+    CashBalanceSnapshot,
 )
 
+# имя отчёта в закрытом хранилище: imports/ГГГГ/ММ/<uuid>.csv (см. dds.storage.random_name)
+IMPORT_REPORT_RE = re.compile(r"^imports/\d{4}/\d{2}/[0-9a-f]{32}\.csv$")
+
 # ----------------------------
 # Helpers
 # ----------------------------
@@ -35,7 +51,8 @@ class CashRegisterInline(admin.StackedInline):
     extra = 0
     max_num = 1
     can_delete = False
-    readonly_fields = ("noncash_total", "total", "updated_at")
+    # остатки — проекция журнала CashMovement, руками не правим (см. dds.ledger)
+    readonly_fields = ("cash_balance", "mkassa_balance", "zadatok_balance", "optima_balance", "noncash_total", "total", "updated_at")
     fieldsets = (
         ("Баланс", {
             "fields": (
@@ -184,7 +201,8 @@ class CashRegisterAdmin(admin.ModelAdmin):
     list_select_related = ("hotel",)
     search_fields = ("hotel__name",)
     ordering = ("hotel__name",)
-    readonly_fields = ("noncash_total", "total", "updated_at")
+    # остатки — проекция журнала CashMovement, руками не правим (см. dds.ledger)
+    readonly_fields = ("cash_balance", "mkassa_balance", "zadatok_balance", "optima_balance", "noncash_total", "total", "updated_at")
     fieldsets = (
         ("Отель", {"fields": ("hotel",)}),
         ("Баланс", {
@@ -238,8 +256,83 @@ class DDSArticleAdmin(admin.ModelAdmin):
 # Admin: DDSOperation
 # ----------------------------
 
+class DDSImportForm(forms.Form):
+    file = forms.FileField(label="Файл (.csv / .xlsx)")
+    hotel = forms.ModelChoiceField(
+        Hotel.objects.all(), required=False, label="Отель",
+        help_text="Для строк без колонки «Отель».",
+    )
+    dry_run = forms.BooleanField(required=False, label="Только проверить")
+
+
 @admin.register(DDSOperation)
 class DDSOperationAdmin(admin.ModelAdmin):
+    change_list_template = "admin/dds/ddsoperation/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path("import/", self.admin_site.admin_view(self.import_view), name="dds_ddsoperation_import"),
+            path(
+                "import/errors/<path:name>",
+                self.admin_site.admin_view(self.import_errors_view),
+                name="dds_ddsoperation_import_errors",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """Загрузка истории операций (dds.importer); большие файлы — командой import_dds_operations."""
+        if not self.has_add_permission(request):
+            return redirect("admin:dds_ddsoperation_changelist")
+
+        form = DDSImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            report = io.StringIO()
+            try:
+                stats = import_operations(
+                    upload.file, upload.name,
+                    user=request.user,
+                    hotel=form.cleaned_data["hotel"],
+                    report=report,
+                    dry_run=form.cleaned_data["dry_run"],
+                )
+            except ImportRowError as e:
+                messages.error(request, str(e))
+            else:
+                done = "проверено" if form.cleaned_data["dry_run"] else "импортировано"
+                messages.success(request, f"Строк: {stats['rows']}, {done}: {stats['imported']}.")
+                if stats["errors"]:
+                    # в отчёте данные строк (суммы, контрагенты) — только закрытое хранилище
+                    name = private_storage().save(
+                        random_name("imports", "errors.csv"),
+                        ContentFile(report.getvalue().encode("utf-8-sig")),
+                    )
+                    messages.warning(request, format_html(
+                        "Ошибок: {} — <a href='{}'>отчёт</a>.", stats["errors"],
+                        reverse("admin:dds_ddsoperation_import_errors", args=[name]),
+                    ))
+                return redirect("admin:dds_ddsoperation_changelist")
+
+        return render(request, "admin/dds/ddsoperation/import.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Импорт операций ДДС",
+            "form": form,
+        })
+
+    def import_errors_view(self, request, name):
+        """Отчёт об ошибках импорта из закрытого хранилища — тем же, кто может импортировать."""
+        if not self.has_add_permission(request) or not IMPORT_REPORT_RE.match(name):
+            raise Http404
+        storage = private_storage()
+        if not storage.exists(name):
+            raise Http404
+        return FileResponse(
+            storage.open(name, "rb"), as_attachment=True,
+            filename=f"import_errors_{os.path.basename(name)}", content_type="text/csv",
+        )
+
     date_hierarchy = "happened_at"
     list_display = (
         "happened_at",
@@ -356,6 +449,19 @@ class CashMovementAdmin(admin.ModelAdmin):
         )
 
 
+# ----------------------------
+# Admin: CashBalanceSnapshot
+# ----------------------------
+
+@admin.register(CashBalanceSnapshot)
+class CashBalanceSnapshotAdmin(admin.ModelAdmin):
+    date_hierarchy = "day"
+    list_display = ("day", "hotel", "account", "balance", "created_at")
+    list_filter = ("hotel", "account")
+    ordering = ("-day", "hotel__name", "account")
+    readonly_fields = ("hotel", "account", "day", "balance", "created_at")
+
+
 # ----------------------------
 # Admin: CashIncasso
 # ----------------------------
@@ -392,3 +498,24 @@ class CashTransferAdmin(admin.ModelAdmin):
     ordering = ("-happened_at", "-id")
     autocomplete_fields = ("hotel", "register", "created_by", "voided_by")
     readonly_fields = ("created_at", "voided_at")
+
+
+# ----------------------------
+# Admin: ExportJob
+# ----------------------------
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    date_hierarchy = "created_at"
+    list_display = ("id", "kind", "status", "created_by", "created_at", "finished_at", "download")
+    list_filter = ("kind", "status")
+    ordering = ("-created_at", "-id")
+    # файл в закрытом хранилище — только ссылка на export_download (там проверка прав)
+    exclude = ("file",)
+    readonly_fields = ("params_hash", "created_at", "started_at", "finished_at", "error", "download")
+
+    @admin.display(description="Файл")
+    def download(self, obj):
+        if obj.status != ExportJob.DONE or not obj.file:
+            return "—"
+        return format_html('<a href="{}">{}</a>', reverse("dds:export_download", args=[obj.pk]), obj.filename or "скачать")
@@ -0,0 +1,81 @@
+# dds/cache.py
+"""
+Кэш тяжёлых агрегатов ДДС.
+
+Ключ = (что считаем, набор отелей, параметры, версии данных этих отелей).
+Версия отеля хранится в БД (DDSDataVersion) и увеличивается в той же транзакции,
+что и запись операции/движения денег, а правка статьи или категории (их имена
+есть в итогах) поднимает версии всех отелей (см. dds.signals). После любой записи
+старый ключ просто перестаёт совпадать — устаревшие итоги не показываются
+даже при нескольких воркерах с локальным кэшем.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import DDSDataVersion
+
+CACHE_TTL = getattr(settings, "DDS_CACHE_TTL", 60 * 15)
+
+
+def shared_cache() -> bool:
+    """
+    Кэш по умолчанию общий для всех процессов (Redis, Memcached, БД)?
+    В LocMem сброс ключа виден только своему процессу.
+    """
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def bump_hotel_version(hotel_id):
+    """Новая версия данных отеля (вызывается на каждую запись ДДС/кассы)."""
+    if not hotel_id:
+        return
+    if DDSDataVersion.objects.filter(hotel_id=hotel_id).update(version=F("version") + 1):
+        return
+    try:
+        with transaction.atomic():
+            DDSDataVersion.objects.create(hotel_id=hotel_id, version=1)
+    except IntegrityError:
+        DDSDataVersion.objects.filter(hotel_id=hotel_id).update(version=F("version") + 1)
+
+
+def bump_all_versions():
+    """Новая версия у всех отелей сразу — одним UPDATE (правка справочника статей/категорий)."""
+    DDSDataVersion.objects.update(version=F("version") + 1)
+
+
+def hotel_versions(hotel_ids) -> dict:
+    return dict(
+        DDSDataVersion.objects.filter(hotel_id__in=list(hotel_ids)).values_list("hotel_id", "version")
+    )
+
+
+def _cache_key(prefix: str, hotel_ids, params: dict) -> str:
+    ids = sorted(set(hotel_ids))
+    versions = hotel_versions(ids)
+    raw = json.dumps(
+        {"h": [[i, versions.get(i, 0)] for i in ids], "p": params},
+        sort_keys=True,
+        default=str,
+    )
+    return f"dds:{prefix}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def cached_for_hotels(prefix: str, hotel_ids, params: dict, build):
+    """
+    Значение из кэша или build() (результат кладём в кэш).
+    Версии читаем ДО расчёта: если запись прошла во время расчёта,
+    результат ляжет под старый ключ, а следующий запрос уже пойдёт по новому.
+    """
+    key = _cache_key(prefix, hotel_ids, params)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, CACHE_TTL)
+    return data
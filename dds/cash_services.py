@@ -1,17 +1,17 @@
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
 
 from django.utils import timezone
 
-from .models import CashRegister, CashMovement, CashTransfer, Hotel
+from .cache import bump_hotel_version
+from .ledger import REGISTER_FIELD, invalidate_snapshots, local_day, signed_amount_expr
+from .models import CashBalanceSnapshot, CashRegister, CashMovement, CashTransfer, Hotel
 
-FIELD_MAP = {
-    CashMovement.ACC_CASH: "cash_balance",
-    CashMovement.ACC_MKASSA: "mkassa_balance",
-    CashMovement.ACC_ZADATOK: "zadatok_balance",
-    CashMovement.ACC_OPTIMA: "optima_balance",
-}
+# счёт -> поле остатка в CashRegister
+FIELD_MAP = REGISTER_FIELD
 
 
 class CashTransferError(Exception):
@@ -25,7 +25,100 @@ def _to_decimal(x) -> Decimal:
         raise ValidationError("Некорректная сумма.")
 
 
+def _locked_register(hotel: Hotel) -> CashRegister:
+    """Касса отеля под блокировкой (обычно одним запросом; нет кассы — создаём)."""
+    reg = CashRegister.objects.select_for_update().filter(hotel=hotel).first()
+    if reg is None:
+        reg, _ = CashRegister.objects.get_or_create(hotel=hotel)
+        reg = CashRegister.objects.select_for_update().get(pk=reg.pk)
+    return reg
+
+
 @transaction.atomic
+def post_cash_movements(*, hotel: Hotel, movements, created_by=None, register=None, check_funds=True) -> list:
+    """
+    Пакетная проводка движений одного отеля: одна транзакция, одна блокировка кассы.
+
+    movements — список dict с полями как у apply_cash_movement
+    (account, direction, amount, happened_at, comment, dds_operation, incasso,
+    transfer, created_by — по умолчанию общий created_by).
+    Остаток проверяется по порядку движений — как если бы проводили по одному.
+    Движения пишутся одним bulk_create, остатки — одним UPDATE с F() по всем счетам.
+    register — уже заблокированная касса этого отеля (если вызывающий взял её сам).
+    check_funds=False — без проверки остатка (импорт истории, dds.importer).
+    """
+    now = timezone.now()
+
+    # 1) проверяем всё до записи
+    rows = []
+    for m in movements:
+        account = m.get("account")
+        direction = m.get("direction")
+        amount = _to_decimal(m.get("amount"))
+        if amount <= 0:
+            raise ValidationError("Сумма должна быть больше 0.")
+        if account not in FIELD_MAP:
+            raise ValidationError(f"Неизвестный счет: {account}")
+        if direction not in (CashMovement.IN, CashMovement.OUT):
+            raise ValidationError("Неверное направление движения.")
+        rows.append((m, account, direction, amount))
+    if not rows:
+        return []
+
+    reg = register or _locked_register(hotel)
+
+    # 2) остатки по ходу пакета
+    balances = {acc: getattr(reg, field) or Decimal("0.00") for acc, field in FIELD_MAP.items()}
+    deltas = {acc: Decimal("0.00") for acc in FIELD_MAP}
+    for m, account, direction, amount in rows:
+        if direction == CashMovement.OUT:
+            if check_funds and amount > balances[account]:
+                raise ValidationError(f"Недостаточно средств на счете {account}. Доступно: {balances[account]}")
+            amount = -amount
+        balances[account] += amount
+        deltas[account] += amount
+
+    # 3) журнал + касса
+    moves = CashMovement.objects.bulk_create([
+        CashMovement(
+            register=reg,
+            hotel=hotel,
+            account=account,
+            direction=direction,
+            amount=amount,
+            happened_at=m.get("happened_at") or now,
+            comment=m.get("comment") or "",
+            created_by=m.get("created_by", created_by),
+            dds_operation=m.get("dds_operation"),
+            incasso=m.get("incasso"),
+            transfer=m.get("transfer"),
+        )
+        for m, account, direction, amount in rows
+    ])
+
+    changed = {FIELD_MAP[acc]: F(FIELD_MAP[acc]) + delta for acc, delta in deltas.items() if delta}
+    # update() не трогает auto_now — updated_at ставим сами
+    CashRegister.objects.filter(pk=reg.pk).update(updated_at=now, **changed)
+    for acc in FIELD_MAP:
+        setattr(reg, FIELD_MAP[acc], balances[acc])
+    reg.updated_at = now
+
+    # 4) движения задним числом — снимки остатков с самого раннего дня пересчитаются
+    today = timezone.localdate()
+    earliest = {}
+    for mv in moves:
+        day = local_day(mv.happened_at)
+        if day < today and (mv.account not in earliest or day < earliest[mv.account]):
+            earliest[mv.account] = day
+    for account, day in earliest.items():
+        invalidate_snapshots(hotel.id, account, day)
+
+    # bulk_create не шлёт post_save — версию данных отеля поднимаем сами
+    bump_hotel_version(hotel.id)
+
+    return moves
+
+
 def apply_cash_movement(
     *,
     hotel: Hotel,
@@ -40,56 +133,25 @@ def apply_cash_movement(
     transfer=None,
 ):
     """
-    Создаёт CashMovement и обновляет CashRegister.
-    ВАЖНО: обновляем через объект reg (а не через .update(F())),
-    чтобы обновлялся updated_at и не было “визуально не меняется”.
+    Создаёт одно CashMovement и обновляет CashRegister (пакет из одного движения).
+    Единственная точка записи денег: все приходы/расходы/переводы идут
+    через post_cash_movements, поэтому остатки кассы всегда совпадают
+    с журналом (см. dds.ledger).
     """
-    happened_at = happened_at or timezone.now()
-    amount = _to_decimal(amount)
-
-    if amount <= 0:
-        raise ValidationError("Сумма должна быть больше 0.")
-
-    field = FIELD_MAP.get(account)
-    if not field:
-        raise ValidationError(f"Неизвестный счет: {account}")
-
-    # берём/создаём кассу
-    reg, _ = CashRegister.objects.get_or_create(hotel=hotel)
-    reg = CashRegister.objects.select_for_update().get(pk=reg.pk)
-
-    current = getattr(reg, field) or Decimal("0.00")
-
-    # расчёт нового баланса
-    if direction == CashMovement.IN:
-        new_value = current + amount
-    elif direction == CashMovement.OUT:
-        if amount > current:
-            raise ValidationError(f"Недостаточно средств на счете {account}. Доступно: {current}")
-        new_value = current - amount
-    else:
-        raise ValidationError("Неверное направление движения.")
-
-    # ✅ создаём движение
-    move = CashMovement.objects.create(
-        register=reg,
+    return post_cash_movements(
         hotel=hotel,
-        account=account,
-        direction=direction,
-        amount=amount,
-        happened_at=happened_at,
-        comment=comment or "",
         created_by=created_by,
-        dds_operation=dds_operation,
-        incasso=incasso,
-        transfer=transfer,
-    )
-
-    # ✅ обновляем баланс + updated_at
-    setattr(reg, field, new_value)
-    reg.save(update_fields=[field, "updated_at"])
-
-    return move
+        movements=[{
+            "account": account,
+            "direction": direction,
+            "amount": amount,
+            "happened_at": happened_at,
+            "comment": comment,
+            "dds_operation": dds_operation,
+            "incasso": incasso,
+            "transfer": transfer,
+        }],
+    )[0]
 
 
 @transaction.atomic
@@ -116,15 +178,14 @@ def transfer_between_accounts(
     if amount <= 0:
         raise CashTransferError("Сумма должна быть больше 0.")
 
-    # касса под блокировкой
-    reg, _ = CashRegister.objects.get_or_create(hotel=hotel)
-    reg = CashRegister.objects.select_for_update().get(pk=reg.pk)
-
     from_field = FIELD_MAP.get(from_account)
     to_field = FIELD_MAP.get(to_account)
     if not from_field or not to_field:
         raise CashTransferError("Неверный счет.")
 
+    # касса под блокировкой — одна на весь перевод
+    reg = _locked_register(hotel)
+
     from_balance = getattr(reg, from_field) or Decimal("0.00")
     if from_balance < amount:
         raise CashTransferError(
@@ -143,27 +204,83 @@ def transfer_between_accounts(
         created_by=user,
     )
 
-    # ✅ делаем 2 движения через общий сервис (и касса обновится корректно)
-    apply_cash_movement(
+    # ✅ оба движения одним пакетом (касса обновится одним UPDATE)
+    post_cash_movements(
         hotel=hotel,
-        account=from_account,
-        direction=CashMovement.OUT,
-        amount=amount,
         created_by=user,
-        happened_at=happened_at,
-        comment=f"Перевод на {to_account}. {comment}".strip(),
-        transfer=transfer,
-    )
-
-    apply_cash_movement(
-        hotel=hotel,
-        account=to_account,
-        direction=CashMovement.IN,
-        amount=amount,
-        created_by=user,
-        happened_at=happened_at,
-        comment=f"Перевод с {from_account}. {comment}".strip(),
-        transfer=transfer,
+        register=reg,
+        movements=[
+            {
+                "account": from_account,
+                "direction": CashMovement.OUT,
+                "amount": amount,
+                "happened_at": happened_at,
+                "comment": f"Перевод на {to_account}. {comment}".strip(),
+                "transfer": transfer,
+            },
+            {
+                "account": to_account,
+                "direction": CashMovement.IN,
+                "amount": amount,
+                "happened_at": happened_at,
+                "comment": f"Перевод с {from_account}. {comment}".strip(),
+                "transfer": transfer,
+            },
+        ],
     )
 
     return transfer
+
+
+def balances_as_of(hotel: Hotel, at) -> dict:
+    """
+    Остатки счетов отеля на момент at: {account: Decimal}.
+
+    Берём последний снимок (CashBalanceSnapshot) каждого счёта за день раньше
+    дня at — по подзапросу на счёт в одном запросе, каждый — поиск по
+    уникальному индексу (hotel, account, day) — и досуммируем движения после
+    него до at включительно одним запросом по индексу (hotel, account, happened_at).
+    Без снимков — вся история счёта.
+    """
+    day = local_day(at)
+    tz = timezone.get_current_timezone()
+
+    def latest(account, field):
+        return Subquery(
+            CashBalanceSnapshot.objects
+            .filter(hotel=OuterRef("pk"), account=account, day__lt=day)
+            .order_by("-day")
+            .values(field)[:1]
+        )
+
+    snaps = Hotel.objects.filter(pk=hotel.pk).values(**{
+        f"{field}_{account}": latest(account, field)
+        for account in FIELD_MAP
+        for field in ("day", "balance")
+    }).first() or {}
+
+    since = {}     # account -> движения учитываем с этого момента
+    base = {}      # account -> остаток снимка
+    for account in FIELD_MAP:
+        snap_day, balance = snaps.get(f"day_{account}"), snaps.get(f"balance_{account}")
+        if snap_day is not None:
+            since[account] = timezone.make_aware(datetime.combine(snap_day + timedelta(days=1), time.min), tz)
+            base[account] = Decimal(balance).quantize(Decimal("0.01"))  # SQLite отдаёт подзапрос без округления
+        else:
+            since[account] = None
+            base[account] = Decimal("0.00")
+
+    aggregates = {}
+    for account, start in since.items():
+        flt = Q(account=account)
+        if start is not None:
+            flt &= Q(happened_at__gte=start)
+        aggregates[account] = Sum(signed_amount_expr(), filter=flt)
+
+    moves = CashMovement.objects.filter(hotel=hotel, happened_at__lte=at)
+    starts = [s for s in since.values() if s is not None]
+    if len(starts) == len(since):
+        moves = moves.filter(happened_at__gte=min(starts))
+    sums = moves.aggregate(**aggregates)
+
+    return {account: base[account] + (sums[account] or Decimal("0.00")) for account in FIELD_MAP}
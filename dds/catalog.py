@@ -0,0 +1,246 @@
+# dds/catalog.py
+"""
+Справочник статей и категорий ДДС в памяти процесса.
+
+Формы операций (DDSOpCreateForm, DDSOperationForm, DDSQuickOpForm, DDSOpForm),
+заселение и оплата фолио строят список статей и проверяют выбор по каталогу:
+активные категории и статьи + индекс доступности статей по отелям
+(общие статьи — без ограничений, остальные — по отелю). Один раз собрали —
+дальше формы не делают ни одного запроса к статьям.
+
+Сброс: сигналы на DDSArticle / DDSCategory / M2M hotels (dds.signals) меняют
+версию каталога в кэше Django, процесс пересобирает каталог при следующем
+обращении. Так каталог живёт между запросами, только если кэш общий для всех
+процессов (dds.cache.shared_cache, DDS_CATALOG_CACHE = True/False — явно).
+С локальным кэшем (LocMem) версию видит только свой процесс, и другие воркеры
+принимали бы выключенную/удалённую статью (проверку FK статьи формы пропускают,
+см. CatalogArticleFormMixin) — там каталог собирается заново на каждый запрос
+(dds.signals сбрасывает его по request_started).
+"""
+import copy
+import threading
+from time import monotonic
+
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+from .cache import shared_cache
+from .models import DDSArticle, DDSCategory
+
+CATALOG_TTL = getattr(settings, "DDS_CATALOG_TTL", 60 * 5)
+VERSION_KEY = "dds:catalog:ver"
+
+_lock = threading.Lock()
+_current = None
+_request = threading.local()  # каталог текущего запроса (без общего кэша)
+
+
+class Catalog:
+    def __init__(self, categories, articles, article_hotels, version):
+        self.version = version
+        self.built_at = monotonic()
+
+        self.categories = {c.id: c for c in categories}
+        self.articles = {a.id: a for a in articles}
+        # индекс доступности: общие статьи + статьи, привязанные к отелю
+        self.common = set()
+        self.by_hotel = {}
+        self.article_hotels = {}
+        for a in articles:
+            hotels = frozenset(article_hotels.get(a.id, ()))
+            self.article_hotels[a.id] = hotels
+            if not hotels:
+                self.common.add(a.id)
+            for hotel_id in hotels:
+                self.by_hotel.setdefault(hotel_id, set()).add(a.id)
+
+    def article(self, article_id):
+        try:
+            return self.articles.get(int(article_id))
+        except (TypeError, ValueError):
+            return None
+
+    def category(self, category_id):
+        try:
+            return self.categories.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def is_available(self, article_id, hotel_id) -> bool:
+        hotels = self.article_hotels.get(article_id)
+        if hotels is None:
+            return False
+        return not hotels or hotel_id in hotels
+
+    def articles_for(self, *, kind=None, hotel_id=None, any_hotel=False, category_ids=None, order=("name",)):
+        """
+        Статьи по фильтрам. hotel_id=None без any_hotel — только общие статьи
+        (как раньше hotels__isnull=True); any_hotel=True — без фильтра по отелю.
+        """
+        if any_hotel:
+            ids = self.articles.keys()
+        else:
+            ids = self.common | self.by_hotel.get(hotel_id, set()) if hotel_id else self.common
+        rows = [
+            a for a in (self.articles[i] for i in ids)
+            if (kind is None or a.kind == kind)
+            and (category_ids is None or a.category_id in category_ids)
+        ]
+        rows.sort(key=lambda a: tuple(_sort_value(getattr(a, f)) for f in order))
+        return rows
+
+    def categories_for(self, kind=None):
+        rows = [c for c in self.categories.values() if kind is None or c.kind == kind]
+        rows.sort(key=lambda c: (_sort_value(c.parent_id), c.name))
+        return rows
+
+    def children_ids(self, category_id) -> set:
+        """Категория + её прямые дети."""
+        return {category_id} | {c.id for c in self.categories.values() if c.parent_id == category_id}
+
+
+def _sort_value(v):
+    # None (без категории/родителя) — первым, как NULL в ORDER BY у SQLite/PostgreSQL ASC
+    return (v is not None, v if v is not None else 0)
+
+
+def _version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def _build(version) -> Catalog:
+    # все категории (и выключенные): __str__ статьи/категории ходит в category/parent —
+    # подставляем их здесь, чтобы подписи в формах не делали запросов
+    cats = {c.id: c for c in DDSCategory.objects.all()}
+    for c in cats.values():
+        c.parent = cats.get(c.parent_id)
+    categories = [c for c in cats.values() if c.is_active]
+
+    articles = list(DDSArticle.objects.filter(is_active=True))
+    for a in articles:
+        a.category = cats.get(a.category_id)
+    article_hotels = {}
+    for article_id, hotel_id in DDSArticle.hotels.through.objects.filter(
+        ddsarticle__is_active=True,
+    ).values_list("ddsarticle_id", "hotel_id"):
+        article_hotels.setdefault(article_id, set()).add(hotel_id)
+    return Catalog(categories, articles, article_hotels, version)
+
+
+def cache_enabled() -> bool:
+    """Держать каталог процесса между запросами — только при общем кэше."""
+    explicit = getattr(settings, "DDS_CATALOG_CACHE", None)
+    if explicit is not None:
+        return bool(explicit)
+    return shared_cache()
+
+
+def forget_request_catalog(**kwargs):
+    _request.catalog = None
+
+
+def get_catalog() -> Catalog:
+    global _current
+    if not cache_enabled():
+        # вне запроса (команды, shell) — тот же каталог не дольше CATALOG_TTL
+        cat = getattr(_request, "catalog", None)
+        if cat is None or monotonic() - cat.built_at >= CATALOG_TTL:
+            cat = _request.catalog = _build(0)
+        return cat
+    version = _version()
+    cat = _current
+    if cat is not None and cat.version == version and monotonic() - cat.built_at < CATALOG_TTL:
+        return cat
+    with _lock:
+        cat = _current
+        if cat is None or cat.version != version or monotonic() - cat.built_at >= CATALOG_TTL:
+            cat = _current = _build(version)
+    return cat
+
+
+def invalidate_catalog():
+    global _current
+    _current = None
+    forget_request_catalog()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+# ---------------------------------------------------------------
+# Поля форм на каталоге
+# ---------------------------------------------------------------
+
+class CatalogChoiceField(forms.ChoiceField):
+    """
+    Выбор статьи/категории из списка объектов каталога (вместо ModelChoiceField):
+    варианты и проверка — без запросов. cleaned_data — копия объекта модели.
+    objects — сами объекты (для шаблонов, которые рисуют список вручную).
+    """
+
+    def __init__(self, objects=(), *, empty_label="---------", label_from_instance=str, **kwargs):
+        self.empty_label = empty_label
+        self.label_from_instance = label_from_instance
+        super().__init__(**kwargs)
+        self.objects = objects
+
+    @property
+    def objects(self):
+        return self._objects
+
+    @objects.setter
+    def objects(self, objects):
+        self._objects = list(objects)
+        self._by_id = {str(o.pk): o for o in self._objects}
+        choices = [(o.pk, self.label_from_instance(o)) for o in self._objects]
+        self.choices = [("", self.empty_label)] + choices if self.empty_label is not None else choices
+
+    def prepare_value(self, value):
+        return getattr(value, "pk", value)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        obj = self._by_id.get(str(getattr(value, "pk", value)))
+        if obj is None:
+            raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value})
+        # копия: объект каталога общий для всех запросов процесса
+        return copy.copy(obj)
+
+    def validate(self, value):
+        if value is None and self.required:
+            raise ValidationError(self.error_messages["required"], code="required")
+
+    def has_changed(self, initial, data):
+        return str(self.prepare_value(initial) or "") != str(data or "")
+
+
+def catalog_field(field, objects, **kwargs) -> CatalogChoiceField:
+    """CatalogChoiceField вместо ModelChoiceField формы — с её подписью, обязательностью и пустым вариантом."""
+    params = {
+        "label": field.label,
+        "required": field.required,
+        "help_text": field.help_text,
+        "empty_label": getattr(field, "empty_label", "---------"),
+        "initial": field.initial,
+        "disabled": field.disabled,
+    }
+    params.update(kwargs)
+    new = CatalogChoiceField(objects, **params)
+    new.widget.attrs.update(field.widget.attrs)
+    return new
+
+
+class CatalogArticleFormMixin:
+    """
+    Для ModelForm операции: статья уже проверена по каталогу, поэтому
+    проверку FK статьи в Model.full_clean (запрос «есть ли такая статья») пропускаем.
+    """
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        exclude.add("article")
+        return exclude
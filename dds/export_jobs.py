@@ -0,0 +1,148 @@
+# dds/export_jobs.py
+"""
+Очередь фоновых выгрузок (ExportJob).
+
+Вьюха выгрузки только ставит задачу (request_export) и уводит на страницу
+статуса, книгу собирает воркер (manage.py run_export_worker) теми же
+функциями из dds.exports. Задача берётся в работу условным UPDATE
+pending -> running, поэтому несколько воркеров не соберут её дважды.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .cache import hotel_versions
+from .exports import SPOOL_MAX_SIZE, write_accounting, write_hotel_detail, write_unified_report
+from .models import ExportJob, Hotel
+
+# задача в running дольше этого — воркер умер, возвращаем в очередь
+STALE_AFTER = timedelta(minutes=30)
+
+
+def _params_hash(kind: str, params: dict) -> str:
+    versions = hotel_versions(params["hotel_ids"])
+    raw = json.dumps(
+        {"k": kind, "p": params, "v": [[i, versions.get(i, 0)] for i in params["hotel_ids"]]},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _file_exists(job: ExportJob) -> bool:
+    return bool(job.file) and job.file.storage.exists(job.file.name)
+
+
+def request_export(*, kind: str, user, hotel_ids, date_from=None, date_to=None, **extra):
+    """
+    Задача на выгрузку. Если такая же (параметры + версии данных) уже
+    стоит в очереди, собирается или готова — возвращаем её.
+    Возвращает (job, created).
+    """
+    params = {
+        "hotel_ids": sorted(set(hotel_ids)),
+        "date_from": date_from.isoformat() if date_from else None,
+        "date_to": date_to.isoformat() if date_to else None,
+        **extra,
+    }
+    key = _params_hash(kind, params)
+
+    with transaction.atomic():
+        job = (
+            ExportJob.objects.select_for_update()
+            .filter(params_hash=key, status__in=[ExportJob.PENDING, ExportJob.RUNNING, ExportJob.DONE])
+            .order_by("-created_at")
+            .first()
+        )
+        if job and (job.status != ExportJob.DONE or _file_exists(job)):
+            return job, False
+        job = ExportJob.objects.create(kind=kind, params=params, params_hash=key, created_by=user)
+    return job, True
+
+
+# ---------------------------------------------------------------
+# Сборка
+# ---------------------------------------------------------------
+
+def _build(job: ExportJob, fh) -> str:
+    """Пишет книгу задачи в fh, возвращает имя файла для скачивания."""
+    p = job.params
+    date_from = parse_date(p["date_from"]) if p.get("date_from") else None
+    date_to = parse_date(p["date_to"]) if p.get("date_to") else None
+    hotels = Hotel.objects.filter(id__in=p["hotel_ids"])
+
+    if job.kind == ExportJob.HOTEL_DETAIL:
+        hotel = hotels.get()
+        write_hotel_detail(fh, hotel=hotel, date_from=date_from, date_to=date_to)
+        return f"hotel_{hotel.id}_dds.xlsx"
+    if job.kind == ExportJob.UNIFIED_REPORT:
+        write_unified_report(fh, hotels=hotels, date_from=date_from, date_to=date_to)
+        return "akcha_hotel_unified_report.xlsx"
+    if job.kind == ExportJob.ACCOUNTING:
+        write_accounting(
+            fh, hotels=hotels, hotel_label=p.get("hotel_label") or "Все",
+            date_from=date_from, date_to=date_to,
+        )
+        return "akcha_hotel_accounting.xlsx"
+    raise ValueError(f"Неизвестный тип выгрузки: {job.kind}")
+
+
+def claim_job(job_id) -> bool:
+    """Взять задачу в работу (True, если её не взял другой воркер)."""
+    return bool(
+        ExportJob.objects.filter(pk=job_id, status=ExportJob.PENDING)
+        .update(status=ExportJob.RUNNING, started_at=timezone.now())
+    )
+
+
+def run_job(job_id) -> ExportJob:
+    """Собрать уже взятую (running) задачу и сохранить файл."""
+    job = ExportJob.objects.get(pk=job_id)
+    try:
+        with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as fh:
+            filename = _build(job, fh)
+            fh.seek(0)
+            job.filename = filename
+            job.file.save(filename, File(fh), save=False)
+    except Exception as e:
+        job.status = ExportJob.FAILED
+        job.error = f"{type(e).__name__}: {e}"[:2000]
+    else:
+        job.status = ExportJob.DONE
+        job.error = ""
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "file", "filename", "error", "finished_at"])
+    return job
+
+
+def pending_job_ids(limit: int):
+    return list(
+        ExportJob.objects.filter(status=ExportJob.PENDING)
+        .order_by("created_at", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+def requeue_stale() -> int:
+    """Задачи, зависшие в running (упал воркер), — обратно в очередь."""
+    return ExportJob.objects.filter(
+        status=ExportJob.RUNNING, started_at__lt=timezone.now() - STALE_AFTER
+    ).update(status=ExportJob.PENDING, started_at=None)
+
+
+def purge_jobs(older_than: timedelta) -> int:
+    """Удалить старые задачи вместе с файлами."""
+    old = ExportJob.objects.filter(created_at__lt=timezone.now() - older_than).exclude(status=ExportJob.RUNNING)
+    n = 0
+    for job in old.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        n += 1
+    return n
@@ -0,0 +1,260 @@
+# dds/exports.py
+"""
+Выгрузки ДДС в Excel.
+
+Книги пишутся в write-only режиме openpyxl (строки сразу уходят во временный
+файл листа, а не копятся в памяти), строки операций читаются
+.values_list(...).iterator(chunk_size) — без кэша моделей в QuerySet.
+Книга пишется в переданный файл (воркер выгрузок, dds.export_jobs, даёт
+SpooledTemporaryFile), поэтому память не растёт с числом строк.
+"""
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from .models import CashIncasso, DDSArticle, DDSDailyRollup, DDSOperation
+from .pivot import DDSPivot
+from .rollup import ROOMS_Q, rollup_qs
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+CHUNK_SIZE = 2000
+# до этого размера книга держится в памяти, дальше — на диске
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+HEADER_FONT = Font(bold=True)
+
+KIND_LABELS = dict(DDSArticle.KIND_CHOICES)
+OP_METHOD_LABELS = dict(DDSOperation.METHOD_CHOICES)
+INCASSO_METHOD_LABELS = dict(CashIncasso.METHOD_CHOICES)
+
+
+# ---------------------------------------------------------------
+# Помощники write-only книги
+# ---------------------------------------------------------------
+
+def _bold(ws, value):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = HEADER_FONT
+    return cell
+
+
+def _sheet(wb, title, *, header=None, widths=None):
+    """Лист с шириной колонок (задаётся до первой строки) и жирной шапкой."""
+    ws = wb.create_sheet(title)
+    for letter, width in (widths or {}).items():
+        ws.column_dimensions[letter].width = width
+    if header:
+        ws.append([_bold(ws, h) for h in header])
+    return ws
+
+
+def _summary_row(ws, label, value):
+    ws.append([_bold(ws, label), value])
+
+
+def _fmt_dt(dt):
+    return dt.strftime("%Y-%m-%d %H:%M")
+
+
+def _period_filter(qs, date_from, date_to):
+    if date_from:
+        qs = qs.filter(happened_at__gte=timezone.make_aware(datetime.combine(date_from, time.min)))
+    if date_to:
+        qs = qs.filter(happened_at__lte=timezone.make_aware(datetime.combine(date_to, time.max)))
+    return qs
+
+
+# ---------------------------------------------------------------
+# Отчёт по отелю
+# ---------------------------------------------------------------
+
+def write_hotel_detail(fh, *, hotel, date_from=None, date_to=None):
+    rollup = rollup_qs(hotel=hotel, date_from=date_from, date_to=date_to)
+
+    pivot = DDSPivot.for_rollup(rollup)
+    income_total = pivot.total(DDSArticle.INCOME)
+    expense_total = pivot.total(DDSArticle.EXPENSE)
+    balance = income_total - expense_total
+
+    rooms_by_day = (
+        rollup.filter(ROOMS_Q)
+        .values_list("day")
+        .annotate(total=Coalesce(Sum("total"), Decimal("0.00")))
+        .order_by("day")
+    )
+
+    wb = Workbook(write_only=True)
+
+    # Лист 1: Итоги
+    ws1 = _sheet(wb, "Итоги")
+    _summary_row(ws1, "Отель", hotel.name)
+    _summary_row(ws1, "Период", f"{date_from or '—'} → {date_to or '—'}")
+    ws1.append([])
+    _summary_row(ws1, "Приход", float(income_total))
+    _summary_row(ws1, "Расход", float(expense_total))
+    _summary_row(ws1, "Остаток", float(balance))
+
+    # Лист 2: Номера по дням
+    ws2 = _sheet(wb, "Номера по дням", header=["Дата", "Доход с номеров"])
+    for day, total in rooms_by_day:
+        ws2.append([day.strftime("%Y-%m-%d") if day else "", float(total)])
+
+    # Лист 3: Операции
+    ws3 = _sheet(
+        wb, "Операции",
+        header=["Дата", "Тип", "Статья", "Способ", "Сумма", "Контрагент", "Источник", "Комментарий"],
+    )
+    ops = _period_filter(DDSOperation.objects.filter(hotel=hotel, is_voided=False), date_from, date_to)
+    rows = ops.order_by("happened_at", "id").values_list(
+        "happened_at", "article__kind", "article__name", "method",
+        "amount", "counterparty", "source", "comment",
+    )
+    for happened_at, kind, article, method, amount, counterparty, source, comment in rows.iterator(chunk_size=CHUNK_SIZE):
+        ws3.append([
+            _fmt_dt(happened_at),
+            KIND_LABELS.get(kind, kind),
+            article,
+            OP_METHOD_LABELS.get(method, method),
+            float(amount),
+            counterparty or "",
+            source or "",
+            (comment or "")[:500],
+        ])
+
+    wb.save(fh)
+
+
+# ---------------------------------------------------------------
+# Единый отчёт по сети
+# ---------------------------------------------------------------
+
+def write_unified_report(fh, *, hotels, date_from=None, date_to=None):
+    rollup = rollup_qs(hotels=hotels, date_from=date_from, date_to=date_to)
+
+    by_hotels = list(
+        rollup.values("hotel_id", "hotel__name")
+        .annotate(
+            income=Coalesce(Sum("total", filter=Q(kind=DDSArticle.INCOME)), Decimal("0.00")),
+            expense=Coalesce(Sum("total", filter=Q(kind=DDSArticle.EXPENSE)), Decimal("0.00")),
+        )
+        .annotate(balance=F("income") - F("expense"))
+        .order_by("hotel__name")
+    )
+
+    total_income = sum((x["income"] for x in by_hotels), Decimal("0.00"))
+    total_expense = sum((x["expense"] for x in by_hotels), Decimal("0.00"))
+    total_balance = total_income - total_expense
+
+    by_articles = (
+        rollup.values_list("article__kind", "article__name")
+        .annotate(total=Coalesce(Sum("total"), Decimal("0.00")))
+        .order_by("article__kind", "-total", "article__name")
+    )
+
+    wb = Workbook(write_only=True)
+
+    # Лист 1: Итоги
+    ws1 = _sheet(wb, "Итоги", widths={"A": 18, "B": 40})
+    _summary_row(ws1, "Отчет", "Единый отчет по сети (ДДС)")
+    _summary_row(ws1, "Период", f"{date_from or '—'} → {date_to or '—'}")
+    ws1.append([])
+    _summary_row(ws1, "Итого приход", float(total_income))
+    _summary_row(ws1, "Итого расход", float(total_expense))
+    _summary_row(ws1, "Итого остаток", float(total_balance))
+
+    # Лист 2: По отелям
+    ws2 = _sheet(
+        wb, "По отелям",
+        header=["Отель", "Приход", "Расход", "Остаток"],
+        widths={"A": 30, "B": 14, "C": 14, "D": 14},
+    )
+    for r in by_hotels:
+        ws2.append([r["hotel__name"], float(r["income"]), float(r["expense"]), float(r["balance"])])
+
+    # Лист 3: По статьям
+    ws3 = _sheet(
+        wb, "По статьям",
+        header=["Тип", "Статья", "Сумма"],
+        widths={"A": 10, "B": 35, "C": 14},
+    )
+    for kind, name, total in by_articles:
+        ws3.append([
+            "Доход" if kind == DDSArticle.INCOME else "Расход",
+            name,
+            float(total),
+        ])
+
+    wb.save(fh)
+
+
+# ---------------------------------------------------------------
+# Бухгалтерия: расходы и инкассации
+# ---------------------------------------------------------------
+
+def write_accounting(fh, *, hotels, hotel_label="Все", date_from=None, date_to=None):
+    expenses = _period_filter(
+        DDSOperation.objects.filter(
+            is_voided=False,
+            hotel__in=hotels,
+            article__kind=DDSArticle.EXPENSE,
+        ).exclude(source__iexact="incasso"),
+        date_from, date_to,
+    )
+    incassos = _period_filter(CashIncasso.objects.filter(hotel__in=hotels), date_from, date_to)
+
+    # итог — тот же фильтр, что у строк листа «Расходы» (только source=incasso,
+    # без INCASSO_Q дашборда, который убирает и статью «Инкассация»)
+    exp_total = (
+        rollup_qs(hotels=hotels, date_from=date_from, date_to=date_to)
+        .filter(kind=DDSArticle.EXPENSE)
+        .exclude(source_group=DDSDailyRollup.SRC_INCASSO)
+        .aggregate(s=Coalesce(Sum("total"), Decimal("0.00")))["s"]
+    )
+    inc_total = incassos.aggregate(s=Coalesce(Sum("amount"), Decimal("0.00")))["s"]
+
+    wb = Workbook(write_only=True)
+
+    ws1 = _sheet(wb, "Итоги")
+    _summary_row(ws1, "Период", f"{date_from or '—'} → {date_to or '—'}")
+    _summary_row(ws1, "Фильтр отеля", hotel_label)
+    ws1.append([])
+    _summary_row(ws1, "Расходы (без инкассации)", float(exp_total))
+    _summary_row(ws1, "Инкассации", float(inc_total))
+
+    ws2 = _sheet(wb, "Расходы", header=["Дата", "Отель", "Статья", "Способ", "Сумма", "Контрагент", "Комментарий"])
+    rows = expenses.order_by("happened_at", "id").values_list(
+        "happened_at", "hotel__name", "article__name", "method", "amount", "counterparty", "comment",
+    )
+    for happened_at, hotel_name, article, method, amount, counterparty, comment in rows.iterator(chunk_size=CHUNK_SIZE):
+        ws2.append([
+            _fmt_dt(happened_at),
+            hotel_name,
+            article,
+            OP_METHOD_LABELS.get(method, method),
+            float(amount),
+            counterparty or "",
+            (comment or "")[:500],
+        ])
+
+    ws3 = _sheet(wb, "Инкассации", header=["Дата", "Отель", "Способ", "Сумма", "Комментарий", "Создал"])
+    rows = incassos.order_by("happened_at", "id").values_list(
+        "happened_at", "hotel__name", "method", "amount", "comment", "created_by__username",
+    )
+    for happened_at, hotel_name, method, amount, comment, username in rows.iterator(chunk_size=CHUNK_SIZE):
+        ws3.append([
+            _fmt_dt(happened_at),
+            hotel_name,
+            INCASSO_METHOD_LABELS.get(method, method),
+            float(amount),
+            (comment or "")[:500],
+            username or "",
+        ])
+
+    wb.save(fh)
@@ -2,12 +2,12 @@ from django import forms
 from .models import DDSOperation, DDSArticle,Hotel
 from .models import CashTransfer 
 from django.core.exceptions import ValidationError
-from django.db.models import Q
 
+from .catalog import CatalogArticleFormMixin, catalog_field, get_catalog
 
 
 
-class DDSOperationForm(forms.ModelForm):
+class DDSOperationForm(CatalogArticleFormMixin, forms.ModelForm):
     class Meta:
         model = DDSOperation
         fields = ["hotel", "article", "amount", "happened_at", "method", "counterparty", "source", "comment"]
@@ -31,24 +31,18 @@ class DDSOperationForm(forms.ModelForm):
                 except Hotel.DoesNotExist:
                     selected_hotel = None
 
-        # 2) Базовый queryset статей
-        qs = DDSArticle.objects.filter(is_active=True)
-
-        if kind in (DDSArticle.INCOME, DDSArticle.EXPENSE):
-            qs = qs.filter(kind=kind)
-
+        # 2) Статьи — из каталога (dds.catalog), без запросов
         # 3) ✅ ГЛАВНОЕ: фильтр по отелю
         # показываем:
         # - статьи привязанные к выбранному отелю
         # - ИЛИ “общие” статьи (у которых hotels пустой)
-        if selected_hotel:
-            qs = qs.filter(Q(hotels=selected_hotel) | Q(hotels__isnull=True)).distinct()
-        else:
-            # если отель не выбран — можно показывать только общие
-            # (чтобы не было “всё подряд”)
-            qs = qs.filter(hotels__isnull=True).distinct()
-
-        self.fields["article"].queryset = qs
+        # если отель не выбран — только общие (чтобы не было “всё подряд”)
+        articles = get_catalog().articles_for(
+            kind=kind if kind in (DDSArticle.INCOME, DDSArticle.EXPENSE) else None,
+            hotel_id=selected_hotel.pk if selected_hotel else None,
+            order=("kind", "category_id", "name"),
+        )
+        self.fields["article"] = catalog_field(self.fields["article"], articles)
         self._filter_hotel = selected_hotel
 
     def clean_article(self):
@@ -61,7 +55,7 @@ class DDSOperationForm(forms.ModelForm):
             raise ValidationError("Сначала выберите отель.")
 
         # ✅ если у статьи есть ограничения по отелям — проверяем
-        if article.hotels.exists() and not article.hotels.filter(pk=hotel.pk).exists():
+        if not get_catalog().is_available(article.pk, hotel.pk):
             raise ValidationError("Эта статья не доступна для выбранного отеля.")
 
         return article
@@ -173,7 +167,7 @@ class CashTransferForm(forms.ModelForm):
 from django import forms
 from .models import DDSOperation, DDSCategory, DDSArticle
 
-class DDSQuickOpForm(forms.ModelForm):
+class DDSQuickOpForm(CatalogArticleFormMixin, forms.ModelForm):
     category = forms.ModelChoiceField(
         queryset=DDSCategory.objects.none(),
         required=False,
@@ -191,23 +185,23 @@ class DDSQuickOpForm(forms.ModelForm):
     def __init__(self, *args, kind: str, hotel=None, category_id=None, **kwargs):
         super().__init__(*args, **kwargs)
 
+        catalog = get_catalog()
+
         # категории только нужного вида (доход/расход)
-        self.fields["category"].queryset = DDSCategory.objects.filter(is_active=True, kind=kind).order_by("parent_id", "name")
+        self.fields["category"] = catalog_field(self.fields["category"], catalog.categories_for(kind))
 
         # статьи только нужного вида и (по умолчанию) активные
-        qs = DDSArticle.objects.filter(is_active=True, kind=kind)
-
         # если выбрали категорию — сужаем статьи
+        category_ids = None
         if category_id:
             try:
-                cat_id = int(category_id)
                 # категория + её дети (2 уровня достаточно для MVP)
-                qs = qs.filter(category_id=cat_id) | qs.filter(category__parent_id=cat_id)
+                category_ids = catalog.children_ids(int(category_id))
             except Exception:
                 pass
 
-        self.fields["article"].queryset = qs.select_related("category").order_by("category_id", "name")
-        self.fields["article"].label = "Статья"
+        articles = catalog.articles_for(kind=kind, any_hotel=True, category_ids=category_ids, order=("category_id", "name"))
+        self.fields["article"] = catalog_field(self.fields["article"], articles, label="Статья")
 
         # чуть удобнее отображение
         self.fields["amount"].widget.attrs.update({"placeholder": "0.00"})
@@ -218,7 +212,7 @@ from django import forms
 from django.db.models import Q
 from .models import DDSOperation, DDSCategory, DDSArticle
 
-class DDSOpForm(forms.ModelForm):
+class DDSOpForm(CatalogArticleFormMixin, forms.ModelForm):
     category = forms.ModelChoiceField(
         queryset=DDSCategory.objects.none(),
         required=False,
@@ -238,25 +232,22 @@ class DDSOpForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         self.kind = kind
 
+        catalog = get_catalog()
+
         # Категории только нужного вида (доход/расход)
-        self.fields["category"].queryset = (
-            DDSCategory.objects.filter(is_active=True, kind=kind)
-            .order_by("parent_id", "name")
-        )
+        self.fields["category"] = catalog_field(self.fields["category"], catalog.categories_for(kind))
 
         # Статьи только нужного вида
-        articles = DDSArticle.objects.filter(is_active=True, kind=kind)
-
         # ✅ Строго: только статьи выбранной категории
+        category_ids = None
         if category_id:
             try:
-                cid = int(category_id)
-                articles = articles.filter(category_id=cid)
+                category_ids = {int(category_id)}
             except Exception:
                 pass
 
-        self.fields["article"].queryset = articles.select_related("category").order_by("name")
-        self.fields["article"].label = "Статья"
+        articles = catalog.articles_for(kind=kind, any_hotel=True, category_ids=category_ids)
+        self.fields["article"] = catalog_field(self.fields["article"], articles, label="Статья")
 
     def clean(self):
         cleaned = super().clean()
@@ -277,13 +268,12 @@ from .models import DDSOperation, DDSCategory, DDSArticle
 
 from django import forms
 from django.core.exceptions import ValidationError
-from django.db.models import Q
 
 from .models import DDSOperation, DDSArticle, DDSCategory
 
 
-class DDSOpCreateForm(forms.ModelForm):
-    # поле категории нужно только для queryset в шаблоне (ты его так используешь)
+class DDSOpCreateForm(CatalogArticleFormMixin, forms.ModelForm):
+    # поле категории нужно только для списка в шаблоне (fields.category.objects)
     category = forms.ModelChoiceField(
         queryset=DDSCategory.objects.none(),
         required=False,
@@ -298,13 +288,12 @@ class DDSOpCreateForm(forms.ModelForm):
     def __init__(self, *args, kind=None, category_id=None, hotel=None, **kwargs):
         super().__init__(*args, **kwargs)
 
-        # --- Категории для выпадающего списка (в GET форме) ---
-        cats = DDSCategory.objects.filter(is_active=True)
-
-        if kind in (DDSArticle.INCOME, DDSArticle.EXPENSE):
-            cats = cats.filter(kind=kind)
+        catalog = get_catalog()
+        if kind not in (DDSArticle.INCOME, DDSArticle.EXPENSE):
+            kind = None
 
-        self.fields["category"].queryset = cats.select_related("parent").order_by("parent_id", "name")
+        # --- Категории для выпадающего списка (в GET форме) ---
+        self.fields["category"] = catalog_field(self.fields["category"], catalog.categories_for(kind))
 
         # чтобы выбранная категория подсвечивалась
         if category_id:
@@ -314,27 +303,20 @@ class DDSOpCreateForm(forms.ModelForm):
                 pass
 
         # --- Статьи (главная часть) ---
-        qs = DDSArticle.objects.filter(is_active=True)
-
         # 1) по виду (доход/расход)
-        if kind in (DDSArticle.INCOME, DDSArticle.EXPENSE):
-            qs = qs.filter(kind=kind)
-
         # 2) если категория не выбрана — НЕ показываем ничего
+        # 3) ✅ фильтр по отелю: (hotels пустой) ИЛИ (hotels содержит этот отель);
+        #    если отель не передали — показываем только “общие”
+        articles = []
         if category_id:
-            qs = qs.filter(category_id=category_id)
-        else:
-            qs = qs.none()
-
-        # 3) ✅ фильтр по отелю:
-        # (hotels пустой) ИЛИ (hotels содержит этот отель)
-        if hotel:
-            qs = qs.filter(Q(hotels=hotel) | Q(hotels__isnull=True)).distinct()
-        else:
-            # если отель не передали — показываем только “общие”
-            qs = qs.filter(hotels__isnull=True).distinct()
-
-        self.fields["article"].queryset = qs.select_related("category", "category__parent").order_by("name")
+            try:
+                articles = catalog.articles_for(
+                    kind=kind, hotel_id=hotel.pk if hotel else None, category_ids={int(category_id)},
+                )
+            except (TypeError, ValueError):
+                pass
+
+        self.fields["article"] = catalog_field(self.fields["article"], articles)
         self._hotel = hotel
 
     def clean_article(self):
@@ -343,7 +325,7 @@ class DDSOpCreateForm(forms.ModelForm):
             return article
 
         # ✅ защита: если статья ограничена отелями — проверяем доступ
-        if self._hotel and article.hotels.exists() and not article.hotels.filter(pk=self._hotel.pk).exists():
+        if self._hotel and not get_catalog().is_available(article.pk, self._hotel.pk):
             raise ValidationError("Эта статья не доступна для выбранного отеля.")
 
         return article
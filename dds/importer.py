@@ -0,0 +1,314 @@
+# dds/importer.py
+"""
+Импорт истории операций ДДС из CSV/XLSX (заведение нового отеля).
+
+Файл читается потоково (CSV построчно, XLSX — openpyxl read-only) пачками
+по chunk_size строк. Отели, статьи и способы оплаты ищутся по словарям,
+собранным один раз до чтения файла, — на строку ни одного запроса.
+Каждая пачка пишется в своей транзакции: bulk_create операций, движения
+денег через dds.cash_services.post_cash_movements (одна блокировка кассы
+на отель), свод — dds.rollup.apply_bulk. Строки с ошибками не пишутся,
+а уходят в CSV-отчёт (номер строки, ошибка, исходные значения).
+
+Колонки (регистр не важен, подходят и заголовки листа «Операции» выгрузки):
+  Дата, Отель, Тип, Категория, Статья, Способ, Сумма, Контрагент, Источник, Комментарий
+Отель можно не указывать, если он задан для всего файла (hotel=...).
+"""
+import csv
+import io
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itertools import chain
+
+from django.db import transaction
+from django.utils import timezone
+from openpyxl import load_workbook
+
+from .cache import bump_hotel_version
+from .cash_services import post_cash_movements
+from .models import CashMovement, DDSArticle, DDSOperation, Hotel
+from .rollup import apply_bulk, snapshot
+
+CHUNK_SIZE = 2000
+
+# колонка -> варианты заголовка
+COLUMNS = {
+    "date": ("дата", "date", "happened_at"),
+    "hotel": ("отель", "hotel"),
+    "kind": ("тип", "вид", "kind"),
+    "category": ("категория", "category"),
+    "article": ("статья", "article"),
+    "method": ("способ", "способ оплаты", "счет", "счёт", "method"),
+    "amount": ("сумма", "amount"),
+    "counterparty": ("контрагент", "поставщик/гость/компания", "counterparty"),
+    "source": ("источник", "source"),
+    "comment": ("комментарий", "комментарии", "comment"),
+}
+REQUIRED = ("date", "article", "amount")
+
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d",
+    "%d.%m.%Y %H:%M:%S",
+    "%d.%m.%Y %H:%M",
+    "%d.%m.%Y",
+)
+
+
+class ImportRowError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------
+# Чтение файла
+# ---------------------------------------------------------------
+
+def _norm(value) -> str:
+    return str(value or "").strip().lower()
+
+
+def _header_map(header) -> dict:
+    """{колонка: индекс} по строке заголовка."""
+    aliases = {alias: col for col, names in COLUMNS.items() for alias in names}
+    found = {}
+    for i, title in enumerate(header):
+        col = aliases.get(_norm(title))
+        if col and col not in found:
+            found[col] = i
+    return found
+
+
+def _raw_rows(fh, filename: str):
+    """Строки файла как списки значений (первая — заголовок)."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        wb = load_workbook(fh, read_only=True, data_only=True)
+        try:
+            yield from wb.worksheets[0].iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+
+    text = io.TextIOWrapper(fh, encoding="utf-8-sig", newline="")
+    try:
+        first = text.readline()
+        delimiter = ";" if first.count(";") > first.count(",") else ","
+        yield from csv.reader(chain([first], text), delimiter=delimiter)
+    finally:
+        text.detach()
+
+
+def read_rows(fh, filename: str):
+    """(номер строки, {колонка: значение}) — пустые строки пропускаем."""
+    rows = _raw_rows(fh, filename)
+    header = next(rows, None)
+    if header is None:
+        raise ImportRowError("Файл пустой.")
+    cols = _header_map(header)
+    missing = [c for c in REQUIRED if c not in cols]
+    if missing:
+        raise ImportRowError("Нет колонок: " + ", ".join(COLUMNS[c][0] for c in missing))
+
+    for line_no, values in enumerate(rows, start=2):
+        if not values or all(v in (None, "") for v in values):
+            continue
+        yield line_no, {c: (values[i] if i < len(values) else None) for c, i in cols.items()}
+
+
+# ---------------------------------------------------------------
+# Справочники
+# ---------------------------------------------------------------
+
+class Lookups:
+    """Отели, статьи и способы оплаты в памяти — строки разбираются без запросов."""
+
+    def __init__(self):
+        self.hotels = {}
+        for h in Hotel.objects.only("id", "name"):
+            self.hotels[str(h.id)] = h
+            self.hotels.setdefault(_norm(h.name), h)
+
+        # (вид, имя статьи) -> [статьи]; ограничения статей по отелям.
+        # Неактивные тоже: в истории встречаются статьи, которые потом выключили
+        self.articles = {}
+        self.article_hotels = {}
+        arts = DDSArticle.objects.select_related("category", "category__parent")
+        for a in arts:
+            self.articles.setdefault((a.kind, _norm(a.name)), []).append(a)
+        for article_id, hotel_id in DDSArticle.hotels.through.objects.values_list("ddsarticle_id", "hotel_id"):
+            self.article_hotels.setdefault(article_id, set()).add(hotel_id)
+
+        self.kinds = {}
+        for code, label in DDSArticle.KIND_CHOICES:
+            self.kinds[code] = self.kinds[_norm(label)] = code
+        self.methods = {}
+        for code, label in DDSOperation.METHOD_CHOICES:
+            self.methods[code] = self.methods[_norm(label)] = code
+
+    def hotel(self, value, default=None):
+        if value in (None, ""):
+            if default is None:
+                raise ImportRowError("Не указан отель.")
+            return default
+        key = str(int(value)) if isinstance(value, (int, float)) else _norm(value)
+        hotel = self.hotels.get(key)
+        if hotel is None:
+            raise ImportRowError(f"Отель не найден: {value}")
+        return hotel
+
+    def article(self, *, hotel, name, kind=None, category=None):
+        title, name = str(name or "").strip(), _norm(name)
+        if kind not in (None, ""):
+            code = self.kinds.get(_norm(kind))
+            if not code:
+                raise ImportRowError(f"Неизвестный тип: {kind}")
+            candidates = list(self.articles.get((code, name), []))
+        else:
+            candidates = self.articles.get((DDSArticle.INCOME, name), []) + self.articles.get((DDSArticle.EXPENSE, name), [])
+
+        # статья должна быть доступна в отеле
+        candidates = [a for a in candidates if hotel.id in self.article_hotels.get(a.id, {hotel.id})]
+        if category not in (None, "") and len(candidates) > 1:
+            cat = _norm(category)
+            candidates = [
+                a for a in candidates
+                if a.category and cat in (_norm(a.category.name), _norm(a.category.parent and a.category.parent.name))
+            ]
+
+        if len(candidates) > 1:
+            # старая выключенная статья с тем же именем не должна мешать действующей
+            candidates = [a for a in candidates if a.is_active] or candidates
+        if not candidates:
+            raise ImportRowError(f"Статья не найдена: {title}")
+        if len(candidates) > 1:
+            raise ImportRowError(f"Статья неоднозначна (укажите тип/категорию): {title}")
+        return candidates[0]
+
+    def method(self, value):
+        if value in (None, ""):
+            return DDSOperation.CASH
+        code = self.methods.get(_norm(value))
+        if not code:
+            raise ImportRowError(f"Неизвестный способ оплаты: {value}")
+        return code
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, date):
+        dt = datetime.combine(value, datetime.min.time())
+    else:
+        text = str(value or "").strip()
+        for fmt in DATE_FORMATS:
+            try:
+                dt = datetime.strptime(text, fmt)
+                break
+            except ValueError:
+                continue
+        else:
+            raise ImportRowError(f"Некорректная дата: {value}")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def _parse_amount(value) -> Decimal:
+    text = str(value if value is not None else "").replace("\xa0", "").replace(" ", "").replace(",", ".")
+    try:
+        amount = Decimal(text).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ImportRowError(f"Некорректная сумма: {value}")
+    if amount <= 0:
+        raise ImportRowError("Сумма должна быть больше 0.")
+    return amount
+
+
+def build_operation(row: dict, lookups: Lookups, *, user, hotel=None) -> DDSOperation:
+    op_hotel = lookups.hotel(row.get("hotel"), default=hotel)
+    return DDSOperation(
+        hotel=op_hotel,
+        article=lookups.article(
+            hotel=op_hotel, name=row.get("article"), kind=row.get("kind"), category=row.get("category"),
+        ),
+        amount=_parse_amount(row.get("amount")),
+        happened_at=_parse_date(row.get("date")),
+        method=lookups.method(row.get("method")),
+        counterparty=str(row.get("counterparty") or "").strip()[:180],
+        source=str(row.get("source") or "").strip()[:120],
+        comment=str(row.get("comment") or "").strip(),
+        created_by=user,
+    )
+
+
+# ---------------------------------------------------------------
+# Запись
+# ---------------------------------------------------------------
+
+@transaction.atomic
+def write_operations(ops, user) -> int:
+    """
+    Записать пачку несохранённых DDSOperation (hotel и article — объектами):
+    операции, движения кассы без проверки остатка и свод. Пишет и бенчмарк.
+    """
+    ops = DDSOperation.objects.bulk_create(ops)
+
+    # движения денег — как в dds_op_add: инкассация кассу здесь не трогает
+    by_hotel = {}
+    for op in ops:
+        if (op.source or "").lower() == "incasso":
+            continue
+        by_hotel.setdefault(op.hotel_id, (op.hotel, []))[1].append({
+            "account": op.method,
+            "direction": CashMovement.IN if op.article.kind == DDSArticle.INCOME else CashMovement.OUT,
+            "amount": op.amount,
+            "happened_at": op.happened_at,
+            "comment": op.comment,
+            "dds_operation": op,
+        })
+    for hotel, movements in by_hotel.values():
+        # история приходит в любом порядке — остаток не проверяем, журнал сойдётся в сумме
+        post_cash_movements(hotel=hotel, movements=movements, created_by=user, check_funds=False)
+
+    apply_bulk(snapshot(op) for op in ops)
+    # bulk_create без сигналов, а post_cash_movements не видит инкассацию — версию поднимаем сами
+    for hotel_id in {op.hotel_id for op in ops}:
+        bump_hotel_version(hotel_id)
+    return len(ops)
+
+
+def import_operations(fh, filename: str, *, user, hotel=None, report=None, chunk_size=CHUNK_SIZE, dry_run=False) -> dict:
+    """
+    Импорт файла. report — текстовый файл для CSV-отчёта об ошибках (или None).
+    dry_run — только проверить строки, ничего не записывая.
+    Возвращает {"rows", "imported", "errors"}.
+    """
+    lookups = Lookups()
+    writer = None
+    if report is not None:
+        writer = csv.writer(report)
+        writer.writerow(["Строка", "Ошибка", *(names[0].capitalize() for names in COLUMNS.values())])
+
+    stats = {"rows": 0, "imported": 0, "errors": 0}
+    buf = []
+
+    def flush():
+        if buf and not dry_run:
+            stats["imported"] += write_operations(buf, user)
+        elif buf:
+            stats["imported"] += len(buf)
+        buf.clear()
+
+    for line_no, row in read_rows(fh, filename):
+        stats["rows"] += 1
+        try:
+            buf.append(build_operation(row, lookups, user=user, hotel=hotel))
+        except ImportRowError as e:
+            stats["errors"] += 1
+            if writer:
+                writer.writerow([line_no, str(e), *(row.get(col, "") for col in COLUMNS)])
+            continue
+        if len(buf) >= chunk_size:
+            flush()
+    flush()
+    return stats
@@ -0,0 +1,217 @@
+# dds/ledger.py
+"""
+Журнал движения денег (CashMovement) как источник истины для остатков.
+
+- CashRegister.*_balance — текущий остаток (быстрое чтение), меняется только
+  через dds.cash_services.post_cash_movements (apply_cash_movement — пакет
+  из одного движения) вместе с записью движения;
+- CashBalanceSnapshot — остатки на конец закрытых дней, строятся из журнала
+  (build_snapshots) и позволяют восстановить остаток на любой момент;
+- verify_ledger сверяет и то и другое с журналом (команда verify_cash_ledger).
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Max, Q, Sum, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import CashBalanceSnapshot, CashMovement, CashRegister
+
+ZERO = Decimal("0.00")
+
+ACCOUNTS = [acc for acc, _ in CashMovement.ACCOUNT_CHOICES]
+
+REGISTER_FIELD = {
+    CashMovement.ACC_CASH: "cash_balance",
+    CashMovement.ACC_MKASSA: "mkassa_balance",
+    CashMovement.ACC_ZADATOK: "zadatok_balance",
+    CashMovement.ACC_OPTIMA: "optima_balance",
+}
+
+
+def signed_amount_expr():
+    """+amount для прихода, -amount для расхода — выражением БД."""
+    return Case(
+        When(direction=CashMovement.IN, then=F("amount")),
+        default=-F("amount"),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def local_day(dt):
+    return timezone.localtime(dt).date()
+
+
+# ---------------------------------------------------------------
+# Снимки остатков
+# ---------------------------------------------------------------
+
+def invalidate_snapshots(hotel_id, account: str, since_day):
+    """Движение в уже закрытый день: снимки с этого дня больше не верны."""
+    CashBalanceSnapshot.objects.filter(hotel_id=hotel_id, account=account, day__gte=since_day).delete()
+
+
+def build_snapshots(*, hotel_ids=None, until_day=None, batch: int = 2000) -> int:
+    """
+    Достроить снимки до until_day включительно (по умолчанию — вчера).
+    Продолжаем с последнего снимка каждого (отель, счёт): одним GROUP BY
+    по дням движений после него, дальше накопительная сумма в Python.
+    Возвращает число новых строк.
+    """
+    tz = timezone.get_current_timezone()
+    until_day = until_day or (timezone.localdate() - timedelta(days=1))
+
+    snaps = CashBalanceSnapshot.objects.all()
+    moves = CashMovement.objects.all()
+    if hotel_ids:
+        snaps = snaps.filter(hotel_id__in=hotel_ids)
+        moves = moves.filter(hotel_id__in=hotel_ids)
+
+    # последний снимок по каждому (отель, счёт) и его остаток
+    last_day = {
+        (r["hotel_id"], r["account"]): r["last"]
+        for r in snaps.values("hotel_id", "account").annotate(last=Max("day"))
+    }
+    last_balance = {}
+    if last_day:
+        for s in snaps.filter(day__in=set(last_day.values())).values("hotel_id", "account", "day", "balance"):
+            if last_day.get((s["hotel_id"], s["account"])) == s["day"]:
+                last_balance[(s["hotel_id"], s["account"])] = s["balance"]
+
+    rows = (
+        moves.annotate(day=TruncDate("happened_at", tzinfo=tz))
+        .filter(day__lte=until_day)
+        .values("hotel_id", "account", "day")
+        .annotate(delta=Sum(signed_amount_expr()))
+        .order_by("hotel_id", "account", "day")
+    )
+    if last_day:
+        # по счетам со снимками — только дни после последнего снимка, остальные целиком
+        after_last, has_snaps = Q(), Q()
+        for (hotel_id, account), day in last_day.items():
+            after_last |= Q(hotel_id=hotel_id, account=account, day__gt=day)
+            has_snaps |= Q(hotel_id=hotel_id, account=account)
+        rows = rows.filter(after_last | ~has_snaps)
+
+    running = defaultdict(lambda: ZERO)
+    running.update(last_balance)
+
+    created = 0
+    buf = []
+    with transaction.atomic():
+        for r in rows.iterator(chunk_size=batch):
+            key = (r["hotel_id"], r["account"])
+            running[key] += r["delta"] or ZERO
+            buf.append(CashBalanceSnapshot(
+                hotel_id=r["hotel_id"], account=r["account"], day=r["day"], balance=running[key],
+            ))
+            if len(buf) >= batch:
+                CashBalanceSnapshot.objects.bulk_create(buf)
+                created += len(buf)
+                buf = []
+        if buf:
+            CashBalanceSnapshot.objects.bulk_create(buf)
+            created += len(buf)
+    return created
+
+
+# ---------------------------------------------------------------
+# Сверка
+# ---------------------------------------------------------------
+
+def ledger_balances(hotel_ids=None) -> dict:
+    """{(hotel_id, account): остаток по журналу} — одним GROUP BY."""
+    moves = CashMovement.objects.all()
+    if hotel_ids:
+        moves = moves.filter(hotel_id__in=hotel_ids)
+    return {
+        (r["hotel_id"], r["account"]): ZERO + (r["s"] or ZERO)
+        for r in moves.values("hotel_id", "account").annotate(s=Sum(signed_amount_expr())).order_by()
+    }
+
+
+def verify_ledger(hotel_ids=None) -> list:
+    """
+    Расхождения:
+      {"type": "register", hotel_id, account, stored, expected}
+      {"type": "snapshot", hotel_id, account, day, stored, expected}
+    """
+    tz = timezone.get_current_timezone()
+    problems = []
+
+    # 1) текущие остатки кассы vs журнал
+    expected = ledger_balances(hotel_ids)
+    regs = CashRegister.objects.all()
+    if hotel_ids:
+        regs = regs.filter(hotel_id__in=hotel_ids)
+    for reg in regs:
+        for acc in ACCOUNTS:
+            stored = getattr(reg, REGISTER_FIELD[acc]) or ZERO
+            exp = expected.get((reg.hotel_id, acc), ZERO)
+            if stored != exp:
+                problems.append({
+                    "type": "register", "hotel_id": reg.hotel_id, "account": acc,
+                    "stored": stored, "expected": exp,
+                })
+
+    # 2) снимки vs накопительная сумма журнала по дням
+    snaps = CashBalanceSnapshot.objects.all()
+    moves = CashMovement.objects.all()
+    if hotel_ids:
+        snaps = snaps.filter(hotel_id__in=hotel_ids)
+        moves = moves.filter(hotel_id__in=hotel_ids)
+
+    stored_snaps = defaultdict(dict)
+    for s in snaps.values("hotel_id", "account", "day", "balance"):
+        stored_snaps[(s["hotel_id"], s["account"])][s["day"]] = s["balance"]
+    if not stored_snaps:
+        return problems
+
+    daily = defaultdict(list)
+    rows = (
+        moves.annotate(day=TruncDate("happened_at", tzinfo=tz))
+        .values("hotel_id", "account", "day")
+        .annotate(delta=Sum(signed_amount_expr()))
+        .order_by("hotel_id", "account", "day")
+    )
+    for r in rows.iterator():
+        daily[(r["hotel_id"], r["account"])].append((r["day"], r["delta"] or ZERO))
+
+    for key, by_day in stored_snaps.items():
+        running, i = ZERO, 0
+        days = daily.get(key, [])
+        for day in sorted(by_day):
+            while i < len(days) and days[i][0] <= day:
+                running += days[i][1]
+                i += 1
+            if by_day[day] != running:
+                problems.append({
+                    "type": "snapshot", "hotel_id": key[0], "account": key[1], "day": day,
+                    "stored": by_day[day], "expected": running,
+                })
+    return problems
+
+
+@transaction.atomic
+def repair_registers(hotel_ids=None) -> int:
+    """Выставить остатки кассы по журналу. Возвращает число исправленных касс."""
+    expected = ledger_balances(hotel_ids)
+    regs = CashRegister.objects.select_for_update()
+    if hotel_ids:
+        regs = regs.filter(hotel_id__in=hotel_ids)
+    fixed = 0
+    for reg in regs:
+        changed = []
+        for acc in ACCOUNTS:
+            field = REGISTER_FIELD[acc]
+            exp = expected.get((reg.hotel_id, acc), ZERO)
+            if (getattr(reg, field) or ZERO) != exp:
+                setattr(reg, field, exp)
+                changed.append(field)
+        if changed:
+            reg.save(update_fields=changed + ["updated_at"])
+            fixed += 1
+    return fixed
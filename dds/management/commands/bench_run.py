@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from config.bench import PREFIX, compare, dump, run, scenarios
+
+
+class Command(BaseCommand):
+    help = "Прогнать бенчмарк горячих страниц (время, SQL, память) и записать JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Повторов на сценарий")
+        parser.add_argument("--warm", action="store_true", help="Не чистить кэш между повторами")
+        parser.add_argument("--only", action="append", help="Только этот сценарий (можно несколько)")
+        parser.add_argument("--days", type=int, default=365, help="Период отчётов, дней назад от сегодня")
+        parser.add_argument("--prefix", default=PREFIX, help="Префикс отелей из bench_seed")
+        parser.add_argument("--output", help="Куда записать JSON (по умолчанию — в stdout)")
+        parser.add_argument("--compare", help="JSON прошлого прогона — показать изменения")
+
+    def handle(self, *args, **opts):
+        try:
+            names = scenarios(prefix=opts["prefix"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        unknown = set(opts["only"] or ()) - set(names)
+        if unknown:
+            raise CommandError("Нет сценариев: " + ", ".join(sorted(unknown)) + ". Есть: " + ", ".join(names))
+
+        result = run(
+            repeat=max(1, opts["repeat"]), warm=opts["warm"], only=opts["only"],
+            prefix=opts["prefix"], days=opts["days"], log=self.stderr.write,
+        )
+
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as fh:
+                dump(result, fh)
+            self.stderr.write(self.style.SUCCESS(f"Записано: {opts['output']}"))
+        else:
+            dump(result, self.stdout)
+            self.stdout.write("")
+
+        if opts["compare"]:
+            with open(opts["compare"], encoding="utf-8") as fh:
+                old = json.load(fh)
+            for name, metric, a, b, delta in compare(old, result):
+                mark = "" if delta is None else f" ({delta:+}%)"
+                self.stderr.write(f"{name:24} {metric:8} {a} -> {b}{mark}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from config.bench import PREFIX, bench_hotels, seed
+
+
+class Command(BaseCommand):
+    help = "Сгенерировать синтетическую сеть отелей для бенчмарка (на отдельной базе!)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hotels", type=int, default=3, help="Отелей")
+        parser.add_argument("--rooms", type=int, default=20, help="Номеров в отеле")
+        parser.add_argument("--years", type=int, default=2, help="Лет истории")
+        parser.add_argument("--companies", type=int, default=10, help="Компаний с фолио")
+        parser.add_argument("--expenses", type=int, default=4, help="Расходов в день на отель (в среднем)")
+        parser.add_argument("--seed", type=int, default=42, help="Зерно генератора — одинаковое даёт одинаковые данные")
+        parser.add_argument("--prefix", default=PREFIX, help="Префикс названий отелей и компаний")
+
+    def handle(self, *args, **opts):
+        if bench_hotels(opts["prefix"]).exists():
+            raise CommandError(f"Отели «{opts['prefix']} …» уже есть — возьмите другой --prefix или чистую базу.")
+
+        with transaction.atomic():
+            stats = seed(
+                hotels=opts["hotels"], rooms=opts["rooms"], years=opts["years"],
+                companies=opts["companies"], expenses_per_day=opts["expenses"],
+                seed=opts["seed"], prefix=opts["prefix"], log=self.stdout.write,
+            )
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{k}: {v}" for k, v in stats.items())))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from dds.ledger import build_snapshots
+
+
+class Command(BaseCommand):
+    help = "Достроить остатки счетов на конец дня (CashBalanceSnapshot) по журналу движений. Запускать раз в сутки."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hotel", type=int, action="append", help="ID отеля (можно несколько; по умолчанию — все)")
+        parser.add_argument("--until", help="Последний день YYYY-MM-DD (по умолчанию — вчера)")
+
+    def handle(self, *args, **opts):
+        until = parse_date(opts["until"]) if opts["until"] else None
+        created = build_snapshots(hotel_ids=opts["hotel"] or None, until_day=until)
+        self.stdout.write(self.style.SUCCESS(f"Новых снимков: {created}"))
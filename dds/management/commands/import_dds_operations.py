@@ -0,0 +1,52 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from dds.importer import CHUNK_SIZE, ImportRowError, import_operations
+from dds.models import Hotel
+
+
+class Command(BaseCommand):
+    help = "Импорт истории операций ДДС из CSV/XLSX (с движениями кассы и сводом)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл .csv или .xlsx")
+        parser.add_argument("--hotel", type=int, help="ID отеля для строк без колонки «Отель»")
+        parser.add_argument("--user", required=True, help="Логин, от имени которого создаются операции")
+        parser.add_argument("--report", help="Куда писать ошибки (по умолчанию <файл>.errors.csv)")
+        parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="Строк в одной транзакции")
+        parser.add_argument("--dry-run", action="store_true", help="Только проверить файл")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"Нет файла: {path}")
+
+        user = get_user_model().objects.filter(username=opts["user"]).first()
+        if user is None:
+            raise CommandError(f"Нет пользователя: {opts['user']}")
+
+        hotel = None
+        if opts["hotel"]:
+            hotel = Hotel.objects.filter(pk=opts["hotel"]).first()
+            if hotel is None:
+                raise CommandError(f"Нет отеля: {opts['hotel']}")
+
+        report_path = opts["report"] or f"{path}.errors.csv"
+        with open(path, "rb") as fh, open(report_path, "w", encoding="utf-8-sig", newline="") as report:
+            try:
+                stats = import_operations(
+                    fh, path,
+                    user=user, hotel=hotel, report=report,
+                    chunk_size=max(1, opts["chunk"]), dry_run=opts["dry_run"],
+                )
+            except ImportRowError as e:
+                raise CommandError(str(e))
+
+        done = "проверено" if opts["dry_run"] else "импортировано"
+        self.stdout.write(self.style.SUCCESS(f"Строк: {stats['rows']}, {done}: {stats['imported']}"))
+        if stats["errors"]:
+            self.stderr.write(f"Ошибок: {stats['errors']} — см. {report_path}")
+        else:
+            os.remove(report_path)
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dds.export_jobs import claim_job, pending_job_ids, purge_jobs, requeue_stale, run_job
+from dds.models import ExportJob
+
+
+def _work(job_id):
+    # у каждого потока своё соединение с БД — закрываем, чтобы не копились
+    close_old_connections()
+    try:
+        if not claim_job(job_id):
+            return None
+        return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых выгрузок Excel (ExportJob)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="Сколько выгрузок собирать параллельно")
+        parser.add_argument("--poll", type=float, default=2.0, help="Пауза между проверками очереди, сек")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и выйти")
+        parser.add_argument("--purge-days", type=int, default=7, help="Удалять задачи и файлы старше N дней (0 — не удалять)")
+
+    def handle(self, *args, **opts):
+        workers = max(1, opts["workers"])
+        purge_after = timedelta(days=opts["purge_days"]) if opts["purge_days"] else None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                requeue_stale()
+                if purge_after:
+                    purge_jobs(purge_after)
+
+                ids = pending_job_ids(workers)
+                for job in pool.map(_work, ids):
+                    if job is None:
+                        continue
+                    if job.status == ExportJob.DONE:
+                        self.stdout.write(self.style.SUCCESS(f"{job}: {job.file.name}"))
+                    else:
+                        self.stderr.write(f"{job}: {job.error}")
+
+                close_old_connections()
+                if opts["once"] and not ids:
+                    break
+                if not ids:
+                    time.sleep(opts["poll"])
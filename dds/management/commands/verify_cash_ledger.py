@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dds.ledger import repair_registers, verify_ledger
+from dds.models import CashBalanceSnapshot
+
+
+class Command(BaseCommand):
+    help = "Сверить остатки касс и снимки с журналом движений (CashMovement)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hotel", type=int, action="append", help="ID отеля (можно несколько; по умолчанию — все)")
+        parser.add_argument("--fix", action="store_true", help="Выставить остатки кассы по журналу, неверные снимки удалить")
+
+    def handle(self, *args, **opts):
+        hotel_ids = opts["hotel"] or None
+        problems = verify_ledger(hotel_ids)
+
+        for p in problems:
+            where = f"отель={p['hotel_id']} счёт={p['account']}"
+            if p["type"] == "snapshot":
+                where += f" день={p['day']}"
+            self.stdout.write(f"[{p['type']}] {where}: записано {p['stored']}, по журналу {p['expected']}")
+
+        if not problems:
+            self.stdout.write(self.style.SUCCESS("Расхождений нет."))
+            return
+
+        if opts["fix"]:
+            fixed = repair_registers(hotel_ids)
+            # снимок с ошибкой и все после него перестроит build_cash_snapshots
+            for p in problems:
+                if p["type"] == "snapshot":
+                    CashBalanceSnapshot.objects.filter(
+                        hotel_id=p["hotel_id"], account=p["account"], day__gte=p["day"]
+                    ).delete()
+            self.stdout.write(self.style.WARNING(f"Исправлено касс: {fixed}. Запустите build_cash_snapshots."))
+            return
+
+        raise CommandError(f"Найдено расхождений: {len(problems)}")
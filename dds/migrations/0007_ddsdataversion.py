@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 10:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0006_ddsarticle_hotels'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DDSDataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('hotel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='dds_version', to='dds.hotel', verbose_name='Отель')),
+            ],
+            options={
+                'verbose_name': 'Версия данных ДДС',
+                'verbose_name_plural': 'Версии данных ДДС',
+            },
+        ),
+    ]
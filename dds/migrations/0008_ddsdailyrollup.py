@@ -0,0 +1,74 @@
+# Generated by Django 6.0 on 2026-10-18 10:15
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Case, CharField, Count, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_rollup(apps, schema_editor):
+    DDSOperation = apps.get_model("dds", "DDSOperation")
+    DDSDailyRollup = apps.get_model("dds", "DDSDailyRollup")
+
+    tz = timezone.get_current_timezone()
+    sgroup = Case(
+        When(source__iexact="incasso", then=Value("incasso")),
+        When(source__icontains="room", then=Value("rooms")),
+        default=Value(""),
+        output_field=CharField(),
+    )
+    rows = (
+        DDSOperation.objects.filter(is_voided=False)
+        .annotate(day=TruncDate("happened_at", tzinfo=tz), sgroup=sgroup)
+        .values("hotel_id", "day", "article_id", "method", "article__kind", "sgroup")
+        .annotate(total=Sum("amount"), cnt=Count("id"))
+        .order_by()
+    )
+
+    buf = []
+    for r in rows.iterator(chunk_size=2000):
+        buf.append(DDSDailyRollup(
+            hotel_id=r["hotel_id"], day=r["day"], article_id=r["article_id"],
+            method=r["method"], kind=r["article__kind"], source_group=r["sgroup"],
+            total=r["total"] or Decimal("0.00"), ops_count=r["cnt"],
+        ))
+        if len(buf) >= 2000:
+            DDSDailyRollup.objects.bulk_create(buf)
+            buf = []
+    if buf:
+        DDSDailyRollup.objects.bulk_create(buf)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0007_ddsdataversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DDSDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('method', models.CharField(choices=[('cash', 'Наличные'), ('mkassa', 'Банк1'), ('zadatok', 'Задаток'), ('optima', 'Банк2')], max_length=12, verbose_name='способ оплаты')),
+                ('kind', models.CharField(choices=[('income', 'Доход'), ('expense', 'Расход')], max_length=10, verbose_name='вид')),
+                ('source_group', models.CharField(blank=True, choices=[('', 'Прочее'), ('incasso', 'Инкассация'), ('rooms', 'Номера')], default='', max_length=10, verbose_name='источник')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='сумма')),
+                ('ops_count', models.PositiveIntegerField(default=0, verbose_name='операций')),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='dds.ddsarticle', verbose_name='статья')),
+                ('hotel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='dds_rollups', to='dds.hotel', verbose_name='отель')),
+            ],
+            options={
+                'verbose_name': 'Свод ДДС за день',
+                'verbose_name_plural': 'Свод ДДС по дням',
+                'ordering': ['-day', 'hotel_id'],
+                'indexes': [models.Index(fields=['day', 'hotel'], name='dds_ddsdail_day_7acdab_idx')],
+                'constraints': [models.UniqueConstraint(fields=('hotel', 'day', 'article', 'method', 'kind', 'source_group'), name='uniq_dds_rollup_key')],
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
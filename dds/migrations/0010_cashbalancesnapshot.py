@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0009_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CashBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account', models.CharField(choices=[('cash', 'Наличные'), ('mkassa', 'Банк1'), ('zadatok', 'Задаток'), ('optima', 'Банк2')], max_length=10, verbose_name='счёт')),
+                ('day', models.DateField(verbose_name='день')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='остаток на конец дня')),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('hotel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cash_snapshots', to='dds.hotel', verbose_name='отель')),
+            ],
+            options={
+                'verbose_name': 'Остаток счёта на конец дня',
+                'verbose_name_plural': 'Остатки счетов по дням',
+                'ordering': ['-day', 'hotel_id', 'account'],
+                'constraints': [models.UniqueConstraint(fields=('hotel', 'account', 'day'), name='uniq_cash_snapshot_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0010_cashbalancesnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashmovement',
+            index=models.Index(fields=['hotel', 'account', 'happened_at'], name='cashmove_hotel_acc_at_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0 on 2026-10-18 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0011_cashmovement_hotel_account_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cashincasso',
+            index=models.Index(fields=['hotel', 'happened_at'], name='incasso_hotel_at_idx'),
+        ),
+    ]
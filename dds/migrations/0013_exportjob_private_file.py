@@ -0,0 +1,31 @@
+# Generated by Django 6.0 on 2026-10-18 11:07
+
+import dds.storage
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def drop_public_files(apps, schema_editor):
+    # старые выгрузки лежали в public_html/media с предсказуемыми именами — удаляем;
+    # задача без файла при следующем запросе соберётся заново (уже в закрытое хранилище)
+    ExportJob = apps.get_model("dds", "ExportJob")
+    for job_id, name in ExportJob.objects.exclude(file="").values_list("id", "file"):
+        if name and default_storage.exists(name):
+            default_storage.delete(name)
+        ExportJob.objects.filter(pk=job_id).update(file="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0012_cashincasso_hotel_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=dds.storage.private_storage, upload_to=dds.storage.export_upload_to, verbose_name='Файл'),
+        ),
+        migrations.RunPython(drop_public_files, migrations.RunPython.noop),
+    ]
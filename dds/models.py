@@ -9,6 +9,8 @@ from django.db import transaction
 from django.db.models import F
 from django.db import models
 
+from .storage import export_upload_to, private_storage
+
 
 class Hotel(models.Model):
     """
@@ -27,6 +29,22 @@ class Hotel(models.Model):
         return self.name
 
 
+class DDSDataVersion(models.Model):
+    """
+    Версия данных ДДС отеля: увеличивается при каждой записи
+    в DDSOperation/CashMovement. Участвует в ключе кэша отчётов (dds.cache).
+    """
+    hotel = models.OneToOneField(Hotel, on_delete=models.CASCADE, related_name="dds_version", verbose_name="Отель")
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Версия данных ДДС"
+        verbose_name_plural = "Версии данных ДДС"
+
+    def __str__(self):
+        return f"{self.hotel} v{self.version}"
+
+
 class DDSCategory(models.Model):
     INCOME = "income"
     EXPENSE = "expense"
@@ -174,6 +192,50 @@ class DDSOperation(models.Model):
         return f"{self.hotel} {self.article} {self.amount}"
 
 
+class DDSDailyRollup(models.Model):
+    """
+    Дневной свод ДДС: суммы и количество операций по
+    (отель, локальный день, статья, способ оплаты, вид, группа источника).
+    Ведётся сигналами DDSOperation (dds.rollup), пересобирается командой rebuild_dds_rollup.
+    Сторнированные операции в свод не входят.
+    """
+    SRC_OTHER = ""
+    SRC_INCASSO = "incasso"
+    SRC_ROOMS = "rooms"
+    SOURCE_GROUP_CHOICES = (
+        (SRC_OTHER, "Прочее"),
+        (SRC_INCASSO, "Инкассация"),
+        (SRC_ROOMS, "Номера"),
+    )
+
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name="dds_rollups", verbose_name="отель")
+    day = models.DateField(verbose_name="день")
+    article = models.ForeignKey(DDSArticle, on_delete=models.CASCADE, related_name="rollups", verbose_name="статья")
+    method = models.CharField(max_length=12, choices=DDSOperation.METHOD_CHOICES, verbose_name="способ оплаты")
+    kind = models.CharField(max_length=10, choices=DDSArticle.KIND_CHOICES, verbose_name="вид")
+    source_group = models.CharField(max_length=10, choices=SOURCE_GROUP_CHOICES, blank=True, default=SRC_OTHER, verbose_name="источник")
+
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="сумма")
+    ops_count = models.PositiveIntegerField(default=0, verbose_name="операций")
+
+    class Meta:
+        verbose_name = "Свод ДДС за день"
+        verbose_name_plural = "Свод ДДС по дням"
+        ordering = ["-day", "hotel_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hotel", "day", "article", "method", "kind", "source_group"],
+                name="uniq_dds_rollup_key",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["day", "hotel"]),
+        ]
+
+    def __str__(self):
+        return f"{self.hotel} {self.day} {self.article_id} {self.method} {self.total}"
+
+
 class CashIncasso(models.Model):
     CASH = "cash"
     MKASSA = "mkassa"
@@ -202,6 +264,10 @@ class CashIncasso(models.Model):
         verbose_name = "Инкассация"
         verbose_name_plural = "Инкассации"
         ordering = ["-happened_at", "-id"]
+        indexes = [
+            # список бухгалтерии листается по (happened_at, id) внутри отелей (dds.pagination)
+            models.Index(fields=["hotel", "happened_at"], name="incasso_hotel_at_idx"),
+        ]
 
     def __str__(self):
         return f"Инкассация {self.hotel} {self.amount}"
@@ -303,6 +369,10 @@ class CashMovement(models.Model):
         verbose_name = "Движение денег"
         verbose_name_plural = "Движения денег"
         ordering = ["-happened_at", "-id"]
+        indexes = [
+            # остаток на момент: движения счёта после снимка (dds.cash_services.balances_as_of)
+            models.Index(fields=["hotel", "account", "happened_at"], name="cashmove_hotel_acc_at_idx"),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=["dds_operation", "account", "direction"],
@@ -312,6 +382,33 @@ class CashMovement(models.Model):
         ]
 
 
+
+class CashBalanceSnapshot(models.Model):
+    """
+    Остаток счёта на конец локального дня (после всех движений этого дня).
+    Строка пишется только за дни, в которые были движения; за прочие дни
+    остаток равен последнему снимку до них. Снимки строятся командой
+    build_cash_snapshots (dds.ledger) и сбрасываются, если задним числом
+    пришло движение в уже закрытый день.
+    """
+    hotel = models.ForeignKey(Hotel, on_delete=models.CASCADE, related_name="cash_snapshots", verbose_name="отель")
+    account = models.CharField(max_length=10, choices=CashMovement.ACCOUNT_CHOICES, verbose_name="счёт")
+    day = models.DateField(verbose_name="день")
+    balance = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="остаток на конец дня")
+    created_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Остаток счёта на конец дня"
+        verbose_name_plural = "Остатки счетов по дням"
+        ordering = ["-day", "hotel_id", "account"]
+        constraints = [
+            models.UniqueConstraint(fields=["hotel", "account", "day"], name="uniq_cash_snapshot_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.hotel} {self.account} {self.day}: {self.balance}"
+
+
 # dds/models.py (или где у тебя CashRegister/CashMovement)
 
 from django.db import models
@@ -356,4 +453,58 @@ class CashTransfer(models.Model):
         
         
         
-        return f"{self.hotel} {self.from_account}->{self.to_account} {self.amount}"
\ No newline at end of file
+        return f"{self.hotel} {self.from_account}->{self.to_account} {self.amount}"
+
+class ExportJob(models.Model):
+    """
+    Фоновая выгрузка в Excel. Создаётся вьюхой выгрузки, собирается воркером
+    (manage.py run_export_worker), скачивается через dds:export_download.
+    params_hash учитывает параметры и версии данных отелей (DDSDataVersion):
+    одинаковый запрос по неизменившимся данным получает уже готовый файл.
+    """
+    HOTEL_DETAIL = "hotel_detail"
+    UNIFIED_REPORT = "unified_report"
+    ACCOUNTING = "accounting"
+    KIND_CHOICES = (
+        (HOTEL_DETAIL, "Отчет по отелю"),
+        (UNIFIED_REPORT, "Единый отчет"),
+        (ACCOUNTING, "Бухгалтерия"),
+    )
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "В очереди"),
+        (RUNNING, "Формируется"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    )
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name="Выгрузка")
+    params = models.JSONField(default=dict, verbose_name="Параметры")
+    params_hash = models.CharField(max_length=40, db_index=True, verbose_name="Ключ")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+
+    # закрытое хранилище и случайное имя: файл отдаёт только export_download (dds.storage)
+    file = models.FileField(storage=private_storage, upload_to=export_upload_to, blank=True, verbose_name="Файл")
+    filename = models.CharField(max_length=120, blank=True, verbose_name="Имя файла")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name="dds_export_jobs", verbose_name="Создал"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Выгрузка Excel"
+        verbose_name_plural = "Выгрузки Excel"
+        ordering = ["-created_at", "-id"]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
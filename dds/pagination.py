@@ -0,0 +1,91 @@
+# dds/pagination.py
+"""
+Keyset-пагинация списков по (happened_at, id), новые сверху.
+
+Вместо OFFSET страница берётся условием «строго раньше последней строки
+предыдущей страницы» — это поиск по индексу (hotel, happened_at), поэтому
+страница 10 000 стоит столько же, сколько первая. Курсор — непрозрачная
+строка для GET-параметра: направление + happened_at + id.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+PAGE_SIZE = 100
+
+NEXT = "n"
+PREV = "p"
+
+
+def encode_cursor(direction: str, happened_at, pk) -> str:
+    raw = f"{direction}|{happened_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """(направление, happened_at, id) или None, если курсор битый/пустой."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        direction, at, pk = raw.split("|")
+        if direction not in (NEXT, PREV):
+            return None
+        return direction, datetime.fromisoformat(at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(qs, cursor: str = "", *, size: int = PAGE_SIZE) -> dict:
+    """
+    Страница qs (сортировка задаётся здесь) по курсору.
+    {"items", "next_cursor", "prev_cursor"} — пустой курсор значит «страницы нет».
+    Лишняя (size+1) строка показывает, есть ли продолжение, — без COUNT(*).
+    """
+    parsed = decode_cursor(cursor)
+
+    if parsed is None:
+        rows = list(qs.order_by("-happened_at", "-id")[: size + 1])
+        has_more, items = len(rows) > size, rows[:size]
+        has_next, has_prev = has_more, False
+    else:
+        direction, at, pk = parsed
+        if direction == NEXT:
+            rows = list(
+                qs.filter(Q(happened_at__lt=at) | Q(happened_at=at, id__lt=pk))
+                .order_by("-happened_at", "-id")[: size + 1]
+            )
+            has_more, items = len(rows) > size, rows[:size]
+            has_next, has_prev = has_more, True
+        else:
+            # назад — идём по возрастанию от курсора и переворачиваем
+            rows = list(
+                qs.filter(Q(happened_at__gt=at) | Q(happened_at=at, id__gt=pk))
+                .order_by("happened_at", "id")[: size + 1]
+            )
+            has_more, items = len(rows) > size, rows[:size][::-1]
+            has_next, has_prev = True, has_more
+
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(NEXT, items[-1].happened_at, items[-1].pk) if items and has_next else "",
+        "prev_cursor": encode_cursor(PREV, items[0].happened_at, items[0].pk) if items and has_prev else "",
+    }
+
+
+def paginate(request, qs, *, param: str = "cursor", size: int = PAGE_SIZE) -> dict:
+    """keyset_page по GET-параметру param + ссылки next_url/prev_url/first_url (остальные фильтры сохраняются)."""
+    page = keyset_page(qs, request.GET.get(param, ""), size=size)
+
+    def url(cursor):
+        params = request.GET.copy()
+        params.pop(param, None)
+        if cursor:
+            params[param] = cursor
+        return "?" + params.urlencode() if params else "?"
+
+    page["next_url"] = url(page["next_cursor"]) if page["next_cursor"] else ""
+    page["prev_url"] = url(page["prev_cursor"]) if page["prev_cursor"] else ""
+    page["first_url"] = url("") if request.GET.get(param) else ""
+    return page
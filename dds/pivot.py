@@ -0,0 +1,187 @@
+# dds/pivot.py
+"""
+Сводная таблица ДДС: вид × способ оплаты × категория × родитель категории.
+
+Один GROUP BY по дневному своду (DDSDailyRollup) с условными суммами
+(доход с номеров, инкассация) — из этого набора строк в Python собираются
+все итоги страницы: приход/расход, разбивка по счетам, группы категорий.
+Используется карточкой отеля, дашбордом и выгрузками.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import DDSArticle, DDSOperation
+from .rollup import INCASSO_Q, ROOMS_Q
+
+ZERO = Decimal("0.00")
+
+METHODS = [DDSOperation.CASH, DDSOperation.MKASSA, DDSOperation.ZADATOK, DDSOperation.OPTIMA]
+METHOD_LABELS = dict(DDSOperation.METHOD_CHOICES)
+
+
+class DDSPivot:
+    def __init__(self, rows):
+        self.rows = rows
+
+    @classmethod
+    def for_rollup(cls, rollup):
+        """rollup — уже отфильтрованный (отели, период) QuerySet DDSDailyRollup."""
+        rows = (
+            rollup.values(
+                "kind",
+                "method",
+                "article__category_id",
+                "article__category__name",
+                "article__category__parent_id",
+                "article__category__parent__name",
+            )
+            .annotate(
+                amount=Coalesce(Sum("total"), ZERO),
+                rooms=Coalesce(Sum("total", filter=ROOMS_Q), ZERO),
+                incasso=Coalesce(Sum("total", filter=INCASSO_Q), ZERO),
+                other_ops=Coalesce(Sum("ops_count", filter=~INCASSO_Q), 0),
+            )
+            .order_by()
+        )
+        return cls(list(rows))
+
+    def _rows(self, kind: str, exclude_incasso: bool = False):
+        """(строка, сумма) по виду; без инкассации — строки только из неё пропускаем."""
+        for r in self.rows:
+            if r["kind"] != kind:
+                continue
+            if exclude_incasso:
+                if not r["other_ops"]:
+                    continue
+                yield r, r["amount"] - r["incasso"]
+            else:
+                yield r, r["amount"]
+
+    # -----------------------------
+    # Итоги
+    # -----------------------------
+
+    def total(self, kind: str, *, method: str = None, exclude_incasso: bool = False) -> Decimal:
+        return sum(
+            (amount for r, amount in self._rows(kind, exclude_incasso) if method is None or r["method"] == method),
+            ZERO,
+        )
+
+    def rooms_total(self) -> Decimal:
+        return sum((r["rooms"] for r in self.rows), ZERO)
+
+    def method_rows(self, methods=METHODS):
+        """Приход/расход/разница по каждому счёту."""
+        inc = defaultdict(lambda: ZERO)
+        exp = defaultdict(lambda: ZERO)
+        for r in self.rows:
+            if r["kind"] == DDSArticle.INCOME:
+                inc[r["method"]] += r["amount"]
+            elif r["kind"] == DDSArticle.EXPENSE:
+                exp[r["method"]] += r["amount"]
+        return [
+            {
+                "code": m,
+                "label": METHOD_LABELS.get(m, m),
+                "income": inc[m],
+                "expense": exp[m],
+                "delta": inc[m] - exp[m],
+            }
+            for m in methods
+        ]
+
+    # -----------------------------
+    # Категории
+    # -----------------------------
+
+    def category_groups(self, kind: str, *, exclude_incasso: bool = False, methods=METHODS):
+        """
+        Группы верхних категорий с подкатегориями и разбивкой по счетам:
+          groups: [{id, name, total, method_totals, subs: [{id, name, total, method_totals}]}]
+          uncat:  {total, method_totals} — статьи без категории
+        Подкатегория складывается в родителя; операции на верхней категории
+        идут только в total группы.
+        """
+        groups_map = {}
+        uncat_by_method = defaultdict(lambda: ZERO)
+
+        for r, total in self._rows(kind, exclude_incasso):
+            m = r["method"]
+
+            cat_id = r["article__category_id"]
+            cat_name = r["article__category__name"]
+            parent_id = r["article__category__parent_id"]
+            parent_name = r["article__category__parent__name"]
+
+            if not cat_id:
+                uncat_by_method[m] += total
+                continue
+
+            if parent_id:
+                group_id, group_name = parent_id, parent_name or "Без названия"
+                sub_id, sub_name = cat_id, cat_name or "Без названия"
+            else:
+                group_id, group_name = cat_id, cat_name or "Без названия"
+                sub_id, sub_name = None, None
+
+            g = groups_map.get(group_id)
+            if not g:
+                g = groups_map[group_id] = {
+                    "id": group_id,
+                    "name": group_name,
+                    "total": ZERO,
+                    "by_method": defaultdict(lambda: ZERO),
+                    "subs_map": {},
+                }
+            g["total"] += total
+            g["by_method"][m] += total
+
+            if sub_id:
+                s = g["subs_map"].get(sub_id)
+                if not s:
+                    s = g["subs_map"][sub_id] = {
+                        "id": sub_id,
+                        "name": sub_name,
+                        "total": ZERO,
+                        "by_method": defaultdict(lambda: ZERO),
+                    }
+                s["total"] += total
+                s["by_method"][m] += total
+
+        # только простые типы — результат дашборда кладётся в кэш
+        groups = []
+        for g in groups_map.values():
+            subs = sorted(g["subs_map"].values(), key=lambda x: (x["name"] or "").lower())
+            for s in subs:
+                by_method = s.pop("by_method")
+                s["method_totals"] = [by_method[mm] for mm in methods]
+            groups.append({
+                "id": g["id"],
+                "name": g["name"],
+                "total": g["total"],
+                "method_totals": [g["by_method"][mm] for mm in methods],
+                "subs": subs,
+            })
+        groups.sort(key=lambda x: (x["name"] or "").lower())
+
+        uncat = {
+            "total": sum(uncat_by_method.values(), ZERO),
+            "method_totals": [uncat_by_method[mm] for mm in methods],
+        }
+        return groups, uncat
+
+    def top_category_totals(self, kind: str, *, exclude_incasso: bool = False):
+        """[(название верхней категории, сумма), ...] по убыванию суммы (для графиков)."""
+        totals = defaultdict(lambda: ZERO)
+        for r, amount in self._rows(kind, exclude_incasso):
+            if not r["article__category_id"]:
+                name = "Без категории"
+            elif r["article__category__parent_id"]:
+                name = r["article__category__parent__name"] or "Без категории"
+            else:
+                name = r["article__category__name"] or "Без категории"
+            totals[name] += amount
+        return sorted(totals.items(), key=lambda x: x[1], reverse=True)
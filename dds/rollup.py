@@ -0,0 +1,177 @@
+# dds/rollup.py
+"""
+Дневной свод ДДС (DDSDailyRollup).
+
+Отчёты читают суммы из свода, а не агрегируют сырые DDSOperation с TruncDate.
+Свод ведётся инкрементально (сигналы в dds.signals): при создании операции
+добавляем её сумму, при сторно/удалении — вычитаем, при правке — переносим
+из старого ключа в новый.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DDSArticle, DDSDailyRollup, DDSOperation
+
+# поля операции, от которых зависит её место в своде
+OP_FIELDS = ("hotel_id", "happened_at", "article_id", "article__kind", "method", "source", "amount", "is_voided")
+
+
+def source_group(source: str) -> str:
+    src = (source or "").lower()
+    if src == "incasso":
+        return DDSDailyRollup.SRC_INCASSO
+    if "room" in src:
+        return DDSDailyRollup.SRC_ROOMS
+    return DDSDailyRollup.SRC_OTHER
+
+
+def source_group_expr():
+    """То же, что source_group(), но выражением БД (для пересборки одним GROUP BY)."""
+    return Case(
+        When(source__iexact="incasso", then=Value(DDSDailyRollup.SRC_INCASSO)),
+        When(source__icontains="room", then=Value(DDSDailyRollup.SRC_ROOMS)),
+        default=Value(DDSDailyRollup.SRC_OTHER),
+        output_field=CharField(),
+    )
+
+
+def snapshot(op: DDSOperation) -> dict:
+    """Значения операции, нужные своду (kind берём из статьи)."""
+    kind = op.article.kind if op.article_id else None
+    return {
+        "hotel_id": op.hotel_id,
+        "happened_at": op.happened_at,
+        "article_id": op.article_id,
+        "article__kind": kind,
+        "method": op.method,
+        "source": op.source,
+        "amount": op.amount,
+        "is_voided": op.is_voided,
+    }
+
+
+def _key(v: dict) -> dict:
+    return {
+        "hotel_id": v["hotel_id"],
+        "day": timezone.localtime(v["happened_at"]).date(),
+        "article_id": v["article_id"],
+        "method": v["method"],
+        "kind": v["article__kind"],
+        "source_group": source_group(v["source"]),
+    }
+
+
+def _add(key: dict, amount: Decimal, count: int):
+    upd = {"total": F("total") + amount, "ops_count": F("ops_count") + count}
+    if DDSDailyRollup.objects.filter(**key).update(**upd):
+        return
+    try:
+        with transaction.atomic():
+            DDSDailyRollup.objects.create(**key, total=amount, ops_count=count)
+    except IntegrityError:
+        DDSDailyRollup.objects.filter(**key).update(**upd)
+
+
+def apply_change(old: dict = None, new: dict = None):
+    """
+    Перенос операции в своде: old — значения до записи (или None при создании),
+    new — после (или None при удалении). Сторнированные не учитываются.
+    """
+    if old and not old["is_voided"]:
+        _add(_key(old), -(old["amount"] or Decimal("0.00")), -1)
+    if new and not new["is_voided"]:
+        _add(_key(new), new["amount"] or Decimal("0.00"), 1)
+
+
+def apply_bulk(values):
+    """
+    Добавить в свод пачку новых операций (bulk_create не шлёт сигналы):
+    values — снимки как у snapshot(); суммы сначала складываются по ключу
+    свода в памяти, потом одно обновление на ключ.
+    """
+    acc = {}
+    for v in values:
+        if v["is_voided"]:
+            continue
+        key = tuple(sorted(_key(v).items()))
+        total, count = acc.get(key, (Decimal("0.00"), 0))
+        acc[key] = (total + (v["amount"] or Decimal("0.00")), count + 1)
+    for key, (total, count) in acc.items():
+        _add(dict(key), total, count)
+    return len(acc)
+
+
+def rebuild_rollup(*, hotel_ids=None, batch: int = 2000) -> int:
+    """Полная пересборка свода одним GROUP BY по операциям. Возвращает число строк."""
+    tz = timezone.get_current_timezone()
+    ops = DDSOperation.objects.filter(is_voided=False)
+    rollups = DDSDailyRollup.objects.all()
+    if hotel_ids:
+        ops = ops.filter(hotel_id__in=hotel_ids)
+        rollups = rollups.filter(hotel_id__in=hotel_ids)
+
+    rows = (
+        ops.annotate(day=TruncDate("happened_at", tzinfo=tz), sgroup=source_group_expr())
+        .values("hotel_id", "day", "article_id", "method", "article__kind", "sgroup")
+        .annotate(total=Sum("amount"), cnt=Count("id"))
+        .order_by()
+    )
+
+    created = 0
+    with transaction.atomic():
+        rollups.delete()
+        buf = []
+        for r in rows.iterator(chunk_size=batch):
+            buf.append(DDSDailyRollup(
+                hotel_id=r["hotel_id"],
+                day=r["day"],
+                article_id=r["article_id"],
+                method=r["method"],
+                kind=r["article__kind"],
+                source_group=r["sgroup"],
+                total=r["total"] or Decimal("0.00"),
+                ops_count=r["cnt"],
+            ))
+            if len(buf) >= batch:
+                DDSDailyRollup.objects.bulk_create(buf)
+                created += len(buf)
+                buf = []
+        if buf:
+            DDSDailyRollup.objects.bulk_create(buf)
+            created += len(buf)
+    return created
+
+
+# ---------------------------------------------------------------
+# Фильтры для отчётов (аналоги фильтров по сырым операциям)
+# ---------------------------------------------------------------
+
+def rollup_qs(*, hotels=None, hotel=None, date_from=None, date_to=None):
+    qs = DDSDailyRollup.objects.all()
+    if hotel is not None:
+        qs = qs.filter(hotel=hotel)
+    elif hotels is not None:
+        qs = qs.filter(hotel__in=hotels)
+    if date_from:
+        qs = qs.filter(day__gte=date_from)
+    if date_to:
+        qs = qs.filter(day__lte=date_to)
+    return qs
+
+
+# инкассация: в графиках/расходах дашборда не показываем
+INCASSO_Q = Q(kind=DDSArticle.EXPENSE) & (
+    Q(source_group=DDSDailyRollup.SRC_INCASSO) | Q(article__name__iexact="Инкассация")
+)
+
+# доход с номеров
+ROOMS_Q = Q(kind=DDSArticle.INCOME) & (
+    Q(source_group=DDSDailyRollup.SRC_ROOMS) |
+    Q(article__name__icontains="номер") |
+    Q(article__name__icontains="прожив") |
+    Q(article__name__icontains="комнат")
+)
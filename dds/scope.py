@@ -0,0 +1,170 @@
+# dds/scope.py
+"""
+Какие отели доступны пользователю — один раз на запрос.
+
+HotelScopeMiddleware кладёт в request.hotel_scope ленивый HotelScope:
+список ID доступных отелей (по имени) и флаг «видит всю сеть». Считается
+при первом обращении, дальше в запросе — без SQL.
+
+Между запросами скоуп лежит в кэше (ключ: версия справочника + пользователь),
+но только если кэш общий для всех процессов (Redis, Memcached, БД). Версия
+меняется при правке/удалении отеля, ключ пользователя удаляется при правке
+его профиля или флагов (см. dds.signals, accounts.signals). С локальным кэшем
+(LocMem — по умолчанию) сброс виден только своему процессу, и отозванный
+доступ жил бы на других воркерах до HOTEL_SCOPE_TTL — там скоуп считается
+заново на каждый запрос. HOTEL_SCOPE_CACHE = True/False в settings — явно.
+
+Во view фильтруем по готовому кортежу: hotel_id__in=scope.ids, а не
+подзапросом hotel__in=<queryset>.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.functional import SimpleLazyObject
+
+from .cache import shared_cache
+from .models import Hotel
+
+SCOPE_TTL = getattr(settings, "HOTEL_SCOPE_TTL", 60 * 5)
+VERSION_KEY = "hotelscope:ver"
+
+
+class HotelScope:
+    """Доступные отели пользователя: ids — кортеж ID по имени отеля."""
+
+    def __init__(self, ids=(), *, is_finance_admin: bool = False):
+        self.ids = tuple(ids)
+        self.is_finance_admin = is_finance_admin
+        self._set = frozenset(self.ids)
+
+    def __contains__(self, hotel_id) -> bool:
+        try:
+            return int(hotel_id) in self._set
+        except (TypeError, ValueError):
+            return False
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return bool(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    @property
+    def single_id(self):
+        """ID отеля, если доступен ровно один."""
+        return self.ids[0] if len(self.ids) == 1 else None
+
+    def hotels(self):
+        """Queryset доступных отелей (для списков и полей форм)."""
+        return Hotel.objects.filter(id__in=self.ids)
+
+    def get_hotel(self, hotel_id) -> Hotel:
+        """Отель из доступных или 404."""
+        if hotel_id not in self:
+            raise Http404("Отель не найден.")
+        return get_object_or_404(Hotel, id=hotel_id)
+
+    def selected_or_first(self, hotel_id):
+        """Отель из GET-параметра (чужой — 404) или первый доступный; None, если доступных нет."""
+        if hotel_id:
+            return self.get_hotel(hotel_id)
+        return get_object_or_404(Hotel, id=self.ids[0]) if self.ids else None
+
+    def __getstate__(self):
+        return {"ids": self.ids, "is_finance_admin": self.is_finance_admin}
+
+    def __setstate__(self, state):
+        self.__init__(state["ids"], is_finance_admin=state["is_finance_admin"])
+
+
+EMPTY = HotelScope()
+
+
+def is_finance_admin(user) -> bool:
+    if user.is_superuser:
+        return True
+    profile = getattr(user, "profile", None)
+    return bool(profile and profile.is_finance_admin)
+
+
+def cache_enabled() -> bool:
+    """Кэшировать скоуп между запросами — только в общем для процессов кэше."""
+    explicit = getattr(settings, "HOTEL_SCOPE_CACHE", None)
+    if explicit is not None:
+        return bool(explicit)
+    return shared_cache()
+
+
+def _version() -> int:
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def _key(user_id, version=None) -> str:
+    return f"hotelscope:{version or _version()}:{user_id}"
+
+
+def build_scope(user) -> HotelScope:
+    """
+    - superuser / finance_admin (в профиле) видит все активные отели
+    - обычный пользователь — только свой отель из профиля
+    """
+    if not user.is_authenticated or not user.is_active:
+        return EMPTY
+
+    hotels = Hotel.objects.filter(is_active=True).order_by("name", "id")
+    fin = is_finance_admin(user)
+    if not fin:
+        profile = getattr(user, "profile", None)
+        if not (profile and profile.hotel_id):
+            return EMPTY
+        hotels = hotels.filter(id=profile.hotel_id)
+    return HotelScope(hotels.values_list("id", flat=True), is_finance_admin=fin)
+
+
+def resolve_scope(user) -> HotelScope:
+    """HotelScope пользователя из кэша (или посчитать и положить)."""
+    if not user.is_authenticated:
+        return EMPTY
+    if not cache_enabled():
+        return build_scope(user)
+    key = _key(user.pk)
+    scope = cache.get(key)
+    if scope is None:
+        scope = build_scope(user)
+        cache.set(key, scope, SCOPE_TTL)
+    return scope
+
+
+def invalidate_user_scope(user_id):
+    cache.delete(_key(user_id))
+
+
+def invalidate_all_scopes():
+    """Справочник отелей изменился — все ключи устаревают разом."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def get_scope(request) -> HotelScope:
+    """request.hotel_scope (или посчитать, если middleware не подключён — например, в тестах)."""
+    scope = getattr(request, "hotel_scope", None)
+    if scope is None:
+        scope = request.hotel_scope = resolve_scope(request.user)
+    return scope
+
+
+class HotelScopeMiddleware:
+    """Ставить после AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.hotel_scope = SimpleLazyObject(lambda: resolve_scope(request.user))
+        return self.get_response(request)
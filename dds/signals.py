@@ -1,8 +1,69 @@
-from django.db.models.signals import post_save
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import Hotel, CashRegister
+from .models import Hotel, CashRegister, DDSArticle, DDSCategory, DDSOperation, CashMovement
+from .cache import bump_all_versions, bump_hotel_version
+from .catalog import forget_request_catalog, invalidate_catalog
+from .scope import invalidate_all_scopes
+from .rollup import OP_FIELDS, apply_change, snapshot
 
 @receiver(post_save, sender=Hotel)
 def ensure_cash_register(sender, instance, created, **kwargs):
     if created:
         CashRegister.objects.get_or_create(hotel=instance)
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_delete, sender=Hotel)
+def reset_hotel_scopes(sender, instance, **kwargs):
+    # новый/скрытый/переименованный отель меняет списки доступных отелей у всех
+    transaction.on_commit(invalidate_all_scopes)
+
+
+@receiver(post_save, sender=DDSArticle)
+@receiver(post_delete, sender=DDSArticle)
+@receiver(post_save, sender=DDSCategory)
+@receiver(post_delete, sender=DDSCategory)
+@receiver(m2m_changed, sender=DDSArticle.hotels.through)
+def reset_article_catalog(sender, **kwargs):
+    # статьи/категории/привязка к отелям — каталог форм (dds.catalog) пересоберётся;
+    # в кэшированных отчётах (dds.cache) имена статей и категорий — их тоже сбрасываем
+    if kwargs.get("action", "post_").startswith("post_"):
+        bump_all_versions()
+        transaction.on_commit(invalidate_catalog)
+
+
+@receiver(request_started)
+def reset_request_catalog(sender, **kwargs):
+    # без общего кэша каталог статей живёт один запрос (dds.catalog.cache_enabled)
+    forget_request_catalog()
+
+
+@receiver(post_save, sender=DDSOperation)
+@receiver(post_delete, sender=DDSOperation)
+@receiver(post_save, sender=CashMovement)
+@receiver(post_delete, sender=CashMovement)
+def bump_dds_version(sender, instance, **kwargs):
+    # create / void() / правка в админке — любой записью сбрасываем кэш отчётов отеля
+    bump_hotel_version(instance.hotel_id)
+
+
+@receiver(pre_save, sender=DDSOperation)
+def remember_rollup_old(sender, instance, **kwargs):
+    # старые значения нужны, чтобы при правке/сторно вычесть операцию из прежнего ключа свода
+    instance._rollup_old = None
+    if instance.pk:
+        instance._rollup_old = (
+            DDSOperation.objects.filter(pk=instance.pk).values(*OP_FIELDS).first()
+        )
+
+
+@receiver(post_save, sender=DDSOperation)
+def update_rollup_on_save(sender, instance, **kwargs):
+    apply_change(getattr(instance, "_rollup_old", None), snapshot(instance))
+
+
+@receiver(post_delete, sender=DDSOperation)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    apply_change(snapshot(instance), None)
@@ -0,0 +1,37 @@
+# dds/storage.py
+"""
+Закрытое хранилище файлов: готовые выгрузки и отчёты об ошибках импорта.
+
+Лежит вне public_html (settings.PRIVATE_MEDIA_ROOT), URL у него нет —
+файлы отдаются только вьюхами с проверкой прав (export_download,
+скачивание отчёта импорта в админке). Имена файлов случайные: даже зная
+каталог, имя не подобрать.
+"""
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+
+class PrivateStorage(FileSystemStorage):
+    """FileSystemStorage без публичного URL: ссылку на файл даёт вьюха, а не storage."""
+
+    def url(self, name):
+        raise ValueError("Файл в закрытом хранилище: ссылку даёт вьюха скачивания.")
+
+
+def private_storage() -> PrivateStorage:
+    # callable, а не экземпляр: в миграции попадает ссылка на функцию, а не путь
+    return PrivateStorage(location=settings.PRIVATE_MEDIA_ROOT)
+
+
+def random_name(folder: str, filename: str) -> str:
+    """folder/ГГГГ/ММ/<случайное><расширение>."""
+    ext = os.path.splitext(filename)[1].lower()
+    return f"{folder}/{timezone.now():%Y/%m}/{uuid.uuid4().hex}{ext}"
+
+
+def export_upload_to(instance, filename: str) -> str:
+    return random_name("exports", filename)
@@ -1,3 +1,195 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.utils import timezone
+
+from .cash_services import CashTransferError, balances_as_of, post_cash_movements, transfer_between_accounts
+from .ledger import ACCOUNTS, build_snapshots, ledger_balances, repair_registers, verify_ledger
+from .models import CashBalanceSnapshot, CashMovement, CashRegister, CashTransfer, Hotel
+
+CASH, OPTIMA = CashMovement.ACC_CASH, CashMovement.ACC_OPTIMA
+IN, OUT = CashMovement.IN, CashMovement.OUT
+
+
+def ago(days, hour=12):
+    """Момент days дней назад, hour:00 по местному времени."""
+    day = timezone.localdate() - timedelta(days=days)
+    return timezone.make_aware(datetime.combine(day, time(hour)))
+
+
+class CashTestData(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("cashier")
+        cls.hotel = Hotel.objects.create(name="Тестовый")
+
+    def post(self, *moves, **kwargs):
+        """moves — (account, direction, amount[, happened_at])."""
+        return post_cash_movements(hotel=self.hotel, created_by=self.user, movements=[
+            {"account": m[0], "direction": m[1], "amount": m[2], "happened_at": m[3] if len(m) > 3 else None}
+            for m in moves
+        ], **kwargs)
+
+    def register(self):
+        return CashRegister.objects.get(hotel=self.hotel)
+
+
+class CashLedgerTests(CashTestData):
+    def test_register_follows_journal(self):
+        self.post((CASH, IN, "1000.00"), (OPTIMA, IN, "250.50"))
+        self.post((CASH, OUT, "300.00"))
+
+        reg = self.register()
+        self.assertEqual((reg.cash_balance, reg.optima_balance), (Decimal("700.00"), Decimal("250.50")))
+        balances = ledger_balances([self.hotel.id])
+        self.assertEqual(balances[(self.hotel.id, CASH)], reg.cash_balance)
+        self.assertEqual(balances[(self.hotel.id, OPTIMA)], reg.optima_balance)
+        self.assertEqual(verify_ledger([self.hotel.id]), [])
+
+    def test_insufficient_funds_writes_nothing(self):
+        self.post((CASH, IN, "100.00"))
+
+        with self.assertRaisesMessage(ValidationError, "Недостаточно средств"):
+            self.post((CASH, OUT, "100.01"))
+        self.assertEqual(CashMovement.objects.filter(hotel=self.hotel).count(), 1)
+        self.assertEqual(self.register().cash_balance, Decimal("100.00"))
+
+    def test_invalid_movement_rejected(self):
+        for move in [(CASH, IN, "0"), (CASH, IN, "abc"), ("bank", IN, "10"), (CASH, "sideways", "10")]:
+            with self.subTest(move=move), self.assertRaises(ValidationError):
+                self.post(move)
+        self.assertFalse(CashMovement.objects.filter(hotel=self.hotel).exists())
+
+    def test_verify_and_repair_register_drift(self):
+        self.post((CASH, IN, "500.00"))
+        CashRegister.objects.filter(hotel=self.hotel).update(cash_balance=Decimal("450.00"))
+
+        problems = verify_ledger([self.hotel.id])
+        self.assertEqual(problems, [{
+            "type": "register", "hotel_id": self.hotel.id, "account": CASH,
+            "stored": Decimal("450.00"), "expected": Decimal("500.00"),
+        }])
+
+        self.assertEqual(repair_registers([self.hotel.id]), 1)
+        self.assertEqual(self.register().cash_balance, Decimal("500.00"))
+        self.assertEqual(verify_ledger([self.hotel.id]), [])
+
+
+class BalancesAsOfTests(CashTestData):
+    def setUp(self):
+        self.post(
+            (CASH, IN, "1000.00", ago(10, 9)),
+            (CASH, OUT, "150.25", ago(10, 18)),
+            (OPTIMA, IN, "400.00", ago(7)),
+            (CASH, IN, "75.50", ago(5)),
+            (OPTIMA, OUT, "100.00", ago(3)),
+            (CASH, OUT, "25.25", ago(0, 0)),
+        )
+
+    def brute_force(self, at):
+        result = {acc: Decimal("0.00") for acc in ACCOUNTS}
+        for mv in CashMovement.objects.filter(hotel=self.hotel, happened_at__lte=at):
+            result[mv.account] += mv.amount if mv.direction == IN else -mv.amount
+        return result
+
+    def moments(self):
+        return [ago(d, h) for d in (11, 10, 7, 5, 4, 3, 0) for h in (0, 9, 12, 23)]
+
+    def assert_matches_brute_force(self):
+        for at in self.moments():
+            with self.subTest(at=at):
+                self.assertEqual(balances_as_of(self.hotel, at), self.brute_force(at))
+
+    def test_without_snapshots(self):
+        self.assert_matches_brute_force()
+
+    def test_with_snapshots(self):
+        # снимки только за дни с движениями и только до вчера
+        self.assertEqual(build_snapshots(hotel_ids=[self.hotel.id]), 4)
+        self.assertEqual(build_snapshots(hotel_ids=[self.hotel.id]), 0)
+        self.assertEqual(verify_ledger([self.hotel.id]), [])
+
+        self.assert_matches_brute_force()
+
+    def test_backdated_movement_drops_later_snapshots(self):
+        build_snapshots(hotel_ids=[self.hotel.id])
+
+        self.post((CASH, IN, "10.00", ago(6)))
+
+        days = set(CashBalanceSnapshot.objects.filter(hotel=self.hotel, account=CASH).values_list("day", flat=True))
+        self.assertEqual(days, {timezone.localdate() - timedelta(days=10)})
+        self.assert_matches_brute_force()
+
+        build_snapshots(hotel_ids=[self.hotel.id])
+        self.assertEqual(verify_ledger([self.hotel.id]), [])
+        self.assert_matches_brute_force()
+
+    def test_verify_reports_stale_snapshot(self):
+        build_snapshots(hotel_ids=[self.hotel.id])
+        day = timezone.localdate() - timedelta(days=5)
+        CashBalanceSnapshot.objects.filter(hotel=self.hotel, account=CASH, day=day).update(balance=Decimal("1.00"))
+
+        self.assertEqual(verify_ledger([self.hotel.id]), [{
+            "type": "snapshot", "hotel_id": self.hotel.id, "account": CASH, "day": day,
+            "stored": Decimal("1.00"), "expected": Decimal("925.25"),
+        }])
+
+
+class BatchPostingTests(CashTestData):
+    def test_funds_checked_in_batch_order(self):
+        # приход раньше расхода в том же пакете — проходит
+        moves = self.post((CASH, IN, "100.00"), (CASH, OUT, "80.00"), (CASH, IN, "5.00"))
+
+        self.assertEqual(len(moves), 3)
+        self.assertEqual(self.register().cash_balance, Decimal("25.00"))
+
+    def test_failed_batch_writes_nothing(self):
+        self.post((OPTIMA, IN, "50.00"))
+
+        # те же суммы, но расход раньше прихода
+        with self.assertRaises(ValidationError):
+            self.post((CASH, OUT, "80.00"), (CASH, IN, "100.00"))
+        with self.assertRaises(ValidationError):
+            self.post((OPTIMA, OUT, "30.00"), (OPTIMA, OUT, "30.00"))
+
+        self.assertEqual(CashMovement.objects.filter(hotel=self.hotel).count(), 1)
+        reg = self.register()
+        self.assertEqual((reg.cash_balance, reg.optima_balance), (Decimal("0.00"), Decimal("50.00")))
+
+    def test_without_funds_check(self):
+        self.post((CASH, OUT, "40.00"), check_funds=False)
+
+        self.assertEqual(self.register().cash_balance, Decimal("-40.00"))
+        self.assertEqual(verify_ledger([self.hotel.id]), [])
+
+    def test_empty_batch(self):
+        self.assertEqual(self.post(), [])
+
+    def test_transfer_posts_both_legs(self):
+        self.post((OPTIMA, IN, "300.00"))
+
+        transfer = transfer_between_accounts(hotel=self.hotel, from_account=OPTIMA, to_account=CASH, amount="120.00", user=self.user)
+
+        legs = CashMovement.objects.filter(transfer=transfer).order_by("id")
+        self.assertEqual([(m.account, m.direction, m.amount) for m in legs], [
+            (OPTIMA, OUT, Decimal("120.00")), (CASH, IN, Decimal("120.00")),
+        ])
+        reg = self.register()
+        self.assertEqual((reg.cash_balance, reg.optima_balance), (Decimal("120.00"), Decimal("180.00")))
+        self.assertEqual(verify_ledger([self.hotel.id]), [])
+
+    def test_transfer_rejected(self):
+        self.post((OPTIMA, IN, "100.00"))
 
-# Create your tests here.
+        for kwargs in [
+            {"from_account": OPTIMA, "to_account": CASH, "amount": "100.01"},
+            {"from_account": OPTIMA, "to_account": OPTIMA, "amount": "10.00"},
+            {"from_account": OPTIMA, "to_account": CASH, "amount": "0"},
+        ]:
+            with self.subTest(**kwargs), self.assertRaises(CashTransferError):
+                transfer_between_accounts(hotel=self.hotel, user=self.user, **kwargs)
+        self.assertFalse(CashTransfer.objects.exists())
+        self.assertEqual(CashMovement.objects.filter(hotel=self.hotel).count(), 1)
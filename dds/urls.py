@@ -42,5 +42,7 @@ urlpatterns = [
     path("hotels/<int:pk>/incasso/", views.incasso_create, name="incasso_create"),
     path("accounting/", views.accounting, name="accounting"),
     path("accounting/export/excel/", views.accounting_export_excel, name="accounting_excel"),
+    path("exports/<int:pk>/", views.export_job, name="export_job"),
+    path("exports/<int:pk>/download/", views.export_download, name="export_download"),
 
 ]
@@ -1,19 +1,12 @@
-from .models import Hotel
+from .scope import resolve_scope
+
 
 def user_hotels_qs(user):
     """
     - superuser видит всё
     - finance_admin (в профиле) видит всё
     - обычный пользователь видит только свой отель
-    """
-    if user.is_superuser:
-        return Hotel.objects.filter(is_active=True)
-
-    profile = getattr(user, "profile", None)
-    if profile and profile.is_finance_admin:
-        return Hotel.objects.filter(is_active=True)
 
-    if profile and profile.hotel_id:
-        return Hotel.objects.filter(is_active=True, id=profile.hotel_id)
-
-    return Hotel.objects.none()
+    Во view лучше request.hotel_scope (dds.scope) — там уже готовые ID.
+    """
+    return resolve_scope(user).hotels()
@@ -8,16 +8,14 @@ from .models import DDSOperation, DDSArticle, Hotel, DDSArticle, DDSOperation, C
 from django.db import IntegrityError
 from django.shortcuts import redirect
 from .forms import DDSOperationForm
-from .cash_services import apply_cash_movement
+from .cash_services import apply_cash_movement, balances_as_of
 from django.db.models import Sum, Q, F
 from django.db.models.functions import Coalesce
-from django.http import HttpResponse
-from openpyxl import Workbook
 from decimal import Decimal, ROUND_HALF_UP
 from django.contrib import messages
 from django.shortcuts import redirect
 from .forms import CashIncassoForm
-from .models import CashIncasso
+from .models import CashIncasso, DDSDailyRollup
 from django.db import transaction
 from django.core.exceptions import ValidationError
 from .cash_services import apply_cash_movement, FIELD_MAP
@@ -27,7 +25,7 @@ from django.db.models.functions import Coalesce, TruncDate
 from django.shortcuts import redirect, render, get_object_or_404
 from django.db.models.functions import Coalesce, TruncDate
 from django.db.models import Sum, Q
-from .utils import user_hotels_qs
+from .scope import get_scope
 from django.db import transaction
 from django.contrib import messages
 from django.shortcuts import redirect, render
@@ -48,7 +46,15 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Sum, Q
 from django.db.models.functions import Coalesce, TruncDate
 from collections import OrderedDict
-from openpyxl.styles import Font
+from .cache import cached_for_hotels
+from .rollup import rollup_qs, INCASSO_Q, ROOMS_Q
+from .pivot import DDSPivot, METHODS as PIVOT_METHODS
+from .exports import XLSX_CONTENT_TYPE
+from .export_jobs import request_export
+from .pagination import paginate
+from .models import ExportJob
+from django.http import FileResponse, Http404
+import os
 
 def _parse_date(d: str):
     try:
@@ -57,6 +63,24 @@ def _parse_date(d: str):
         return None
 
 
+def _parse_as_of(value: str):
+    """
+    ?as_of=YYYY-MM-DD (на конец дня) или YYYY-MM-DDTHH:MM (datetime-local).
+    Возвращает aware datetime или None.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return timezone.make_aware(datetime.strptime(value, "%Y-%m-%dT%H:%M"))
+    except ValueError:
+        pass
+    d = _parse_date(value)
+    if d:
+        return timezone.make_aware(datetime.combine(d, time.max))
+    return None
+
+
 
 def _day_range(date_obj):
     start = timezone.make_aware(datetime.combine(date_obj, time.min))
@@ -65,128 +89,36 @@ def _day_range(date_obj):
 
 @login_required
 def hotel_detail_export_excel(request, pk):
-    hotels_qs = user_hotels_qs(request.user)
-    hotel = get_object_or_404(hotels_qs, pk=pk)
+    hotel = get_scope(request).get_hotel(pk)
 
     date_from = _parse_date(request.GET.get("date_from", ""))
     date_to = _parse_date(request.GET.get("date_to", ""))
 
-    ops = (DDSOperation.objects
-           .select_related("article")
-           .filter(hotel=hotel, is_voided=False))
-
-    if date_from:
-        start, _ = _day_range(date_from)
-        ops = ops.filter(happened_at__gte=start)
-    if date_to:
-        _, end = _day_range(date_to)
-        ops = ops.filter(happened_at__lte=end)
-
-    rooms_q = (
-        Q(source__iexact="rooms") |
-        Q(source__icontains="room") |
-        Q(article__name__icontains="номер") |
-        Q(article__name__icontains="прожив") |
-        Q(article__name__icontains="комнат")
-    )
-    rooms_ops = ops.filter(article__kind=DDSArticle.INCOME).filter(rooms_q)
-
-    income_total = ops.filter(article__kind=DDSArticle.INCOME).aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
-    expense_total = ops.filter(article__kind=DDSArticle.EXPENSE).aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
-    balance = income_total - expense_total
-
-    tz = timezone.get_current_timezone()
-    rooms_by_day = (
-        rooms_ops
-        .annotate(day=TruncDate("happened_at", tzinfo=tz))
-        .values("day")
-        .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
-        .order_by("day")
+    job, _ = request_export(
+        kind=ExportJob.HOTEL_DETAIL, user=request.user,
+        hotel_ids=[hotel.id], date_from=date_from, date_to=date_to,
     )
-
-    wb = Workbook()
-
-    # Sheet 1: Summary
-    ws1 = wb.active
-    ws1.title = "Итоги"
-    header_font = Font(bold=True)
-
-    ws1["A1"] = "Отель"; ws1["B1"] = hotel.name
-    ws1["A2"] = "Период"
-    ws1["B2"] = f"{date_from or '—'} → {date_to or '—'}"
-    ws1["A4"] = "Приход"; ws1["B4"] = float(income_total)
-    ws1["A5"] = "Расход"; ws1["B5"] = float(expense_total)
-    ws1["A6"] = "Остаток"; ws1["B6"] = float(balance)
-
-    for cell in ("A1","A2","A4","A5","A6"):
-        ws1[cell].font = header_font
-
-    # Sheet 2: Rooms by day
-    ws2 = wb.create_sheet("Номера по дням")
-    ws2.append(["Дата", "Доход с номеров"])
-    ws2["A1"].font = header_font
-    ws2["B1"].font = header_font
-
-    for r in rooms_by_day:
-        ws2.append([r["day"].strftime("%Y-%m-%d") if r["day"] else "", float(r["total"])])
-
-    # Sheet 3: Operations
-    ws3 = wb.create_sheet("Операции")
-    ws3.append(["Дата", "Тип", "Статья", "Способ", "Сумма", "Контрагент", "Источник", "Комментарий"])
-    for c in range(1, 9):
-        ws3.cell(row=1, column=c).font = header_font
-
-    for op in ops.order_by("happened_at"):
-        ws3.append([
-            op.happened_at.strftime("%Y-%m-%d %H:%M"),
-            op.article.get_kind_display(),
-            op.article.name,
-            op.get_method_display(),
-            float(op.amount),
-            op.counterparty or "",
-            op.source or "",
-            (op.comment or "")[:500],
-        ])
-
-    filename = f"hotel_{hotel.id}_dds.xlsx"
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
+    return redirect("dds:export_job", pk=job.pk)
 
 @login_required
 def unified_report(request):
     # доступ: только superuser/finance_admin
-    profile = getattr(request.user, "profile", None)
-    if not (request.user.is_superuser or (profile and profile.is_finance_admin)):
+    scope = get_scope(request)
+    if not scope.is_finance_admin:
         # обычному пользователю можно показывать только его отельный дашборд
         return redirect("dds:dds_dashboard")
 
-    hotels_qs = user_hotels_qs(request.user)  # для finance_admin будет "все"
     date_from = _parse_date(request.GET.get("date_from", ""))
     date_to = _parse_date(request.GET.get("date_to", ""))
 
-    ops = DDSOperation.objects.select_related("hotel", "article").filter(is_voided=False, hotel__in=hotels_qs)
-
-    if date_from:
-        start, _ = _day_range(date_from)
-        ops = ops.filter(happened_at__gte=start)
-    if date_to:
-        _, end = _day_range(date_to)
-        ops = ops.filter(happened_at__lte=end)
+    rollup = rollup_qs(hotels=scope.ids, date_from=date_from, date_to=date_to)
 
     # Свод по отелям
     by_hotels = (
-        ops.values("hotel_id", "hotel__name")
+        rollup.values("hotel_id", "hotel__name")
         .annotate(
-            income=Coalesce(Sum("amount", filter=Q(article__kind=DDSArticle.INCOME)), Decimal("0.00")),
-            expense=Coalesce(Sum("amount", filter=Q(article__kind=DDSArticle.EXPENSE)), Decimal("0.00")),
+            income=Coalesce(Sum("total", filter=Q(kind=DDSArticle.INCOME)), Decimal("0.00")),
+            expense=Coalesce(Sum("total", filter=Q(kind=DDSArticle.EXPENSE)), Decimal("0.00")),
         )
         .annotate(balance=F("income") - F("expense"))
         .order_by("hotel__name")
@@ -198,8 +130,8 @@ def unified_report(request):
 
     # Свод по статьям (по сети)
     by_articles = (
-        ops.values("article__kind", "article__name")
-        .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
+        rollup.values("article__kind", "article__name")
+        .annotate(total=Coalesce(Sum("total"), Decimal("0.00")))
         .order_by("article__kind", "-total")
     )
 
@@ -225,181 +157,49 @@ def _day_range(date_obj):
     return start, end
 
 
-def _user_hotels_qs(user):
-    # TODO: адаптируй под свою систему ролей
-    if user.is_superuser or getattr(user, "is_finance_admin", False):
-        return Hotel.objects.filter(is_active=True)
-    # пример: профиль пользователя хранит отель
-    hotel = getattr(getattr(user, "profile", None), "hotel", None)
-    return Hotel.objects.filter(id=hotel.id, is_active=True) if hotel else Hotel.objects.none()
-
-
-
-@login_required
-def dds_dashboard(request):
-    hotels_qs = _user_hotels_qs(request.user)
-
-    hotel_id = request.GET.get("hotel") or ""
-    selected_hotel = None
-    if hotel_id:
-        selected_hotel = get_object_or_404(hotels_qs, id=hotel_id)
-
-    date_from = _parse_date(request.GET.get("date_from", ""))
-    date_to = _parse_date(request.GET.get("date_to", ""))
-
-    ops = (
-        DDSOperation.objects
-        .select_related("hotel", "article", "article__category", "article__category__parent")
-        .filter(is_voided=False)
-    )
-
-    ops = ops.filter(hotel=selected_hotel) if selected_hotel else ops.filter(hotel__in=hotels_qs)
-
-    if date_from:
-        start, _ = _day_range(date_from)
-        ops = ops.filter(happened_at__gte=start)
-    if date_to:
-        _, end = _day_range(date_to)
-        ops = ops.filter(happened_at__lte=end)
-
+def _dashboard_aggregates(rollup):
+    """
+    Все агрегаты дашборда ДДС по уже отфильтрованному дневному своду (DDSDailyRollup).
+    Результат кладём в кэш (dds.cache), поэтому только простые типы — без lambda/defaultdict.
+    """
     # =========================================================
     # Инкассация: НЕ показываем в графиках (и у тебя она ещё убрана из expense_sum)
     # =========================================================
-    incasso_cut = Q(article__kind=DDSArticle.EXPENSE) & (
-        Q(source__iexact="incasso") | Q(article__name__iexact="Инкассация")
-    )
-    ops_for_charts = ops.exclude(incasso_cut)
+    ops_for_charts = rollup.exclude(INCASSO_Q)
+
+    # итоги и таблицы категорий — одним сводным запросом (dds.pivot)
+    pivot = DDSPivot.for_rollup(rollup)
 
     # -----------------------------
     # Итоги
     # -----------------------------
-    income_sum = ops.filter(article__kind=DDSArticle.INCOME).aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
+    income_sum = pivot.total(DDSArticle.INCOME)
 
     # ВАЖНО: сейчас расходы считаются БЕЗ инкассации (как ты и сделал)
-    expense_sum = ops_for_charts.filter(article__kind=DDSArticle.EXPENSE).aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
+    expense_sum = pivot.total(DDSArticle.EXPENSE, exclude_incasso=True)
 
     balance = income_sum - expense_sum
 
     # -----------------------------
     # Методы (счет)
     # -----------------------------
-    methods = [DDSOperation.CASH, DDSOperation.MKASSA, DDSOperation.ZADATOK, DDSOperation.OPTIMA]
+    methods = PIVOT_METHODS
     method_labels = dict(DDSOperation.METHOD_CHOICES)
     method_headers = [{"code": m, "label": method_labels.get(m, m)} for m in methods]
 
     # =========================================================
     # 1) Таблицы: категории -> подкатегории + разбивка по методам
-    # (таблицы строим по ops — инкассация там будет, если не хочешь, скажи)
     # =========================================================
-    rows_qs = (
-    ops_for_charts.values(
-        "article__kind",
-        "method",
-        "article__category_id",
-        "article__category__name",
-        "article__category__parent_id",
-        "article__category__parent__name",
-    )
-    .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
-)
-
-    rows = list(rows_qs)  # чтобы 2 раза не гонять один и тот же запрос
-
-    def build_groups(kind: str):
-        groups_map = {}
-        uncat_by_method = defaultdict(lambda: Decimal("0.00"))
-
-        for r in rows:
-            if r["article__kind"] != kind:
-                continue
-
-            m = r["method"]
-            total = r["total"] or Decimal("0.00")
-
-            cat_id = r["article__category_id"]
-            cat_name = r["article__category__name"]
-            parent_id = r["article__category__parent_id"]
-            parent_name = r["article__category__parent__name"]
-
-            if not cat_id:
-                uncat_by_method[m] += total
-                continue
-
-            if parent_id:
-                group_id = parent_id
-                group_name = parent_name or "Без названия"
-                sub_id = cat_id
-                sub_name = cat_name or "Без названия"
-            else:
-                group_id = cat_id
-                group_name = cat_name or "Без названия"
-                sub_id = None
-                sub_name = None
-
-            g = groups_map.get(group_id)
-            if not g:
-                g = {
-                    "id": group_id,
-                    "name": group_name,
-                    "total": Decimal("0.00"),
-                    "by_method": defaultdict(lambda: Decimal("0.00")),
-                    "subs_map": {},
-                }
-                groups_map[group_id] = g
-
-            g["total"] += total
-            g["by_method"][m] += total
-
-            if sub_id:
-                s = g["subs_map"].get(sub_id)
-                if not s:
-                    s = {
-                        "id": sub_id,
-                        "name": sub_name,
-                        "total": Decimal("0.00"),
-                        "by_method": defaultdict(lambda: Decimal("0.00")),
-                    }
-                    g["subs_map"][sub_id] = s
-                s["total"] += total
-                s["by_method"][m] += total
-
-        groups_list = []
-        for g in groups_map.values():
-            subs_list = sorted(g["subs_map"].values(), key=lambda x: (x["name"] or "").lower())
-            for s in subs_list:
-                s["method_totals"] = [s["by_method"][mm] for mm in methods]
-
-            groups_list.append({
-                "name": g["name"],
-                "total": g["total"],
-                "method_totals": [g["by_method"][mm] for mm in methods],
-                "subs": subs_list,
-            })
-
-        groups_list.sort(key=lambda x: (x["name"] or "").lower())
-
-        uncat = {
-            "total": sum(uncat_by_method.values(), Decimal("0.00")),
-            "method_totals": [uncat_by_method[mm] for mm in methods],
-        }
-        return groups_list, uncat
-
-    income_groups, income_uncat = build_groups(DDSArticle.INCOME)
-    expense_groups, expense_uncat = build_groups(DDSArticle.EXPENSE)
+    income_groups, income_uncat = pivot.category_groups(DDSArticle.INCOME, exclude_incasso=True)
+    expense_groups, expense_uncat = pivot.category_groups(DDSArticle.EXPENSE, exclude_incasso=True)
 
     # =========================================================
     # 2) Графики: по дням + stack по методам (по ops_for_charts)
     # =========================================================
-    tz = timezone.get_current_timezone()
     day_rows_qs = (
         ops_for_charts
-        .annotate(day=TruncDate("happened_at", tzinfo=tz))
-        .values("day", "article__kind", "method")
-        .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
+        .values("day", "kind", "method")
+        .annotate(total=Coalesce(Sum("total"), Decimal("0.00")))
         .order_by("day")
     )
     day_rows = list(day_rows_qs)
@@ -415,7 +215,7 @@ def dds_dashboard(request):
         d = r["day"]
         if not d:
             continue
-        kind = r["article__kind"]
+        kind = r["kind"]
         m = r["method"]
         if kind in grid and m in grid[kind]:
             grid[kind][m][d] += (r["total"] or Decimal("0.00"))
@@ -436,37 +236,8 @@ def dds_dashboard(request):
     # 3) Расходы: % по категориям (bar) + pie TOP N (+ Другое)
     #    тоже по ops_for_charts (инкассации там нет)
     # =========================================================
-    expense_cat_rows_qs = (
-        ops_for_charts.filter(article__kind=DDSArticle.EXPENSE)
-        .values(
-            "article__category_id",
-            "article__category__name",
-            "article__category__parent_id",
-            "article__category__parent__name",
-        )
-        .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
-    )
-    expense_cat_rows = list(expense_cat_rows_qs)
-
-    cat_totals = defaultdict(lambda: Decimal("0.00"))
-    for r in expense_cat_rows:
-        total = r["total"] or Decimal("0.00")
-
-        if not r["article__category_id"]:
-            group_name = "Без категории"
-        else:
-            parent_id = r["article__category__parent_id"]
-            parent_name = r["article__category__parent__name"]
-            cat_name = r["article__category__name"]
-            group_name = (parent_name if parent_id else cat_name) or "Без категории"
-
-        cat_totals[group_name] += total
-
-    cat_sorted = sorted(cat_totals.items(), key=lambda x: x[1], reverse=True)
-    grand_total = sum(cat_totals.values(), Decimal("0.00"))
-
-
-
+    cat_sorted = pivot.top_category_totals(DDSArticle.EXPENSE, exclude_incasso=True)
+    grand_total = sum((total for _, total in cat_sorted), Decimal("0.00"))
 
     expense_cat_percent = {"labels": [], "percent": [], "amounts": [], "grand_total": 0.0}
 
@@ -504,31 +275,8 @@ def dds_dashboard(request):
         "data": pie_data,
         "grand_total": float(grand_total),  # важно для tooltip в твоём JS
     }
-    profile = getattr(request.user, "profile", None)
-    if not (request.user.is_superuser or (profile and profile.is_finance_admin)):
-        return redirect("dds:dds_dashboard")
-
-    hotels = user_hotels_qs(request.user).order_by("name")
-
-    hotel_id = request.GET.get("hotel")
-    date_from = _parse_date(request.GET.get("date_from", ""))
-    date_to = _parse_date(request.GET.get("date_to", ""))
-
-    # фильтр по отелю
-    hotels_filter = hotels
-    if hotel_id:
-        hotels_filter = hotels.filter(id=hotel_id)
 
-    
-
-    # 2) ИНКАССАЦИИ
-    incassos = CashIncasso.objects.select_related("hotel").filter(hotel__in=hotels_filter)
-    return render(request, "dds/dashboard.html", {
-        "hotels": hotels_qs,
-        "selected_hotel": selected_hotel,
-        "date_from": date_from,
-        "date_to": date_to,
-        "incassos": incassos.order_by("-happened_at")[:300], 
+    return {
         "income_sum": income_sum,
         "expense_sum": expense_sum,
         "balance": balance,
@@ -545,14 +293,57 @@ def dds_dashboard(request):
 
         "expense_cat_percent": expense_cat_percent,
         "expense_cat_share": expense_cat_share,
+    }
+
+
+@login_required
+def dds_dashboard(request):
+    scope = get_scope(request)
+
+    hotel_id = request.GET.get("hotel") or ""
+    selected_hotel = None
+    if hotel_id:
+        selected_hotel = scope.get_hotel(hotel_id)
+
+    date_from = _parse_date(request.GET.get("date_from", ""))
+    date_to = _parse_date(request.GET.get("date_to", ""))
+
+    # суммы — из дневного свода (DDSDailyRollup), а не по сырым операциям
+    if selected_hotel:
+        rollup = rollup_qs(hotel=selected_hotel, date_from=date_from, date_to=date_to)
+    else:
+        rollup = rollup_qs(hotels=scope.ids, date_from=date_from, date_to=date_to)
+
+    # агрегаты — из кэша (ключ: отели + период + версии данных отелей)
+    cache_hotel_ids = [selected_hotel.id] if selected_hotel else scope.ids
+    agg = cached_for_hotels(
+        "dashboard",
+        cache_hotel_ids,
+        {"date_from": date_from, "date_to": date_to},
+        lambda: _dashboard_aggregates(rollup),
+    )
+
+    # ИНКАССАЦИИ — по тем же отелям, что и суммы
+    incassos = CashIncasso.objects.select_related("hotel").filter(hotel_id__in=cache_hotel_ids)
+    return render(request, "dds/dashboard.html", {
+        "hotels": scope.hotels(),
+        "selected_hotel": selected_hotel,
+        "date_from": date_from,
+        "date_to": date_to,
+        "incassos": incassos.order_by("-happened_at")[:300], 
+        **agg,
     })
 
 
 @login_required
 def dds_list(request):
-    hotels_qs = _user_hotels_qs(request.user)
+    scope = get_scope(request)
 
-    ops = DDSOperation.objects.select_related("hotel", "article").filter(hotel__in=hotels_qs)
+    # только колонки, которые рисует реестр
+    ops = DDSOperation.objects.select_related("hotel", "article").only(
+        "happened_at", "amount", "method", "comment", "is_voided",
+        "hotel__name", "article__name", "article__kind",
+    ).filter(hotel_id__in=scope.ids)
 
     hotel_id = request.GET.get("hotel")
     kind = request.GET.get("kind")  # income/expense
@@ -579,8 +370,8 @@ def dds_list(request):
         request,
         "dds/operation_list.html",
         {
-            "ops": ops[:500],  # на MVP
-            "hotels": hotels_qs,
+            "page": paginate(request, ops),
+            "hotels": scope.hotels(),
             "articles": articles,
             "filters": {"hotel": hotel_id, "kind": kind, "article": article_id, "date_from": date_from, "date_to": date_to},
         },
@@ -603,8 +394,7 @@ def _is_rooms_income(op) -> bool:
 
 @login_required
 def dds_op_add(request, hotel_id: int, kind: str):
-    hotels = user_hotels_qs(request.user)
-    hotel = get_object_or_404(hotels, id=hotel_id)
+    hotel = get_scope(request).get_hotel(hotel_id)
 
     register, _ = CashRegister.objects.get_or_create(hotel=hotel)
 
@@ -703,20 +493,21 @@ def dds_op_add(request, hotel_id: int, kind: str):
 
 @login_required
 def dds_create(request):
-    hotels_qs = user_hotels_qs(request.user)
-    if not hotels_qs.exists():
+    scope = get_scope(request)
+    if not scope:
         messages.error(request, "У вас не назначен отель. Обратитесь к администратору.")
         return redirect("dds:dds_list")
+    hotels_qs = scope.hotels()
 
-    only_hotel = hotels_qs.first() if hotels_qs.count() == 1 else None
+    only_hotel = scope.get_hotel(scope.single_id) if scope.single_id else None
 
     selected_hotel = None
     if only_hotel:
         selected_hotel = only_hotel
     else:
         hotel_id = request.POST.get("hotel") if request.method == "POST" else request.GET.get("hotel")
-        if hotel_id and hotels_qs.filter(id=hotel_id).exists():
-            selected_hotel = hotels_qs.get(id=hotel_id)
+        if hotel_id in scope:
+            selected_hotel = scope.get_hotel(hotel_id)
 
     kind = request.GET.get("kind") or request.POST.get("kind")
     if kind not in (DDSArticle.INCOME, DDSArticle.EXPENSE):
@@ -782,8 +573,7 @@ def dds_create(request):
 
 @login_required
 def dds_void(request, pk):
-    hotels_qs = _user_hotels_qs(request.user)
-    op = get_object_or_404(DDSOperation, pk=pk, hotel__in=hotels_qs)
+    op = get_object_or_404(DDSOperation, pk=pk, hotel_id__in=get_scope(request).ids)
 
     if request.method == "POST":
         reason = (request.POST.get("reason") or "").strip()
@@ -800,7 +590,7 @@ def dds_void(request, pk):
 @login_required
 def dds_articles(request):
     # TODO: доступ только бухгалтеру/админу
-    if not (request.user.is_superuser or getattr(request.user, "is_finance_admin", False)):
+    if not get_scope(request).is_finance_admin:
         return redirect("dds:dds_dashboard")
 
     if request.method == "POST":
@@ -822,10 +612,11 @@ def dds_articles(request):
 @login_required
 def hotel_catalog(request):
     # каталог менять/добавлять — только админ/финанс
-    is_fin_admin = request.user.is_superuser or getattr(getattr(request.user, "profile", None), "is_finance_admin", False)
+    scope = get_scope(request)
+    is_fin_admin = scope.is_finance_admin
 
-    # что показываем:
-    hotels = Hotel.objects.all().order_by("name") if is_fin_admin else user_hotels_qs(request.user).order_by("name")
+    # что показываем (админу — и выключенные отели):
+    hotels = Hotel.objects.all().order_by("name") if is_fin_admin else scope.hotels().order_by("name")
 
     form = None
     if is_fin_admin:
@@ -842,10 +633,11 @@ def hotel_catalog(request):
 
 @login_required
 def hotel_list(request):
-    hotels = list(user_hotels_qs(request.user).order_by("name"))
+    scope = get_scope(request)
+    hotels = list(scope.hotels().order_by("name"))
 
     # Берём кассы одним запросом и мапим по hotel_id
-    registers_by_hotel = CashRegister.objects.filter(hotel__in=hotels).in_bulk(field_name="hotel_id")
+    registers_by_hotel = CashRegister.objects.filter(hotel_id__in=scope.ids).in_bulk(field_name="hotel_id")
 
     # приклеиваем register к каждому отелю (может быть None)
     for h in hotels:
@@ -856,8 +648,7 @@ def hotel_list(request):
 
 @login_required
 def hotel_detail(request, pk):
-    hotels_qs = user_hotels_qs(request.user)
-    hotel = get_object_or_404(hotels_qs, pk=pk)
+    hotel = get_scope(request).get_hotel(pk)
 
     reg, _ = CashRegister.objects.get_or_create(hotel=hotel)
 
@@ -881,131 +672,46 @@ def hotel_detail(request, pk):
         _, end = _day_range(date_to)
         ops = ops.filter(happened_at__lte=end)
 
-    # ✅ Итоги ДДС за период
-    income_total = ops.filter(article__kind=DDSArticle.INCOME).aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
+    # суммы — из дневного свода, сырые операции нужны только для списка последних
+    rollup = rollup_qs(hotel=hotel, date_from=date_from, date_to=date_to)
 
-    expense_total = ops.filter(article__kind=DDSArticle.EXPENSE).aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
+    # все суммы страницы — одним сводным запросом (dds.pivot)
+    pivot = DDSPivot.for_rollup(rollup)
 
+    # ✅ Итоги ДДС за период
+    income_total = pivot.total(DDSArticle.INCOME)
+    expense_total = pivot.total(DDSArticle.EXPENSE)
     balance = income_total - expense_total
 
     # ✅ Доход с номеров
-    rooms_q = (
-        Q(source__iexact="rooms") |
-        Q(source__icontains="room") |
-        Q(article__name__icontains="номер") |
-        Q(article__name__icontains="прожив") |
-        Q(article__name__icontains="комнат")
-    )
-    rooms_ops = ops.filter(article__kind=DDSArticle.INCOME).filter(rooms_q)
-
-    rooms_income_total = rooms_ops.aggregate(
-        s=Coalesce(Sum("amount"), Decimal("0.00"))
-    )["s"]
+    rooms_income_total = pivot.rooms_total()
 
-    tz = timezone.get_current_timezone()
     rooms_by_day = (
-        rooms_ops
-        .annotate(day=TruncDate("happened_at", tzinfo=tz))
+        rollup.filter(ROOMS_Q)
         .values("day")
-        .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
+        .annotate(total=Coalesce(Sum("total"), Decimal("0.00")))
         .order_by("day")
     )
 
     last_ops = ops.order_by("-happened_at")[:50]
 
     # ✅ ДДС по счетам за период (как у тебя)
-    methods = [DDSOperation.CASH, DDSOperation.MKASSA, DDSOperation.ZADATOK, DDSOperation.OPTIMA]
-    method_labels = dict(DDSOperation.METHOD_CHOICES)
-
-    period_rows = []
-    for m in methods:
-        inc = ops.filter(article__kind=DDSArticle.INCOME, method=m).aggregate(
-            s=Coalesce(Sum("amount"), Decimal("0.00"))
-        )["s"]
-        exp = ops.filter(article__kind=DDSArticle.EXPENSE, method=m).aggregate(
-            s=Coalesce(Sum("amount"), Decimal("0.00"))
-        )["s"]
-        period_rows.append({
-            "code": m,
-            "label": method_labels.get(m, m),
-            "income": inc,
-            "expense": exp,
-            "delta": inc - exp,
-        })
+    period_rows = pivot.method_rows()
 
     # ==========================================================
     # ✅ НОВОЕ: Доходы/Расходы по категориям и подкатегориям
     # ==========================================================
-    def build_cat_groups(kind: str):
-        """
-        Возвращает:
-          groups: [
-            {id, name, total, subs:[{id,name,total}, ...]},
-            ...
-          ]
-          uncategorized_total: Decimal
-        """
-        rows = (
-            ops.filter(article__kind=kind)
-            .values(
-                "article__category_id",
-                "article__category__name",
-                "article__category__parent_id",
-                "article__category__parent__name",
-            )
-            .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
-        )
-
-        # group_id = parent_id если есть, иначе category_id (верхний уровень)
-        groups = {}  # group_id -> dict
-        uncategorized_total = Decimal("0.00")
-
-        for r in rows:
-            cat_id = r["article__category_id"]
-            cat_name = r["article__category__name"]
-            parent_id = r["article__category__parent_id"]
-            parent_name = r["article__category__parent__name"]
-            total = r["total"] or Decimal("0.00")
-
-            if not cat_id:
-                uncategorized_total += total
-                continue
-
-            if parent_id:
-                # подкатегория -> складываем в родителя
-                group_id = parent_id
-                group_name = parent_name or "Без названия"
-                g = groups.get(group_id)
-                if not g:
-                    g = {"id": group_id, "name": group_name, "total": Decimal("0.00"), "subs": []}
-                    groups[group_id] = g
-
-                g["subs"].append({"id": cat_id, "name": cat_name or "Без названия", "total": total})
-                g["total"] += total
-            else:
-                # верхняя категория
-                group_id = cat_id
-                group_name = cat_name or "Без названия"
-                g = groups.get(group_id)
-                if not g:
-                    g = {"id": group_id, "name": group_name, "total": Decimal("0.00"), "subs": []}
-                    groups[group_id] = g
-                # если операции записаны прямо на верхнюю категорию — добавляем в total
-                g["total"] += total
-
-        # сортировка
-        groups_list = sorted(groups.values(), key=lambda x: (x["name"] or "").lower())
-        for g in groups_list:
-            g["subs"] = sorted(g["subs"], key=lambda x: (x["name"] or "").lower())
-
-        return groups_list, uncategorized_total
-
-    income_groups, income_uncat = build_cat_groups(DDSArticle.INCOME)
-    expense_groups, expense_uncat = build_cat_groups(DDSArticle.EXPENSE)
+    income_groups, income_uncat = pivot.category_groups(DDSArticle.INCOME)
+    expense_groups, expense_uncat = pivot.category_groups(DDSArticle.EXPENSE)
+
+    # ✅ Остатки счетов на момент (?as_of=)
+    as_of = _parse_as_of(request.GET.get("as_of", ""))
+    as_of_rows, as_of_total = [], None
+    if as_of:
+        labels = dict(CashMovement.ACCOUNT_CHOICES)
+        balances = balances_as_of(hotel, as_of)
+        as_of_rows = [{"code": acc, "label": labels.get(acc, acc), "balance": bal} for acc, bal in balances.items()]
+        as_of_total = sum(balances.values(), Decimal("0.00"))
 
     return render(request, "dds/hotel_detail.html", {
         "hotel": hotel,
@@ -1030,11 +736,16 @@ def hotel_detail(request, pk):
         # последние операции
         "last_ops": last_ops,
 
+        # остатки на момент
+        "as_of": as_of,
+        "as_of_rows": as_of_rows,
+        "as_of_total": as_of_total,
+
         # ✅ категории/подкатегории
         "income_groups": income_groups,
-        "income_uncat": income_uncat,
+        "income_uncat": income_uncat["total"],
         "expense_groups": expense_groups,
-        "expense_uncat": expense_uncat,
+        "expense_uncat": expense_uncat["total"],
     })
 
 
@@ -1043,117 +754,23 @@ def hotel_detail(request, pk):
 @login_required
 def unified_report_export_excel(request):
     # ✅ доступ только superuser/finance_admin
-    profile = getattr(request.user, "profile", None)
-    if not (request.user.is_superuser or (profile and profile.is_finance_admin)):
+    scope = get_scope(request)
+    if not scope.is_finance_admin:
         return redirect("dds:dds_dashboard")
 
-    hotels_qs = user_hotels_qs(request.user)
-
     date_from = _parse_date(request.GET.get("date_from", ""))
     date_to = _parse_date(request.GET.get("date_to", ""))
 
-    ops = DDSOperation.objects.select_related("hotel", "article").filter(
-        is_voided=False,
-        hotel__in=hotels_qs,
-    )
-
-    if date_from:
-        start, _ = _day_range(date_from)
-        ops = ops.filter(happened_at__gte=start)
-    if date_to:
-        _, end = _day_range(date_to)
-        ops = ops.filter(happened_at__lte=end)
-
-    # ✅ Свод по отелям
-    by_hotels = (
-        ops.values("hotel_id", "hotel__name")
-        .annotate(
-            income=Coalesce(Sum("amount", filter=Q(article__kind=DDSArticle.INCOME)), Decimal("0.00")),
-            expense=Coalesce(Sum("amount", filter=Q(article__kind=DDSArticle.EXPENSE)), Decimal("0.00")),
-        )
-        .annotate(balance=F("income") - F("expense"))
-        .order_by("hotel__name")
+    job, _ = request_export(
+        kind=ExportJob.UNIFIED_REPORT, user=request.user,
+        hotel_ids=scope.ids, date_from=date_from, date_to=date_to,
     )
-
-    total_income = sum((x["income"] for x in by_hotels), Decimal("0.00"))
-    total_expense = sum((x["expense"] for x in by_hotels), Decimal("0.00"))
-    total_balance = total_income - total_expense
-
-    # ✅ Свод по статьям (по сети)
-    by_articles = (
-        ops.values("article__kind", "article__name")
-        .annotate(total=Coalesce(Sum("amount"), Decimal("0.00")))
-        .order_by("article__kind", "-total", "article__name")
-    )
-
-    # --- Excel ---
-    wb = Workbook()
-    header_font = Font(bold=True)
-
-    # Лист 1: Итоги
-    ws1 = wb.active
-    ws1.title = "Итоги"
-    ws1["A1"] = "Отчет"; ws1["B1"] = "Единый отчет по сети (ДДС)"
-    ws1["A2"] = "Период"; ws1["B2"] = f"{date_from or '—'} → {date_to or '—'}"
-    ws1["A4"] = "Итого приход"; ws1["B4"] = float(total_income)
-    ws1["A5"] = "Итого расход"; ws1["B5"] = float(total_expense)
-    ws1["A6"] = "Итого остаток"; ws1["B6"] = float(total_balance)
-
-    for cell in ("A1", "A2", "A4", "A5", "A6"):
-        ws1[cell].font = header_font
-
-    ws1.column_dimensions["A"].width = 18
-    ws1.column_dimensions["B"].width = 40
-
-    # Лист 2: По отелям
-    ws2 = wb.create_sheet("По отелям")
-    ws2.append(["Отель", "Приход", "Расход", "Остаток"])
-    for c in range(1, 5):
-        ws2.cell(row=1, column=c).font = header_font
-
-    for r in by_hotels:
-        ws2.append([
-            r["hotel__name"],
-            float(r["income"]),
-            float(r["expense"]),
-            float(r["balance"]),
-        ])
-
-    ws2.column_dimensions["A"].width = 30
-    ws2.column_dimensions["B"].width = 14
-    ws2.column_dimensions["C"].width = 14
-    ws2.column_dimensions["D"].width = 14
-
-    # Лист 3: По статьям
-    ws3 = wb.create_sheet("По статьям")
-    ws3.append(["Тип", "Статья", "Сумма"])
-    for c in range(1, 4):
-        ws3.cell(row=1, column=c).font = header_font
-
-    for r in by_articles:
-        ws3.append([
-            "Доход" if r["article__kind"] == DDSArticle.INCOME else "Расход",
-            r["article__name"],
-            float(r["total"]),
-        ])
-
-    ws3.column_dimensions["A"].width = 10
-    ws3.column_dimensions["B"].width = 35
-    ws3.column_dimensions["C"].width = 14
-
-    filename = "akcha_hotel_unified_report.xlsx"
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
+    return redirect("dds:export_job", pk=job.pk)
 
 
 @login_required
 def incasso_create(request, pk):
-    hotels_qs = user_hotels_qs(request.user)
-    hotel = get_object_or_404(hotels_qs, pk=pk)
+    hotel = get_scope(request).get_hotel(pk)
 
     reg, _ = CashRegister.objects.get_or_create(hotel=hotel)
 
@@ -1225,30 +842,30 @@ def incasso_create(request, pk):
 
 @login_required
 def accounting(request):
-    profile = getattr(request.user, "profile", None)
-    if not (request.user.is_superuser or (profile and profile.is_finance_admin)):
+    scope = get_scope(request)
+    if not scope.is_finance_admin:
         return redirect("dds:dds_dashboard")
 
-    hotels = user_hotels_qs(request.user).order_by("name")
-
     hotel_id = request.GET.get("hotel")
     date_from = _parse_date(request.GET.get("date_from", ""))
     date_to = _parse_date(request.GET.get("date_to", ""))
 
     # фильтр по отелю
-    hotels_filter = hotels
+    hotels_filter = scope.ids
     if hotel_id:
-        hotels_filter = hotels.filter(id=hotel_id)
+        hotels_filter = (int(hotel_id),) if hotel_id in scope else ()
 
     # 1) РАСХОДЫ (не инкассация!)
-    expenses = DDSOperation.objects.select_related("hotel", "article").filter(
+    expenses = DDSOperation.objects.select_related("hotel", "article").only(
+        "happened_at", "amount", "hotel__name", "article__name",
+    ).filter(
         is_voided=False,
-        hotel__in=hotels_filter,
+        hotel_id__in=hotels_filter,
         article__kind=DDSArticle.EXPENSE,
     ).exclude(source="incasso")
 
     # 2) ИНКАССАЦИИ
-    incassos = CashIncasso.objects.select_related("hotel").filter(hotel__in=hotels_filter)
+    incassos = CashIncasso.objects.select_related("hotel").filter(hotel_id__in=hotels_filter)
 
     # фильтр по датам
     if date_from:
@@ -1260,16 +877,21 @@ def accounting(request):
         expenses = expenses.filter(happened_at__lte=end)
         incassos = incassos.filter(happened_at__lte=end)
 
-    expense_total = expenses.aggregate(s=Coalesce(Sum("amount"), Decimal("0.00")))["s"]
+    expense_total = (
+        rollup_qs(hotels=hotels_filter, date_from=date_from, date_to=date_to)
+        .filter(kind=DDSArticle.EXPENSE)
+        .exclude(source_group=DDSDailyRollup.SRC_INCASSO)
+        .aggregate(s=Coalesce(Sum("total"), Decimal("0.00")))["s"]
+    )
     incasso_total = incassos.aggregate(s=Coalesce(Sum("amount"), Decimal("0.00")))["s"]
 
     return render(request, "dds/accounting.html", {
-        "hotels": hotels,
+        "hotels": scope.hotels().order_by("name"),
         "selected_hotel": hotel_id,
         "date_from": date_from,
         "date_to": date_to,
-        "expenses": expenses.order_by("-happened_at")[:300],
-        "incassos": incassos.order_by("-happened_at")[:300],
+        "expenses": paginate(request, expenses, param="exp_cursor"),
+        "incassos": paginate(request, incassos, param="inc_cursor"),
         "expense_total": expense_total,
         "incasso_total": incasso_total,
     })
@@ -1277,89 +899,48 @@ def accounting(request):
 
 @login_required
 def accounting_export_excel(request):
-    profile = getattr(request.user, "profile", None)
-    if not (request.user.is_superuser or (profile and profile.is_finance_admin)):
+    scope = get_scope(request)
+    if not scope.is_finance_admin:
         return redirect("dds:dds_dashboard")
 
-    hotels = user_hotels_qs(request.user)
-
     hotel_id = request.GET.get("hotel")
     date_from = _parse_date(request.GET.get("date_from", ""))
     date_to = _parse_date(request.GET.get("date_to", ""))
 
-    hotels_filter = hotels
+    hotels_filter = scope.ids
     if hotel_id:
-        hotels_filter = hotels.filter(id=hotel_id)
+        hotels_filter = (int(hotel_id),) if hotel_id in scope else ()
 
-    expenses = DDSOperation.objects.select_related("hotel", "article").filter(
-        is_voided=False,
-        hotel__in=hotels_filter,
-        article__kind=DDSArticle.EXPENSE,
-    ).exclude(source="incasso")
+    job, _ = request_export(
+        kind=ExportJob.ACCOUNTING, user=request.user,
+        hotel_ids=hotels_filter, date_from=date_from, date_to=date_to,
+        hotel_label=hotel_id or "Все",
+    )
+    return redirect("dds:export_job", pk=job.pk)
 
-    incassos = CashIncasso.objects.select_related("hotel").filter(hotel__in=hotels_filter)
 
-    if date_from:
-        start, _ = _day_range(date_from)
-        expenses = expenses.filter(happened_at__gte=start)
-        incassos = incassos.filter(happened_at__gte=start)
-    if date_to:
-        _, end = _day_range(date_to)
-        expenses = expenses.filter(happened_at__lte=end)
-        incassos = incassos.filter(happened_at__lte=end)
+def _can_see_export(scope, job) -> bool:
+    """Файл может взять любой, кому доступны все отели выгрузки (и отчёт, если он финансовый)."""
+    if job.kind != ExportJob.HOTEL_DETAIL and not scope.is_finance_admin:
+        return False
+    return all(hotel_id in scope for hotel_id in job.params.get("hotel_ids", []))
+
 
-    wb = Workbook()
-    header_font = Font(bold=True)
-
-    ws1 = wb.active
-    ws1.title = "Итоги"
-    ws1["A1"] = "Период"; ws1["B1"] = f"{date_from or '—'} → {date_to or '—'}"
-    ws1["A2"] = "Фильтр отеля"; ws1["B2"] = hotel_id or "Все"
-
-    exp_total = expenses.aggregate(s=Coalesce(Sum("amount"), Decimal("0.00")))["s"]
-    inc_total = incassos.aggregate(s=Coalesce(Sum("amount"), Decimal("0.00")))["s"]
-
-    ws1["A4"] = "Расходы (без инкассации)"; ws1["B4"] = float(exp_total)
-    ws1["A5"] = "Инкассации"; ws1["B5"] = float(inc_total)
-
-    for c in ("A1","A2","A4","A5"):
-        ws1[c].font = header_font
-
-    ws2 = wb.create_sheet("Расходы")
-    ws2.append(["Дата", "Отель", "Статья", "Способ", "Сумма", "Контрагент", "Комментарий"])
-    for i in range(1, 8):
-        ws2.cell(row=1, column=i).font = header_font
-
-    for op in expenses.order_by("happened_at"):
-        ws2.append([
-            op.happened_at.strftime("%Y-%m-%d %H:%M"),
-            op.hotel.name,
-            op.article.name,
-            op.get_method_display(),
-            float(op.amount),
-            op.counterparty or "",
-            (op.comment or "")[:500],
-        ])
-
-    ws3 = wb.create_sheet("Инкассации")
-    ws3.append(["Дата", "Отель", "Способ", "Сумма", "Комментарий", "Создал"])
-    for i in range(1, 7):
-        ws3.cell(row=1, column=i).font = header_font
-
-    for inc in incassos.order_by("happened_at"):
-        ws3.append([
-            inc.happened_at.strftime("%Y-%m-%d %H:%M"),
-            inc.hotel.name,
-            inc.get_method_display(),
-            float(inc.amount),
-            (inc.comment or "")[:500],
-            getattr(inc.created_by, "username", ""),
-        ])
-
-    filename = "akcha_hotel_accounting.xlsx"
-    response = HttpResponse(
-        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+@login_required
+def export_job(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk)
+    if not _can_see_export(get_scope(request), job):
+        return redirect("dds:dds_dashboard")
+    return render(request, "dds/export_job.html", {"job": job})
+
+
+@login_required
+def export_download(request, pk):
+    job = get_object_or_404(ExportJob, pk=pk, status=ExportJob.DONE)
+    if not _can_see_export(get_scope(request), job) or not job.file:
+        raise Http404
+    return FileResponse(
+        job.file.open("rb"), as_attachment=True,
+        filename=job.filename or os.path.basename(job.file.name),
+        content_type=XLSX_CONTENT_TYPE,
     )
-    response["Content-Disposition"] = f'attachment; filename="{filename}"'
-    wb.save(response)
-    return response
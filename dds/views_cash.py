@@ -10,15 +10,11 @@ from django.utils import timezone
 from .forms import DDSQuickOpForm
 from .models import Hotel, CashRegister, CashMovement, DDSOperation, DDSArticle
 from .forms import DDSOpCreateForm
-from .utils import user_hotels_qs
+from .catalog import get_catalog
+from .scope import get_scope
 from django.shortcuts import get_object_or_404, redirect, render
 from .forms import CashTransferForm
 from .services import create_cash_transfer
-try:
-    from dds.utils import _user_hotels_qs
-except Exception:
-    def _user_hotels_qs(user):
-        return Hotel.objects.filter(is_active=True)
 from .models import Hotel, CashRegister, CashMovement, CashTransfer
 from .forms import CashTransferForm, _balances_dict
 from django import forms
@@ -29,7 +25,6 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.http import JsonResponse
 from .forms import DDSOpForm
 
-from .utils import user_hotels_qs
 
 # dds/views.py
 from django.contrib.auth.decorators import login_required
@@ -39,15 +34,9 @@ from django.contrib.auth.decorators import login_required
 from django.core.exceptions import ValidationError
 from django.db import transaction, IntegrityError
 
-from .cash_services import apply_cash_movement, FIELD_MAP
+from .cash_services import apply_cash_movement, post_cash_movements, FIELD_MAP
 from dds.cash_services import transfer_between_accounts, CashTransferError
 
-try:
-    from dds.utils import _user_hotels_qs
-except Exception:
-    def _user_hotels_qs(user):
-        return Hotel.objects.filter(is_active=True)
-
 class TransferForm(forms.Form):
     from_account = forms.ChoiceField(choices=CashMovement.ACCOUNT_CHOICES, label="Со счета")
     to_account = forms.ChoiceField(choices=CashMovement.ACCOUNT_CHOICES, label="На счет")
@@ -64,12 +53,8 @@ class TransferForm(forms.Form):
 
 @login_required
 def transfer_create(request):
-    hotels = _user_hotels_qs(request.user)
-    hotel_id = request.GET.get("hotel") or ""
-    if hotel_id:
-        hotel = get_object_or_404(hotels, id=hotel_id)
-    else:
-        hotel = hotels.first()
+    scope = get_scope(request)
+    hotel = scope.selected_or_first(request.GET.get("hotel") or "")
 
     if not hotel:
         messages.error(request, "Нет доступных отелей.")
@@ -95,7 +80,7 @@ def transfer_create(request):
     else:
         form = TransferForm(initial={"happened_at": timezone.now()})
 
-    return render(request, "dds/transfer_form.html", {"form": form, "hotel": hotel, "hotels": hotels})
+    return render(request, "dds/transfer_form.html", {"form": form, "hotel": hotel, "hotels": scope.hotels()})
 
 
 
@@ -103,72 +88,53 @@ def transfer_create(request):
 
 @login_required
 def cash_transfer_create(request, hotel_id: int):
-    hotel = get_object_or_404(Hotel, id=hotel_id)
+    hotel = get_scope(request).get_hotel(hotel_id)
 
     register, _ = CashRegister.objects.get_or_create(hotel=hotel)
 
     if request.method == "POST":
         form = CashTransferForm(request.POST, register=register)
         if form.is_valid():
-            with transaction.atomic():
-                transfer: CashTransfer = form.save(commit=False)
-                transfer.hotel = hotel
-                transfer.register = register
-                transfer.created_by = request.user
-                transfer.save()
-
-                fa = form.cleaned_data["from_account"]
-                ta = form.cleaned_data["to_account"]
-                amount = form.cleaned_data["amount"]
-                happened_at = form.cleaned_data["happened_at"]
-                comment = form.cleaned_data.get("comment") or ""
-
-                # движения денег
-                CashMovement.objects.create(
-                    register=register, hotel=hotel,
-                    direction=CashMovement.OUT, account=fa,
-                    amount=amount, happened_at=happened_at,
-                    comment=f"Перевод: {fa} -> {ta}. {comment}".strip(),
-                    created_by=request.user,
-                    transfer=transfer,
-                )
-                CashMovement.objects.create(
-                    register=register, hotel=hotel,
-                    direction=CashMovement.IN, account=ta,
-                    amount=amount, happened_at=happened_at,
-                    comment=f"Перевод: {fa} -> {ta}. {comment}".strip(),
-                    created_by=request.user,
-                    transfer=transfer,
-                )
-
-                # обновляем балансы кассы
-                if fa == CashMovement.ACC_CASH:
-                    register.cash_balance -= amount
-                elif fa == CashMovement.ACC_MKASSA:
-                    register.mkassa_balance -= amount
-                elif fa == CashMovement.ACC_ZADATOK:
-                    register.zadatok_balance -= amount
-                elif fa == CashMovement.ACC_OPTIMA:
-                    register.optima_balance -= amount
-
-                if ta == CashMovement.ACC_CASH:
-                    register.cash_balance += amount
-                elif ta == CashMovement.ACC_MKASSA:
-                    register.mkassa_balance += amount
-                elif ta == CashMovement.ACC_ZADATOK:
-                    register.zadatok_balance += amount
-                elif ta == CashMovement.ACC_OPTIMA:
-                    register.optima_balance += amount
-
-                register.save(update_fields=["cash_balance", "mkassa_balance", "zadatok_balance", "optima_balance", "updated_at"])
-
-            messages.success(request, "Перевод выполнен.")
-            # ✅ редирект в детали отеля (поставь свой urlname)
             try:
-                return redirect(reverse("dds:hotel_detail", args=[hotel.id]))
-            except Exception:
-                url = reverse("dds:dds_dashboard")
-                return redirect(f"{url}?hotel={hotel.id}")
+                with transaction.atomic():
+                    transfer: CashTransfer = form.save(commit=False)
+                    transfer.hotel = hotel
+                    transfer.register = register
+                    transfer.created_by = request.user
+                    transfer.save()
+
+                    fa = form.cleaned_data["from_account"]
+                    ta = form.cleaned_data["to_account"]
+                    amount = form.cleaned_data["amount"]
+                    happened_at = form.cleaned_data["happened_at"]
+                    comment = form.cleaned_data.get("comment") or ""
+
+                    # движения денег + остатки кассы одним пакетом (одна блокировка, проверка остатка)
+                    post_cash_movements(
+                        hotel=hotel,
+                        created_by=request.user,
+                        movements=[
+                            {
+                                "account": account,
+                                "direction": direction,
+                                "amount": amount,
+                                "happened_at": happened_at,
+                                "comment": f"Перевод: {fa} -> {ta}. {comment}".strip(),
+                                "transfer": transfer,
+                            }
+                            for account, direction in ((fa, CashMovement.OUT), (ta, CashMovement.IN))
+                        ],
+                    )
+            except ValidationError as e:
+                messages.error(request, " ".join(e.messages))
+            else:
+                messages.success(request, "Перевод выполнен.")
+                # ✅ редирект в детали отеля (поставь свой urlname)
+                try:
+                    return redirect(reverse("dds:hotel_detail", args=[hotel.id]))
+                except Exception:
+                    url = reverse("dds:dds_dashboard")
+                    return redirect(f"{url}?hotel={hotel.id}")
     else:
         form = CashTransferForm(register=register)
 
@@ -204,8 +170,7 @@ def _cashmovement_account_from_method(method: str) -> str:
     
 @login_required
 def dds_op_add(request, hotel_id: int, kind: str):
-    hotels = user_hotels_qs(request.user)
-    hotel = get_object_or_404(hotels, id=hotel_id)
+    hotel = get_scope(request).get_hotel(hotel_id)
 
     register, _ = CashRegister.objects.get_or_create(hotel=hotel)
 
@@ -318,17 +283,19 @@ def dds_articles_json(request):
     kind = request.GET.get("kind") or ""
     category_id = request.GET.get("category") or ""
 
-    qs = DDSArticle.objects.filter(is_active=True, kind=kind)
-
+    # из каталога статей (dds.catalog) — без запросов
+    category_ids = None
     if category_id:
         try:
-            qs = qs.filter(category_id=int(category_id))
+            category_ids = {int(category_id)}
         except Exception:
             pass
     else:
         # если категорию не выбрали — можно вернуть пусто, чтобы заставить выбирать категорию
-        qs = qs.none()
+        return JsonResponse({"results": []})
+
+    articles = get_catalog().articles_for(kind=kind, any_hotel=True, category_ids=category_ids)
 
     return JsonResponse({
-        "results": [{"id": a.id, "name": a.name} for a in qs.order_by("name")]
+        "results": [{"id": a.id, "name": a.name} for a in articles]
     })
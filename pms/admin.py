@@ -1,15 +1,19 @@
 from django.contrib import admin
 
 # Register your models here.
+from django import forms
 from django.contrib import admin
 from django.db.models import Sum
 
+from .services import FREE_STATUSES, PMSConflictError, assert_no_overlap, recalc_folio_balances, sync_room_nights
+
 from .models import (
     HotelPMSSettings,
     RoomType, Room,
     Company,
     Booking, Stay, Guest, StayGuest,
     CompanyFolio, CompanyFolioItem,
+    RoomNight, DailyKPI,
     # Warehouse, Supplier, StockItem,
     # PurchaseReceipt, PurchaseLine,
     # Dish, WriteOff, WriteOffLine,
@@ -62,14 +66,54 @@ class StayGuestInline(admin.TabularInline):
     autocomplete_fields = ("guest",)
 
 
+class StayAdminForm(forms.ModelForm):
+    class Meta:
+        model = Stay
+        fields = "__all__"
+
+    def clean(self):
+        # пересечение — ошибкой формы, а не 500 из sync_room_nights
+        cleaned = super().clean()
+        room, check_in, check_out = cleaned.get("room"), cleaned.get("check_in"), cleaned.get("check_out")
+        if room and check_in and check_out and cleaned.get("status") not in FREE_STATUSES:
+            if check_out <= check_in:
+                raise forms.ValidationError("Выезд должен быть позже заезда.")
+            try:
+                assert_no_overlap(room=room, start_dt=check_in, end_dt=check_out, exclude_stay_id=self.instance.pk)
+            except PMSConflictError as e:
+                raise forms.ValidationError(str(e))
+        return cleaned
+
+
 @admin.register(Stay)
 class StayAdmin(admin.ModelAdmin):
+    form = StayAdminForm
     list_display = ("hotel", "room", "check_in", "check_out", "status", "company", "guest_name", "guests_count", "tourist_tax_total")
     list_filter = ("hotel", "status", "company")
     search_fields = ("guest_name", "company__name", "room__number", "hotel__name")
     raw_id_fields = ("room", "booking", "created_by")
     inlines = [StayGuestInline]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        sync_room_nights(obj)
+
+
+@admin.register(RoomNight)
+class RoomNightAdmin(admin.ModelAdmin):
+    list_display = ("date", "hotel", "room", "room_type", "status", "revenue", "stay")
+    list_filter = ("hotel", "status", "room_type")
+    search_fields = ("room__number", "hotel__name")
+    raw_id_fields = ("room", "stay")
+    date_hierarchy = "date"
+
+
+@admin.register(DailyKPI)
+class DailyKPIAdmin(admin.ModelAdmin):
+    list_display = ("day", "hotel", "room_type", "rooms_available", "rooms_sold", "revenue")
+    list_filter = ("hotel", "room_type")
+    date_hierarchy = "day"
+
 
 @admin.register(Guest)
 class GuestAdmin(admin.ModelAdmin):
@@ -88,14 +132,18 @@ class CompanyFolioItemInline(admin.TabularInline):
 
 @admin.register(CompanyFolio)
 class CompanyFolioAdmin(admin.ModelAdmin):
-    list_display = ("hotel", "company", "is_closed", "balance_value", "created_at")
+    list_display = ("hotel", "company", "is_closed", "balance", "last_item_at", "created_at")
     list_filter = ("hotel", "is_closed")
     search_fields = ("company__name", "hotel__name")
+    list_select_related = ("hotel", "company")
+    # баланс — сумма строк, руками не правим
+    readonly_fields = ("balance", "last_item_at")
     inlines = [CompanyFolioItemInline]
 
-    def balance_value(self, obj):
-        return obj.balance
-    balance_value.short_description = "Баланс"
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # строки правили в инлайне — пересчитать баланс фолио
+        recalc_folio_balances([form.instance.pk])
 
 
 @admin.register(CompanyFolioItem)
@@ -104,3 +152,18 @@ class CompanyFolioItemAdmin(admin.ModelAdmin):
     list_filter = ("item_type", "folio__hotel")
     search_fields = ("folio__company__name", "description")
     raw_id_fields = ("dds_operation", "cash_movement", "created_by")
+
+    def save_model(self, request, obj, form, change):
+        old_folio_id = form.initial.get("folio") if change else None
+        super().save_model(request, obj, form, change)
+        recalc_folio_balances({obj.folio_id, old_folio_id} - {None})
+
+    def delete_model(self, request, obj):
+        folio_id = obj.folio_id
+        super().delete_model(request, obj)
+        recalc_folio_balances([folio_id])
+
+    def delete_queryset(self, request, queryset):
+        folio_ids = set(queryset.values_list("folio_id", flat=True))
+        super().delete_queryset(request, queryset)
+        recalc_folio_balances(folio_ids)
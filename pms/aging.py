@@ -0,0 +1,171 @@
+# pms/aging.py
+"""
+Старение корпоративного долга (AR aging) по фолио компаний.
+
+Оплаты гасят начисления по FIFO — самые старые первыми. Разнесение идёт
+одним потоковым проходом по строкам, отсортированным (фолио, дата, id),
+пачками фолио — без запросов на каждое фолио. Результат — непогашенные
+остатки по дням начисления (FolioOpenCharge); от даты отчёта он не зависит,
+поэтому пересчитываются только фолио с флагом aging_dirty (его ставит
+post_folio_item). Корзины 0-30/31-60/61-90/90+ на дату отчёта — один GROUP BY.
+"""
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CompanyFolio, CompanyFolioItem, FolioOpenCharge
+
+ZERO = Decimal("0.00")
+
+BATCH = 500
+
+# (код, подпись, от дней, до дней включительно)
+BUCKETS = (
+    ("d0_30", "0-30", 0, 30),
+    ("d31_60", "31-60", 31, 60),
+    ("d61_90", "61-90", 61, 90),
+    ("d90_plus", "90+", 91, None),
+)
+
+
+def fifo_open_charges(items):
+    """
+    items — (signed_amount, happened_at) одного фолио по возрастанию даты.
+    Возвращает [(день начисления, остаток)]; переплата — одна строка
+    с отрицательным остатком на день последней оплаты.
+    """
+    tz = timezone.get_current_timezone()
+    open_ = deque()  # [день, остаток]
+    credit = ZERO
+    credit_day = None
+
+    for signed, happened_at in items:
+        signed = signed or ZERO
+        day = timezone.localtime(happened_at, tz).date()
+        if signed > 0:
+            # сначала гасим аванс
+            used = min(credit, signed)
+            credit -= used
+            if signed - used > 0:
+                open_.append([day, signed - used])
+        elif signed < 0:
+            pay = -signed
+            while pay > 0 and open_:
+                head = open_[0]
+                used = min(head[1], pay)
+                head[1] -= used
+                pay -= used
+                if head[1] == 0:
+                    open_.popleft()
+            if pay > 0:
+                credit += pay
+                credit_day = day
+
+    # несколько начислений одного дня — одной строкой
+    result = {}
+    for day, rest in open_:
+        result[day] = result.get(day, ZERO) + rest
+    rows = sorted(result.items())
+    if credit > 0:
+        rows.append((credit_day, -credit))
+    return rows
+
+
+def _rebuild_batch(folios):
+    """Пересобрать FolioOpenCharge для пачки фолио одним запросом строк."""
+    by_id = {f.id: f for f in folios}
+    ids = list(by_id)
+
+    # сначала снимаем флаг: строка, пришедшая во время пересчёта, снова его поставит
+    CompanyFolio.objects.filter(pk__in=ids).update(aging_dirty=False)
+    FolioOpenCharge.objects.filter(folio_id__in=ids).delete()
+
+    rows = (
+        CompanyFolioItem.objects.filter(folio_id__in=ids)
+        .order_by("folio_id", "happened_at", "id")
+        .values_list("folio_id", "signed_amount", "happened_at")
+    )
+
+    buf = []
+
+    def flush(folio_id, items):
+        folio = by_id[folio_id]
+        for day, rest in fifo_open_charges(items):
+            buf.append(FolioOpenCharge(
+                folio_id=folio_id, hotel_id=folio.hotel_id, company_id=folio.company_id,
+                charge_day=day, remaining=rest,
+            ))
+
+    current, items = None, []
+    for folio_id, signed, happened_at in rows.iterator(chunk_size=2000):
+        if folio_id != current:
+            if current is not None:
+                flush(current, items)
+            current, items = folio_id, []
+        items.append((signed, happened_at))
+    if current is not None:
+        flush(current, items)
+
+    FolioOpenCharge.objects.bulk_create(buf, batch_size=2000)
+    return len(ids)
+
+
+def refresh_aging(*, hotel_ids=None, full: bool = False, batch: int = BATCH) -> int:
+    """
+    Пересчитать изменённые фолио (full — все). Возвращает число фолио.
+    hotel_ids=None — все отели, пустой список — ни одного.
+    """
+    folios = CompanyFolio.objects.only("id", "hotel_id", "company_id").order_by("id")
+    if hotel_ids is not None:
+        hotel_ids = list(hotel_ids)
+        if not hotel_ids:
+            return 0
+        folios = folios.filter(hotel_id__in=hotel_ids)
+    if not full:
+        folios = folios.filter(aging_dirty=True)
+
+    done = 0
+    last_id = 0
+    while True:
+        chunk = list(folios.filter(id__gt=last_id)[:batch])
+        if not chunk:
+            break
+        with transaction.atomic():
+            done += _rebuild_batch(chunk)
+        last_id = chunk[-1].id
+    return done
+
+
+def aging_report(*, hotels, as_of=None):
+    """
+    Строки по (компания, отель): корзины долга на дату as_of, аванс и итог.
+    Остатки — текущие, as_of задаёт только возраст. Один GROUP BY по FolioOpenCharge.
+    """
+    as_of = as_of or timezone.localdate()
+    debt = Q(remaining__gt=0)
+
+    aggregates = {}
+    for code, _, lo, hi in BUCKETS:
+        flt = debt
+        if lo:
+            flt &= Q(charge_day__lte=as_of - timedelta(days=lo))
+        if hi is not None:
+            flt &= Q(charge_day__gt=as_of - timedelta(days=hi + 1))
+        aggregates[code] = Coalesce(Sum("remaining", filter=flt), ZERO)
+    aggregates["credit"] = Coalesce(Sum("remaining", filter=Q(remaining__lt=0)), ZERO)
+    aggregates["total"] = Coalesce(Sum("remaining"), ZERO)
+
+    rows = list(
+        FolioOpenCharge.objects.filter(hotel__in=hotels)
+        .values("company_id", "company__name", "hotel_id", "hotel__name")
+        .annotate(**aggregates)
+        .order_by("company__name", "hotel__name")
+    )
+
+    totals = {code: sum((r[code] for r in rows), ZERO) for code in [b[0] for b in BUCKETS] + ["credit", "total"]}
+    return rows, totals
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PmsConfig(AppConfig):
     name = 'pms'
+
+    def ready(self):
+        from . import signals  # noqa
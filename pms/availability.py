@@ -0,0 +1,110 @@
+# pms/availability.py
+"""
+Поиск свободных номеров: много типов номеров × много периодов за один запрос.
+
+Берём одним запросом все проживания по кандидатам-номерам, которые задевают
+общий интервал всех периодов (индекс hotel, room, check_in, check_out),
+дальше проверяем каждый период в памяти через bisect по отсортированным ночам.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, time
+from typing import Iterable, List, Optional, Tuple
+
+from django.utils import timezone
+
+from .models import Room, Stay
+from .occupancy import stay_night_bounds
+from .services import FREE_STATUSES, _period_overlap_q
+
+
+def _busy_intervals(*, hotel, room_ids, date_from: date, date_to: date, tz) -> dict:
+    """
+    room_id -> отсортированный список (первая ночь, ночь после последней)
+    для всех проживаний, задевающих [date_from, date_to).
+    """
+    start_dt = timezone.make_aware(datetime.combine(date_from, time.min), tz)
+    end_dt = timezone.make_aware(datetime.combine(date_to, time.min), tz)
+
+    rows = (
+        Stay.objects
+        .filter(hotel=hotel, room_id__in=room_ids)
+        .filter(_period_overlap_q(start_dt, end_dt))
+        .exclude(status__in=FREE_STATUSES)
+        .values_list("room_id", "check_in", "check_out")
+    )
+
+    busy = defaultdict(list)
+    for room_id, ci, co in rows:
+        busy[room_id].append(stay_night_bounds(ci, co, tz))
+    for intervals in busy.values():
+        intervals.sort()
+    return busy
+
+
+def _is_free(intervals: List[Tuple[date, date]], date_from: date, date_to: date) -> bool:
+    if not intervals:
+        return True
+    # первый интервал, который начинается не раньше date_to, нас уже не задевает;
+    # проверяем всё, что левее (интервалы одного номера не пересекаются — хватает соседа)
+    i = bisect_left(intervals, (date_to,))
+    for start, end in reversed(intervals[:i]):
+        if end <= date_from:
+            return True
+        if start < date_to:
+            return False
+    return True
+
+
+def search_availability(
+    *,
+    hotel,
+    windows: Iterable[Tuple[date, date]],
+    room_type_ids: Optional[Iterable[int]] = None,
+) -> List[dict]:
+    """
+    Свободные номера по типам и периодам.
+
+    windows: [(date_from, date_to), ...] — ночи с date_from по date_to (не включая).
+    Возвращает по строке на (тип номера, период):
+      {"room_type": RoomType, "date_from", "date_to", "free": [Room, ...], "total": int}
+    """
+    windows = [(a, b) for a, b in windows if a and b and a < b]
+    if not windows:
+        return []
+
+    rooms_qs = (
+        Room.objects
+        .filter(hotel=hotel, is_active=True, is_out_of_service=False)
+        .select_related("room_type")
+        .order_by("room_type__name", "floor", "number")
+    )
+    if room_type_ids:
+        rooms_qs = rooms_qs.filter(room_type_id__in=list(room_type_ids))
+    rooms = list(rooms_qs)
+
+    rooms_by_type = defaultdict(list)
+    for r in rooms:
+        rooms_by_type[r.room_type_id].append(r)
+
+    tz = timezone.get_current_timezone()
+    busy = _busy_intervals(
+        hotel=hotel,
+        room_ids=[r.id for r in rooms],
+        date_from=min(a for a, _ in windows),
+        date_to=max(b for _, b in windows),
+        tz=tz,
+    )
+
+    results = []
+    for type_rooms in rooms_by_type.values():
+        for date_from, date_to in windows:
+            free = [r for r in type_rooms if _is_free(busy.get(r.id), date_from, date_to)]
+            results.append({
+                "room_type": type_rooms[0].room_type,
+                "date_from": date_from,
+                "date_to": date_to,
+                "free": free,
+                "total": len(type_rooms),
+            })
+    return results
@@ -0,0 +1,199 @@
+# pms/channels.py
+"""
+Отчёт по каналам продаж (УНО): брони, ночи, валовая сумма, комиссия, чистая
+сумма, доля отмен и незаездов — по каналу и месяцу.
+
+Месяц считается по дате брони (basis="booked", индекс hotel, booked_at) или
+по дате заезда (basis="stay", индекс hotel, check_in, check_out). Один GROUP BY
+(отель, канал, месяц) за все недостающие месяцы разом.
+
+Закрытые месяцы кэшируются по (основа, отель, месяц): там почти ничего не
+меняется, а правку/отмену задним числом ловит сигнал Booking (pms.signals) —
+ключи месяцев этой брони удаляются. Текущий месяц (и будущие по заезду)
+всегда считаются заново — только свои месяцы, не весь период.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Booking
+
+ZERO = Decimal("0.00")
+
+CHANNEL_STATS_TTL = getattr(settings, "CHANNEL_STATS_TTL", 60 * 60 * 24 * 30)
+
+# основа -> поле брони, по месяцу которого считаем
+BASES = {"booked": "booked_at", "stay": "check_in"}
+
+# брони, которые не приносят ни ночей, ни денег
+LOST_STATUSES = (Booking.STATUS_CANCELLED, Booking.STATUS_NO_SHOW)
+
+SUM_FIELDS = ("bookings", "cancelled", "no_show", "room_nights", "gross", "commission")
+
+
+def month_start(d: date) -> date:
+    return d.replace(day=1)
+
+
+def next_month(d: date) -> date:
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def months_between(month_from: date, month_to: date):
+    m = month_start(month_from)
+    while m <= month_to:
+        yield m
+        m = next_month(m)
+
+
+def _key(basis: str, hotel_id, month: date) -> str:
+    return f"pms:channels:{basis}:{hotel_id}:{month:%Y-%m}"
+
+
+def invalidate_booking_months(hotel_id, months):
+    """Сбросить кэш месяцев брони — по обеим основам (месяц брони и месяц заезда)."""
+    cache.delete_many([_key(basis, hotel_id, month_start(m)) for basis in BASES for m in months if m])
+
+
+def booking_months(booking: Booking) -> list:
+    """Месяцы, в отчёты которых попадает бронь."""
+    months = []
+    if booking.booked_at:
+        months.append(timezone.localtime(booking.booked_at).date())
+    if booking.check_in:
+        months.append(booking.check_in)
+    return months
+
+
+def _compute(basis: str, hotel_ids, month_from: date, month_to: date) -> dict:
+    """
+    (отель, месяц) -> {канал: суммы} одним GROUP BY за месяцы month_from..month_to.
+    Пустые месяцы тоже в результате — чтобы закэшировать и их.
+    """
+    tz = timezone.get_current_timezone()
+    end = next_month(month_to)
+    qs = Booking.objects.filter(hotel_id__in=hotel_ids)
+    if basis == "booked":
+        qs = qs.filter(
+            booked_at__gte=timezone.make_aware(datetime.combine(month_from, time.min), tz),
+            booked_at__lt=timezone.make_aware(datetime.combine(end, time.min), tz),
+        )
+        month = TruncMonth("booked_at", tzinfo=tz)
+    else:
+        qs = qs.filter(check_in__gte=month_from, check_in__lt=end)
+        month = TruncMonth("check_in")
+
+    sold = ~Q(status__in=LOST_STATUSES)
+    nights = ExpressionWrapper(F("check_out") - F("check_in"), output_field=DurationField())
+    rows = (
+        qs.annotate(month=month)
+        .values("hotel_id", "month", "channel")
+        .annotate(
+            bookings=Count("id"),
+            cancelled=Count("id", filter=Q(status=Booking.STATUS_CANCELLED)),
+            no_show=Count("id", filter=Q(status=Booking.STATUS_NO_SHOW)),
+            nights=Sum(nights, filter=sold),
+            gross=Coalesce(Sum("gross_amount", filter=sold), ZERO),
+            commission=Coalesce(Sum("commission_amount", filter=sold), ZERO),
+        )
+        .order_by()
+    )
+
+    result = {(h, m): {} for h in hotel_ids for m in months_between(month_from, month_to)}
+    for r in rows:
+        m = r["month"]
+        if isinstance(m, datetime):
+            m = timezone.localtime(m, tz).date() if timezone.is_aware(m) else m.date()
+        result[(r["hotel_id"], m)][r["channel"]] = {
+            "bookings": r["bookings"],
+            "cancelled": r["cancelled"],
+            "no_show": r["no_show"],
+            "room_nights": r["nights"].days if r["nights"] else 0,
+            "gross": r["gross"],
+            "commission": r["commission"],
+        }
+    return result
+
+
+def monthly_stats(*, hotel_ids, month_from: date, month_to: date, basis: str = "booked") -> dict:
+    """
+    (отель, месяц) -> {канал: суммы}. Закрытые месяцы — из кэша (недостающие
+    досчитываются одним запросом и кладутся в кэш), текущий и будущие — заново.
+    """
+    hotel_ids = list(hotel_ids)
+    month_from, month_to = month_start(month_from), month_start(month_to)
+    current = month_start(timezone.localdate())
+    months = list(months_between(month_from, month_to))
+    if not hotel_ids or not months:
+        return {}
+
+    closed = [m for m in months if m < current]
+    keys = {_key(basis, h, m): (h, m) for h in hotel_ids for m in closed}
+    cached = cache.get_many(list(keys))
+    stats = {keys[k]: v for k, v in cached.items()}
+
+    missing = [hm for k, hm in keys.items() if k not in cached]
+    if missing:
+        fresh = _compute(
+            basis,
+            sorted({h for h, _ in missing}),
+            min(m for _, m in missing),
+            max(m for _, m in missing),
+        )
+        todo = set(missing)
+        cache.set_many(
+            {_key(basis, h, m): v for (h, m), v in fresh.items() if (h, m) in todo},
+            CHANNEL_STATS_TTL,
+        )
+        stats.update({hm: v for hm, v in fresh.items() if hm in todo})
+
+    live = [m for m in months if m >= current]
+    if live:
+        stats.update(_compute(basis, hotel_ids, live[0], live[-1]))
+    return stats
+
+
+def _with_rates(row: dict) -> dict:
+    row["net"] = row["gross"] - row["commission"]
+    n = row["bookings"]
+    row["cancel_rate"] = (Decimal(row["cancelled"] * 100) / n).quantize(Decimal("0.1")) if n else None
+    row["no_show_rate"] = (Decimal(row["no_show"] * 100) / n).quantize(Decimal("0.1")) if n else None
+    row["sold"] = n - row["cancelled"] - row["no_show"]
+    row["adr"] = (row["gross"] / row["room_nights"]).quantize(Decimal("0.01")) if row["room_nights"] else None
+    return row
+
+
+def _empty() -> dict:
+    return {"bookings": 0, "cancelled": 0, "no_show": 0, "room_nights": 0, "gross": ZERO, "commission": ZERO}
+
+
+def _add(acc: dict, values: dict):
+    for f in SUM_FIELDS:
+        acc[f] += values[f]
+
+
+def channel_report(*, hotel_ids, month_from: date, month_to: date, basis: str = "booked"):
+    """
+    Строки (месяц, канал) по выбранным отелям + итоги по каналам и общий итог.
+    rows: [{"month", "channel", bookings, cancelled, no_show, room_nights,
+            gross, commission, net, cancel_rate, no_show_rate, adr, sold}]
+    """
+    stats = monthly_stats(hotel_ids=hotel_ids, month_from=month_from, month_to=month_to, basis=basis)
+
+    by_month = {}
+    by_channel = {}
+    total = _empty()
+    for (_, month), channels in stats.items():
+        for channel, values in channels.items():
+            _add(by_month.setdefault((month, channel), {"month": month, "channel": channel, **_empty()}), values)
+            _add(by_channel.setdefault(channel, {"channel": channel, **_empty()}), values)
+            _add(total, values)
+
+    rows = [_with_rates(r) for _, r in sorted(by_month.items(), key=lambda kv: (kv[0][0], kv[0][1]))]
+    channels = sorted((_with_rates(r) for r in by_channel.values()), key=lambda r: -r["gross"])
+    return rows, channels, _with_rates(total)
@@ -0,0 +1,208 @@
+# pms/conversion.py
+"""
+Бронь -> проживание пачкой: все подтверждённые брони с заездом в заданный день.
+
+Номер берём из брони; если указан только тип номера (или указанный номер
+уже занят) — подбираем свободный номер этого типа. Занятость всех номеров-
+кандидатов за окно пачки читается одним запросом к RoomNight и держится
+в памяти битовой картой: у каждого номера int, бит i — ночь window_start + i.
+Номер свободен, если (занятость & маска брони) == 0; выбранный номер сразу
+помечаем — следующие брони пачки его уже не получат.
+
+Из нескольких свободных берём тот, после которого «хвост» свободных ночей
+самый короткий (best fit): длинные свободные окна остаются длинным броням.
+Битовая карта — грубый подбор по ночам; окончательная проверка пересечений
+по времени и создание Stay + RoomNight — bulk_create_stays (блокировка
+номеров, один запрос) в одной транзакции на всю пачку; номера отелей пачки
+блокируются в начале транзакции.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, Room, RoomNight, Stay
+from .services import bulk_create_stays, lock_rooms
+
+DEFAULT_CHECK_IN = time(14, 0)
+DEFAULT_CHECK_OUT = time(12, 0)
+
+
+def bookings_for_date(day: date, hotel_ids: Optional[Iterable[int]] = None):
+    """Подтверждённые брони с заездом day, по которым ещё нет проживания."""
+    qs = (
+        Booking.objects
+        .filter(check_in=day, status=Booking.STATUS_CONFIRMED, stays__isnull=True)
+        .exclude(operation_type=Booking.OP_CANCEL)
+        .select_related("hotel__pms_settings", "room", "room_type")
+        .order_by("hotel_id", "id")
+    )
+    if hotel_ids:
+        qs = qs.filter(hotel_id__in=list(hotel_ids))
+    return qs
+
+
+def _stay_times(hotel, check_in: date, check_out: date):
+    settings = getattr(hotel, "pms_settings", None)
+    ci_t = settings.check_in_time if settings else DEFAULT_CHECK_IN
+    co_t = settings.check_out_time if settings else DEFAULT_CHECK_OUT
+    return (
+        timezone.make_aware(datetime.combine(check_in, ci_t)),
+        timezone.make_aware(datetime.combine(check_out, co_t)),
+    )
+
+
+class RoomBitmap:
+    """Занятость номеров отеля ночами окна [start, end) — по int на номер."""
+
+    def __init__(self, rooms, start: date, end: date):
+        self.start = start
+        self.size = (end - start).days
+        self.rooms = {r.id: r for r in rooms}
+        self.busy = {r.id: 0 for r in rooms}
+        self.by_type = defaultdict(list)
+        for r in rooms:  # порядок rooms — порядок выбора при равенстве
+            self.by_type[r.room_type_id].append(r.id)
+
+    def mark_nights(self, rows):
+        """rows — [(room_id, date)] из RoomNight."""
+        for room_id, d in rows:
+            i = (d - self.start).days
+            if room_id in self.busy and 0 <= i < self.size:
+                self.busy[room_id] |= 1 << i
+
+    def mask(self, check_in: date, check_out: date) -> int:
+        lo = max((check_in - self.start).days, 0)
+        hi = min((check_out - self.start).days, self.size)
+        return ((1 << (hi - lo)) - 1) << lo if hi > lo else 0
+
+    def is_free(self, room_id, mask: int) -> bool:
+        return room_id in self.busy and not self.busy[room_id] & mask
+
+    def _gap_after(self, room_id, mask: int) -> int:
+        # свободных ночей после брони до следующей занятой (или до конца окна)
+        after = self.busy[room_id] >> mask.bit_length()
+        return (after & -after).bit_length() - 1 if after else self.size - mask.bit_length()
+
+    def pick(self, room_type_id, mask: int):
+        """Свободный номер типа с самым коротким свободным хвостом после брони."""
+        best, best_gap = None, None
+        for room_id in self.by_type.get(room_type_id, ()):
+            if self.busy[room_id] & mask:
+                continue
+            gap = self._gap_after(room_id, mask)
+            if best is None or gap < best_gap:
+                best, best_gap = room_id, gap
+        return best
+
+    def take(self, room_id, mask: int):
+        self.busy[room_id] |= mask
+
+
+def _assign(hotel, bookings, results):
+    """Подобрать номера броням одного отеля. Возвращает [(booking, room_id)]."""
+    rooms = list(
+        Room.objects.filter(hotel=hotel, is_active=True, is_out_of_service=False)
+        .order_by("floor", "number")
+    )
+    start = min(b.check_in for b in bookings)
+    end = max(b.check_out for b in bookings)
+    bitmap = RoomBitmap(rooms, start, end)
+    bitmap.mark_nights(
+        RoomNight.objects.filter(room__in=rooms, date__gte=start, date__lt=end).values_list("room_id", "date")
+    )
+
+    assigned = []
+    # длинные брони первыми — им труднее найти окно
+    for b in sorted(bookings, key=lambda b: (-(b.check_out - b.check_in).days, b.id)):
+        res = results[b.id]
+        if b.check_out <= b.check_in:
+            res["error"] = "Выезд должен быть позже заезда."
+            continue
+        mask = bitmap.mask(b.check_in, b.check_out)
+
+        room_id = None
+        if b.room_id and bitmap.is_free(b.room_id, mask):
+            room_id = b.room_id
+        else:
+            room_type_id = b.room_type_id or (b.room.room_type_id if b.room_id else None)
+            if room_type_id is None:
+                res["error"] = "В брони нет ни номера, ни типа номера."
+                continue
+            room_id = bitmap.pick(room_type_id, mask)
+            if room_id is None:
+                res["error"] = "Нет свободных номеров этого типа на даты брони."
+                continue
+
+        bitmap.take(room_id, mask)
+        assigned.append((b, room_id))
+    return assigned, bitmap.rooms
+
+
+def convert_bookings(*, bookings, user) -> list:
+    """
+    Брони -> Stay одной транзакцией (по отелю — один подбор номеров и один bulk_create).
+    Возвращает по строке на бронь:
+      {"booking", "room": Room|None, "stay": Stay|None, "ok": bool, "error": str}
+    Бронь, для которой номер не нашёлся, остаётся как есть (ok=False, error — почему).
+    """
+    bookings = list(bookings)
+    results = {b.id: {"booking": b, "room": None, "stay": None, "ok": False, "error": ""} for b in bookings}
+
+    by_hotel = defaultdict(list)
+    for b in bookings:
+        by_hotel[b.hotel_id].append(b)
+
+    with transaction.atomic():
+        # номера отелей пачки — под блокировку до чтения занятости: подбор по
+        # битовой карте не устареет до вставки (см. pms.services.lock_rooms)
+        lock_rooms(Room.objects.filter(hotel_id__in=list(by_hotel)).values("id"))
+        for hotel_bookings in by_hotel.values():
+            hotel = hotel_bookings[0].hotel
+            assigned, rooms = _assign(hotel, hotel_bookings, results)
+            if not assigned:
+                continue
+
+            requests = []
+            for b, room_id in assigned:
+                check_in, check_out = _stay_times(hotel, b.check_in, b.check_out)
+                requests.append({
+                    "room": room_id,
+                    "check_in": check_in,
+                    "check_out": check_out,
+                    "booking": b,
+                    "stay_type": b.stay_type,
+                    "company_id": b.company_id,
+                    "guest_name": b.guest_name,
+                    "guest_phone": b.guest_phone,
+                    "guests_count": b.guests_count,
+                    "channel": b.channel,
+                    "amount": b.gross_amount or b.price_per_night * b.nights,
+                    "status": Stay.BOOKED,
+                    "comment": f"Из брони {b.booking_number}",
+                })
+
+            rows = bulk_create_stays(hotel=hotel, requests=requests, user=user)
+
+            changed = []
+            for (b, room_id), row in zip(assigned, rows):
+                res = results[b.id]
+                res["room"] = rooms[room_id]
+                if not row["ok"]:
+                    res["error"] = row["error"]
+                    continue
+                res["ok"], res["stay"] = True, row["stay"]
+                if b.room_id != room_id:
+                    b.room_id = room_id
+                    changed.append(b)
+            # подобранный номер — и в бронь (для УНО и повторного просмотра)
+            Booking.objects.bulk_update(changed, ["room"], batch_size=500)
+
+    return [results[b.id] for b in bookings]
+
+
+def convert_arrivals(*, day: date, user, hotel_ids=None) -> list:
+    """Все подтверждённые брони с заездом day -> Stay (см. convert_bookings)."""
+    return convert_bookings(bookings=bookings_for_date(day, hotel_ids), user=user)
@@ -1,5 +1,6 @@
 from decimal import Decimal
 from django import forms
+from dds.catalog import catalog_field, get_catalog
 from dds.models import DDSArticle, DDSOperation
 
 
@@ -19,3 +20,9 @@ class FolioPaymentForm(forms.Form):
     )
 
     comment = forms.CharField(label="Комментарий", required=False, widget=forms.Textarea(attrs={"rows": 2}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["article"] = catalog_field(
+            self.fields["article"], get_catalog().articles_for(kind=DDSArticle.INCOME, any_hotel=True),
+        )
@@ -0,0 +1,220 @@
+# pms/kpi.py
+"""
+Загрузка, ADR и RevPAR по отелям, типам номеров и дням.
+
+Ночи проживаний уже разложены по строкам RoomNight (одна строка — проживание × ночь,
+выручка за ночь), поэтому дневной свод DailyKPI — один GROUP BY по RoomNight
+(индекс hotel, date) + число номеров в продаже по типам. Продано — разных
+номеров за дату: несколько почасовых проживаний в номере за день — один проданный номер. Отчёты читают только
+DailyKPI и считают отношения сумм за период:
+    загрузка = продано / в продаже, ADR = выручка / продано, RevPAR = выручка / в продаже.
+
+Свод ведётся сервисами pms.services: после коммита изменения ночей проживания
+пересчитываются только задетые дни этого отеля (refresh_kpi_on_commit) — вне
+транзакции брони, чтобы брони одного отеля не ждали друг друга на строках свода.
+Строки свода не удаляются и не вставляются заново, а обновляются по ключу
+(тип номера, день): параллельные пересчёты одних дней не падают на уникальном
+ключе, последний пишет по уже закоммиченным ночам. Дни, которых в своде ещё
+нет, kpi_report досчитывает при первом обращении.
+
+Номера в продаже — активные и не в ремонте на момент расчёта. Истории ремонтов
+нет, поэтому у прошедших дней значение фиксируется при первом расчёте дня,
+а изменения номеров (pms.signals) пересчитывают свод с сегодняшнего дня.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DailyKPI, Room, RoomNight
+
+ZERO = Decimal("0.00")
+
+# статусы ночей, которые не считаем проданными (отменённые ночей не имеют — на всякий случай)
+UNSOLD_STATUSES = ("canceled", "no_show")
+
+# разрезы отчёта: group_by -> поля values()
+GROUPS = {
+    "hotel": ("hotel_id", "hotel__name"),
+    "room_type": ("hotel_id", "hotel__name", "room_type_id", "room_type__name"),
+    "day": ("day",),
+}
+
+
+def _days(date_from: date, date_to: date):
+    return [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+
+def refresh_kpi(*, hotel_ids, date_from: date, date_to: date) -> int:
+    """
+    Пересобрать DailyKPI отелей за дни date_from..date_to (включительно).
+    Три запроса чтения (номера, ночи, уже посчитанные прошлые дни) + upsert строк
+    по (тип номера, день) и удаление строк типов, которых в периоде больше нет.
+    Возвращает число строк свода.
+    """
+    hotel_ids = list(hotel_ids)
+    if not hotel_ids or date_to < date_from:
+        return 0
+
+    available = defaultdict(dict)  # отель -> {тип: номеров в продаже}
+    for r in (
+        Room.objects.filter(hotel_id__in=hotel_ids, is_active=True, is_out_of_service=False)
+        .values("hotel_id", "room_type_id")
+        .annotate(n=Count("id"))
+        .order_by()
+    ):
+        available[r["hotel_id"]][r["room_type_id"]] = r["n"]
+
+    sold = defaultdict(dict)  # (отель, день) -> {тип: (ночей, выручка)}
+    for r in (
+        RoomNight.objects.filter(hotel_id__in=hotel_ids, date__gte=date_from, date__lte=date_to)
+        .exclude(status__in=UNSOLD_STATUSES)
+        .values("hotel_id", "room_type_id", "date")
+        .annotate(n=Count("room_id", distinct=True), revenue=Sum("revenue"))
+        .order_by()
+    ):
+        sold[(r["hotel_id"], r["date"])][r["room_type_id"]] = (r["n"], r["revenue"] or ZERO)
+
+    # у прошедших дней номера в продаже — как при первом расчёте
+    today = timezone.localdate()
+    kept = {}
+    if date_from < today:
+        kept = {
+            (room_type_id, day): n
+            for room_type_id, day, n in DailyKPI.objects.filter(
+                hotel_id__in=hotel_ids, day__gte=date_from, day__lte=min(date_to, today - timedelta(days=1)),
+            ).values_list("room_type_id", "day", "rooms_available")
+        }
+
+    buf = {}
+    days = _days(date_from, date_to)
+    for hotel_id in hotel_ids:
+        for day in days:
+            day_sold = sold.get((hotel_id, day), {})
+            for room_type_id in available[hotel_id].keys() | day_sold.keys():
+                n_sold, revenue = day_sold.get(room_type_id, (0, ZERO))
+                n_available = kept.get((room_type_id, day), available[hotel_id].get(room_type_id, 0))
+                buf[(room_type_id, day)] = DailyKPI(
+                    hotel_id=hotel_id, room_type_id=room_type_id, day=day,
+                    rooms_available=n_available, rooms_sold=n_sold, revenue=revenue,
+                )
+
+    stale = [
+        pk for pk, room_type_id, day in DailyKPI.objects.filter(
+            hotel_id__in=hotel_ids, day__gte=date_from, day__lte=date_to,
+        ).values_list("id", "room_type_id", "day")
+        if (room_type_id, day) not in buf
+    ]
+    with transaction.atomic():
+        if stale:
+            DailyKPI.objects.filter(id__in=stale).delete()
+        # один порядок ключей у всех пишущих — без взаимных блокировок
+        DailyKPI.objects.bulk_create(
+            [buf[k] for k in sorted(buf)],
+            batch_size=2000,
+            update_conflicts=True,
+            unique_fields=["room_type", "day"],
+            update_fields=["hotel", "rooms_available", "rooms_sold", "revenue"],
+        )
+    return len(buf)
+
+
+def refresh_kpi_for_nights(nights) -> int:
+    """Пересчитать дни, задетые ночами [(hotel_id, date), ...] — по отрезку на отель."""
+    spans = {}
+    for hotel_id, day in nights:
+        lo, hi = spans.get(hotel_id, (day, day))
+        spans[hotel_id] = (min(lo, day), max(hi, day))
+    return sum(refresh_kpi(hotel_ids=[h], date_from=lo, date_to=hi) for h, (lo, hi) in spans.items())
+
+
+def refresh_kpi_on_commit(nights):
+    """refresh_kpi_for_nights после коммита текущей транзакции (сразу, если её нет)."""
+    nights = list(nights)
+    if nights:
+        transaction.on_commit(lambda: refresh_kpi_for_nights(nights))
+
+
+def rebuild_kpi(*, hotel_ids=None, date_from=None, date_to=None) -> int:
+    """Полная пересборка за период (по умолчанию — от первой до последней ночи в RoomNight)."""
+    nights = RoomNight.objects.all()
+    if hotel_ids:
+        nights = nights.filter(hotel_id__in=hotel_ids)
+    bounds = nights.aggregate(lo=Min("date"), hi=Max("date"))
+    date_from = date_from or bounds["lo"]
+    date_to = date_to or bounds["hi"]
+    if not date_from or not date_to:
+        return 0
+    if not hotel_ids:
+        hotel_ids = Room.objects.values_list("hotel_id", flat=True).distinct().order_by()
+    return refresh_kpi(hotel_ids=hotel_ids, date_from=date_from, date_to=date_to)
+
+
+def ensure_kpi(*, hotel_ids, date_from: date, date_to: date) -> int:
+    """Досчитать дни периода, которых ещё нет в своде (один запрос, если всё на месте)."""
+    have = defaultdict(set)
+    for hotel_id, day in (
+        DailyKPI.objects.filter(hotel_id__in=hotel_ids, day__gte=date_from, day__lte=date_to)
+        .values_list("hotel_id", "day")
+        .distinct()
+        .order_by()
+    ):
+        have[hotel_id].add(day)
+
+    done = 0
+    expected = len(_days(date_from, date_to))
+    for hotel_id in hotel_ids:
+        if len(have[hotel_id]) == expected:
+            continue
+        missing = sorted(set(_days(date_from, date_to)) - have[hotel_id])
+        done += refresh_kpi(hotel_ids=[hotel_id], date_from=missing[0], date_to=missing[-1])
+    return done
+
+
+def _ratio(num, den, places="0.01"):
+    if not den:
+        return None
+    return (Decimal(num) / Decimal(den)).quantize(Decimal(places), rounding=ROUND_HALF_UP)
+
+
+def with_ratios(row: dict) -> dict:
+    """Добавить к суммам (available, sold, revenue) загрузку %, ADR и RevPAR."""
+    row["occupancy"] = _ratio(row["sold"] * 100, row["available"], "0.1")
+    row["adr"] = _ratio(row["revenue"], row["sold"])
+    row["revpar"] = _ratio(row["revenue"], row["available"])
+    return row
+
+
+def kpi_report(*, hotel_ids, date_from: date, date_to: date, group_by: str = "hotel"):
+    """
+    Строки отчёта по разрезу group_by ("hotel" | "room_type" | "day") за период
+    (включительно) + итог. Один GROUP BY по DailyKPI.
+    """
+    hotel_ids = list(hotel_ids)
+    if hotel_ids:
+        ensure_kpi(hotel_ids=hotel_ids, date_from=date_from, date_to=date_to)
+
+    fields = GROUPS[group_by]
+    order = [f for f in fields if not f.endswith("_id")] or list(fields)
+    rows = [
+        with_ratios(r)
+        for r in DailyKPI.objects.filter(hotel_id__in=hotel_ids, day__gte=date_from, day__lte=date_to)
+        .values(*fields)
+        .annotate(
+            available=Coalesce(Sum("rooms_available"), 0),
+            sold=Coalesce(Sum("rooms_sold"), 0),
+            revenue=Coalesce(Sum("revenue"), ZERO),
+        )
+        .order_by(*order)
+    ]
+
+    totals = with_ratios({
+        "available": sum(r["available"] for r in rows),
+        "sold": sum(r["sold"] for r in rows),
+        "revenue": sum((r["revenue"] for r in rows), ZERO),
+    })
+    return rows, totals
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from pms.conversion import bookings_for_date, convert_bookings
+
+
+class Command(BaseCommand):
+    help = "Создать проживания (Stay) из подтверждённых броней с заездом в указанный день (с подбором номеров)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="День заезда YYYY-MM-DD (по умолчанию — сегодня)")
+        parser.add_argument("--hotel", type=int, action="append", help="ID отеля (можно несколько; по умолчанию — все)")
+        parser.add_argument("--user", required=True, help="Логин пользователя, от имени которого создаются проживания")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать подбор номеров, ничего не сохранять")
+
+    def handle(self, *args, **opts):
+        try:
+            day = datetime.strptime(opts["date"], "%Y-%m-%d").date() if opts["date"] else timezone.localdate()
+        except ValueError:
+            raise CommandError("Дата должна быть в формате YYYY-MM-DD.")
+
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: opts["user"]})
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {opts['user']} не найден.")
+
+        bookings = bookings_for_date(day, opts["hotel"])
+        with transaction.atomic():
+            results = convert_bookings(bookings=bookings, user=user)
+            if opts["dry_run"]:
+                transaction.set_rollback(True)
+
+        ok = 0
+        for r in results:
+            b = r["booking"]
+            if r["ok"]:
+                ok += 1
+                self.stdout.write(f"{b.hotel.name} • бронь {b.booking_number} -> номер {r['room'].number}")
+            else:
+                self.stdout.write(self.style.WARNING(f"{b.hotel.name} • бронь {b.booking_number}: {r['error']}"))
+
+        prefix = "Проверка (без сохранения): " if opts["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(f"{prefix}заезд {day:%d.%m.%Y}, броней: {len(results)}, проживаний: {ok}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from pms.models import CompanyFolio
+from pms.services import recalc_folio_balances
+
+
+class Command(BaseCommand):
+    help = "Пересчитать баланс и дату последней операции фолио компаний по строкам."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hotel", type=int, help="ID отеля (по умолчанию — все)")
+
+    def handle(self, *args, **opts):
+        folio_ids = None
+        if opts["hotel"]:
+            folio_ids = list(CompanyFolio.objects.filter(hotel_id=opts["hotel"]).values_list("id", flat=True))
+
+        fixed = recalc_folio_balances(folio_ids)
+        self.stdout.write(self.style.SUCCESS(f"Исправлено фолио: {fixed}"))
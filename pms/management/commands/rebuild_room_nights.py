@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pms.models import Stay, RoomNight
+from pms.kpi import rebuild_kpi
+from pms.services import FREE_STATUSES, build_room_nights
+
+
+class Command(BaseCommand):
+    help = "Пересобрать таблицу ночей (RoomNight) из проживаний (Stay)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hotel", type=int, help="ID отеля (по умолчанию — все)")
+        parser.add_argument("--batch", type=int, default=2000, help="Размер пачки для bulk_create")
+
+    @transaction.atomic
+    def handle(self, *args, **opts):
+        stays = Stay.objects.exclude(status__in=FREE_STATUSES).select_related("room").order_by("id")
+        nights = RoomNight.objects.all()
+        if opts["hotel"]:
+            stays = stays.filter(hotel_id=opts["hotel"])
+            nights = nights.filter(hotel_id=opts["hotel"])
+
+        deleted, _ = nights.delete()
+
+        buf, created = [], 0
+        for stay in stays.iterator(chunk_size=opts["batch"]):
+            buf.extend(build_room_nights(stay))
+            if len(buf) >= opts["batch"]:
+                RoomNight.objects.bulk_create(buf)
+                created += len(buf)
+                buf = []
+        if buf:
+            RoomNight.objects.bulk_create(buf)
+            created += len(buf)
+
+        # свод KPI считается из ночей — пересобираем вслед
+        kpi_rows = rebuild_kpi(hotel_ids=[opts["hotel"]] if opts["hotel"] else None)
+
+        self.stdout.write(self.style.SUCCESS(f"Удалено: {deleted}, создано: {created}, строк KPI: {kpi_rows}"))
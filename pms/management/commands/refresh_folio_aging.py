@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from pms.aging import refresh_aging
+
+
+class Command(BaseCommand):
+    help = "Пересчитать непогашенные начисления фолио (старение долга) для изменённых фолио."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hotel", type=int, action="append", help="ID отеля (можно несколько; по умолчанию — все)")
+        parser.add_argument("--full", action="store_true", help="Пересчитать все фолио, а не только изменённые")
+        parser.add_argument("--batch", type=int, default=500, help="Фолио в одной пачке")
+
+    def handle(self, *args, **opts):
+        done = refresh_aging(hotel_ids=opts["hotel"] or None, full=opts["full"], batch=opts["batch"])
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано фолио: {done}"))
@@ -0,0 +1,93 @@
+# Generated by Django 6.0 on 2026-10-18 10:11
+
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _stay_nights(check_in, check_out):
+    # копия pms.occupancy.stay_nights на момент миграции: от даты заезда до даты
+    # выезда (локальные даты), почасовое в пределах суток — одна ночь
+    first = timezone.localtime(check_in).date()
+    end = max(timezone.localtime(check_out).date(), first + timedelta(days=1))
+    return [first + timedelta(days=i) for i in range((end - first).days)]
+
+
+def fill_room_nights(apps, schema_editor):
+    Stay = apps.get_model("pms", "Stay")
+    RoomNight = apps.get_model("pms", "RoomNight")
+
+    buf = []
+    overlaps = []
+    last = {}  # номер -> (выезд, id) проживания, которое кончается позже всех
+    stays = (
+        Stay.objects.exclude(status__in=["canceled", "no_show"])
+        .select_related("room")
+        .order_by("room_id", "check_in", "id")
+    )
+    for st in stays.iterator(chunk_size=2000):
+        # старые двойные брони не выбрасываем: ночи пишем обеим, а пары — в лог
+        prev = last.get(st.room_id)
+        if prev and prev[0] > st.check_in:
+            overlaps.append((prev[1], st.id))
+        if not prev or st.check_out > prev[0]:
+            last[st.room_id] = (st.check_out, st.id)
+
+        nights = _stay_nights(st.check_in, st.check_out)
+        total = (st.amount or Decimal("0.00")) - (st.discount or Decimal("0.00"))
+        per_night = (total / len(nights)).quantize(Decimal("0.01"))
+        rest = total - per_night * (len(nights) - 1)
+        for i, d in enumerate(nights):
+            buf.append(RoomNight(
+                hotel_id=st.hotel_id, room_id=st.room_id, room_type_id=st.room.room_type_id,
+                stay_id=st.id, date=d, status=st.status,
+                revenue=rest if i == len(nights) - 1 else per_night,
+            ))
+        if len(buf) >= 2000:
+            RoomNight.objects.bulk_create(buf)
+            buf = []
+    if buf:
+        RoomNight.objects.bulk_create(buf)
+
+    if overlaps:
+        logger.warning(
+            "RoomNight: пересекающихся проживаний %s, проверьте вручную: %s",
+            len(overlaps), ", ".join(f"#{a}/#{b}" for a, b in overlaps[:200]),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0006_ddsarticle_hotels'),
+        ('pms', '0002_alter_companyfolio_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Ночь (дата)')),
+                ('status', models.CharField(choices=[('booked', 'Бронь'), ('in', 'Проживает'), ('out', 'Выехал'), ('canceled', 'Отменено'), ('no_show', 'Не заехал')], max_length=12, verbose_name='Статус')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка за ночь')),
+                ('hotel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='room_nights', to='dds.hotel', verbose_name='Отель')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='pms.room', verbose_name='Номер')),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='nights', to='pms.roomtype', verbose_name='Тип номера')),
+                ('stay', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='pms.stay', verbose_name='Проживание')),
+            ],
+            options={
+                'verbose_name': 'Ночь номера',
+                'verbose_name_plural': 'Ночи номеров',
+                'ordering': ['date', 'room_id'],
+                'indexes': [models.Index(fields=['hotel', 'date'], name='pms_roomnig_hotel_i_12877f_idx'), models.Index(fields=['room', 'date'], name='pms_roomnig_room_id_df9634_idx')],
+            },
+        ),
+        migrations.RunPython(fill_room_nights, migrations.RunPython.noop),
+    ]
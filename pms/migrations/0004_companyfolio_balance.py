@@ -0,0 +1,38 @@
+# Generated by Django 6.0 on 2026-10-18 10:39
+
+from django.db import migrations, models
+from django.db.models import Max, Sum
+
+
+def fill_folio_balances(apps, schema_editor):
+    CompanyFolio = apps.get_model("pms", "CompanyFolio")
+    CompanyFolioItem = apps.get_model("pms", "CompanyFolioItem")
+
+    rows = (
+        CompanyFolioItem.objects.values("folio_id")
+        .annotate(s=Sum("signed_amount"), last=Max("happened_at"))
+        .order_by()
+    )
+    for r in rows.iterator():
+        CompanyFolio.objects.filter(pk=r["folio_id"]).update(balance=r["s"] or 0, last_item_at=r["last"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pms', '0003_roomnight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companyfolio',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Баланс'),
+        ),
+        migrations.AddField(
+            model_name='companyfolio',
+            name='last_item_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последняя операция'),
+        ),
+        migrations.RunPython(fill_folio_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0012_cashincasso_hotel_index'),
+        ('pms', '0004_companyfolio_balance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companyfolio',
+            name='aging_dirty',
+            field=models.BooleanField(default=True, verbose_name='Пересчитать старение долга'),
+        ),
+        migrations.CreateModel(
+            name='FolioOpenCharge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('charge_day', models.DateField(verbose_name='День начисления')),
+                ('remaining', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='Остаток')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_charges', to='pms.company', verbose_name='Компания')),
+                ('folio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_charges', to='pms.companyfolio', verbose_name='Фолио')),
+                ('hotel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='folio_open_charges', to='dds.hotel', verbose_name='Отель')),
+            ],
+            options={
+                'verbose_name': 'Непогашенное начисление',
+                'verbose_name_plural': 'Непогашенные начисления',
+                'ordering': ['folio_id', 'charge_day'],
+                'indexes': [models.Index(fields=['hotel', 'charge_day'], name='pms_folioop_hotel_i_5f79b9_idx'), models.Index(fields=['folio'], name='pms_folioop_folio_i_d86602_idx')],
+            },
+        ),
+    ]
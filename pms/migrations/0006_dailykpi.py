@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-18 10:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dds', '0012_cashincasso_hotel_index'),
+        ('pms', '0005_folioopencharge'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyKPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День (ночь)')),
+                ('rooms_available', models.PositiveIntegerField(default=0, verbose_name='Номеров в продаже')),
+                ('rooms_sold', models.PositiveIntegerField(default=0, verbose_name='Продано ночей')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка')),
+                ('hotel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_kpi', to='dds.hotel', verbose_name='Отель')),
+                ('room_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_kpi', to='pms.roomtype', verbose_name='Тип номера')),
+            ],
+            options={
+                'verbose_name': 'KPI за день',
+                'verbose_name_plural': 'KPI по дням',
+                'ordering': ['day', 'room_type_id'],
+                'indexes': [models.Index(fields=['hotel', 'day'], name='pms_dailykp_hotel_i_9e02ab_idx')],
+                'constraints': [models.UniqueConstraint(fields=('room_type', 'day'), name='uniq_dailykpi_roomtype_day')],
+            },
+        ),
+    ]
@@ -2,7 +2,7 @@ from decimal import Decimal
 from collections import defaultdict
 from django.conf import settings
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import Q
 from django.utils import timezone
 
 
@@ -137,6 +137,13 @@ class CompanyFolio(models.Model):
     is_closed = models.BooleanField(default=False, verbose_name="Закрыто")
     closed_at = models.DateTimeField(null=True, blank=True, verbose_name="Дата закрытия")
 
+    # сумма signed_amount строк — ведётся pms.services.post_folio_item,
+    # сверяется командой rebuild_folio_balances
+    balance = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Баланс")
+    last_item_at = models.DateTimeField(null=True, blank=True, verbose_name="Последняя операция")
+    # строки менялись после последнего расчёта старения долга (pms.aging)
+    aging_dirty = models.BooleanField(default=True, verbose_name="Пересчитать старение долга")
+
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
 
     class Meta:
@@ -154,13 +161,8 @@ class CompanyFolio(models.Model):
     def __str__(self):
         return f"{self.hotel} • {self.company}"
 
-    @property
-    def balance(self) -> Decimal:
-        agg = self.items.aggregate(s=Sum("signed_amount"))
-        return agg["s"] or Decimal("0.00")
-
     def refresh_closed_flag(self):
-        bal = self.balance
+        bal = self.balance or Decimal("0.00")
         if bal <= 0 and not self.is_closed:
             self.is_closed = True
             self.closed_at = timezone.now()
@@ -216,6 +218,32 @@ class CompanyFolioItem(models.Model):
         return -a if item_type == CompanyFolioItem.PAYMENT else a
 
 
+class FolioOpenCharge(models.Model):
+    """
+    Непогашенный остаток начислений фолио по дню начисления — результат
+    FIFO-разнесения оплат (pms.aging). Отрицательный остаток — переплата (аванс).
+    Не зависит от даты отчёта, поэтому пересчитывается только для изменённых фолио.
+    """
+    folio = models.ForeignKey(CompanyFolio, on_delete=models.CASCADE, related_name="open_charges", verbose_name="Фолио")
+    # копии из фолио — отчёт группирует без join
+    hotel = models.ForeignKey("dds.Hotel", on_delete=models.CASCADE, related_name="folio_open_charges", verbose_name="Отель")
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name="open_charges", verbose_name="Компания")
+    charge_day = models.DateField(verbose_name="День начисления")
+    remaining = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="Остаток")
+
+    class Meta:
+        verbose_name = "Непогашенное начисление"
+        verbose_name_plural = "Непогашенные начисления"
+        ordering = ["folio_id", "charge_day"]
+        indexes = [
+            models.Index(fields=["hotel", "charge_day"]),
+            models.Index(fields=["folio"]),
+        ]
+
+    def __str__(self):
+        return f"{self.folio} • {self.charge_day}: {self.remaining}"
+
+
 class Booking(models.Model):
     """
     Бронь (для УНО/отчетов). Из нее можно создать Stay (заселение).
@@ -381,6 +409,66 @@ class Stay(models.Model):
         return (self.amount or Decimal("0.00")) - (self.discount or Decimal("0.00"))
 
 
+class RoomNight(models.Model):
+    """
+    Занятость номера по ночам: строка на (проживание, дата ночи) — для шахматки
+    и KPI. Почасовые проживания одного дня дают несколько строк на одну дату,
+    поэтому (номер, дата) не уникален: пересечения проверяются по времени
+    (pms.services.assert_no_overlap). Ведётся сервисами pms.services
+    (sync_room_nights) — руками не править.
+    """
+    hotel = models.ForeignKey("dds.Hotel", on_delete=models.CASCADE, related_name="room_nights", verbose_name="Отель")
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="nights", verbose_name="Номер")
+    room_type = models.ForeignKey(RoomType, on_delete=models.PROTECT, related_name="nights", verbose_name="Тип номера")
+    stay = models.ForeignKey(Stay, on_delete=models.CASCADE, related_name="nights", verbose_name="Проживание")
+
+    date = models.DateField(verbose_name="Ночь (дата)")
+    status = models.CharField(max_length=12, choices=Stay.STATUS_CHOICES, verbose_name="Статус")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Выручка за ночь")
+
+    class Meta:
+        verbose_name = "Ночь номера"
+        verbose_name_plural = "Ночи номеров"
+        ordering = ["date", "room_id"]
+        indexes = [
+            models.Index(fields=["hotel", "date"]),
+            models.Index(fields=["room", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.room} • {self.date}"
+
+
+class DailyKPI(models.Model):
+    """
+    Дневные показатели по типу номера: сколько номеров было в продаже,
+    сколько продано ночей и выручка за них. Считается из RoomNight (pms.kpi) —
+    отчёты по загрузке/ADR/RevPAR читают только эту таблицу.
+    Загрузка, ADR и RevPAR не храним — это отношения сумм за период.
+    """
+    hotel = models.ForeignKey("dds.Hotel", on_delete=models.CASCADE, related_name="daily_kpi", verbose_name="Отель")
+    room_type = models.ForeignKey(RoomType, on_delete=models.CASCADE, related_name="daily_kpi", verbose_name="Тип номера")
+    day = models.DateField(verbose_name="День (ночь)")
+
+    rooms_available = models.PositiveIntegerField(default=0, verbose_name="Номеров в продаже")
+    rooms_sold = models.PositiveIntegerField(default=0, verbose_name="Продано ночей")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="Выручка")
+
+    class Meta:
+        verbose_name = "KPI за день"
+        verbose_name_plural = "KPI по дням"
+        ordering = ["day", "room_type_id"]
+        constraints = [
+            models.UniqueConstraint(fields=["room_type", "day"], name="uniq_dailykpi_roomtype_day"),
+        ]
+        indexes = [
+            models.Index(fields=["hotel", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.room_type} • {self.day}: {self.rooms_sold}/{self.rooms_available}"
+
+
 class Guest(models.Model):
     hotel = models.ForeignKey("dds.Hotel", on_delete=models.PROTECT, related_name="guests", verbose_name="Отель")
     full_name = models.CharField(max_length=180, verbose_name="ФИО")
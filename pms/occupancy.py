@@ -0,0 +1,106 @@
+# pms/occupancy.py
+"""
+Движок занятости для шахматки.
+
+Вместо перебора "каждое проживание × каждый день" раскладываем проживания
+по номерам одним проходом по отсортированному списку и сразу получаем
+готовые строки для шаблона: пустые дни + занятые отрезки (start, colspan).
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Iterable, List, Tuple
+
+from django.utils import timezone
+
+
+def stay_day_span(stay, period_start_dt, period_end_dt, tz) -> Tuple[date, date]:
+    """
+    Первый и последний день (включительно), которые проживание
+    занимает на шахматке в пределах периода.
+    """
+    s = max(stay.check_in, period_start_dt)
+    e = min(stay.check_out, period_end_dt)
+    start_day = timezone.localtime(s, tz).date()
+    end_day = timezone.localtime(e - timedelta(seconds=1), tz).date()
+    return start_day, end_day
+
+
+def stay_night_bounds(check_in, check_out, tz=None) -> Tuple[date, date]:
+    """
+    (первая ночь, ночь после последней) — локальные даты.
+    Проживание в пределах одних суток (почасовое) занимает дату заезда.
+    """
+    tz = tz or timezone.get_current_timezone()
+    first = timezone.localtime(check_in, tz).date()
+    last = timezone.localtime(check_out, tz).date()
+    return first, max(last, first + timedelta(days=1))
+
+
+def stay_nights(check_in, check_out, tz=None) -> List[date]:
+    """Ночи проживания: от даты заезда до даты выезда, не включая её."""
+    first, end = stay_night_bounds(check_in, check_out, tz)
+    return [first + timedelta(days=i) for i in range((end - first).days)]
+
+
+def room_spans(stays: Iterable, period_start: date, n_days: int, period_start_dt, period_end_dt, tz) -> List[Tuple[int, int, object]]:
+    """
+    Проживания ОДНОГО номера (отсортированные по check_in) -> список
+    непересекающихся отрезков (start_col, colspan, stay).
+    Если вдруг есть пересечение (не должно быть) — оставляем первую запись,
+    как и раньше.
+    """
+    spans = []
+    cursor = 0  # первая свободная колонка
+    for st in stays:
+        start_day, end_day = stay_day_span(st, period_start_dt, period_end_dt, tz)
+        start_col = max((start_day - period_start).days, cursor)
+        end_col = min((end_day - period_start).days, n_days - 1)
+        if end_col < start_col:
+            continue
+        spans.append((start_col, end_col - start_col + 1, st))
+        cursor = end_col + 1
+    return spans
+
+
+def build_board_rows(
+    *,
+    rooms: Iterable,
+    stays: Iterable,
+    days: List[date],
+    period_start_dt,
+    period_end_dt,
+    tz=None,
+) -> List[dict]:
+    """
+    Готовые строки шахматки:
+      [{"room": room, "cells": [{"day": d, "day_iso": "YYYY-MM-DD", "colspan": n, "stay": st|None}, ...]}, ...]
+
+    stays должны быть отсортированы по check_in (порядок номеров не важен).
+    Пустой день — отдельная ячейка (colspan=1), чтобы в нём была кнопка "+".
+    """
+    tz = tz or timezone.get_current_timezone()
+    n_days = len(days)
+    period_start = days[0] if days else None
+    days_iso = [d.isoformat() for d in days]
+
+    by_room = defaultdict(list)
+    for st in stays:
+        by_room[st.room_id].append(st)
+
+    rows = []
+    for room in rooms:
+        cells = []
+        col = 0
+        if n_days:
+            for start_col, colspan, st in room_spans(by_room.get(room.id, ()), period_start, n_days, period_start_dt, period_end_dt, tz):
+                while col < start_col:
+                    cells.append({"day": days[col], "day_iso": days_iso[col], "colspan": 1, "stay": None})
+                    col += 1
+                cells.append({"day": days[start_col], "day_iso": days_iso[start_col], "colspan": colspan, "stay": st})
+                col = start_col + colspan
+            while col < n_days:
+                cells.append({"day": days[col], "day_iso": days_iso[col], "colspan": 1, "stay": None})
+                col += 1
+        rows.append({"room": room, "cells": cells})
+    return rows
+
@@ -6,12 +6,15 @@ from decimal import Decimal
 from datetime import datetime, time, timedelta
 from typing import Optional, Iterable
 
-from django.db import transaction
-from django.db.models import Q, F
+from django.db import connection, transaction
+from django.db.models import Case, F, Max, Q, QuerySet, Sum, Value, When
 from django.utils import timezone
 
-from .models import Stay, Room, CompanyFolio, CompanyFolioItem
+from .models import Stay, Room, RoomNight, CompanyFolio, CompanyFolioItem
+from .occupancy import stay_nights
+from .kpi import refresh_kpi_on_commit
 from dds.models import CashRegister, CashMovement, DDSOperation, DDSArticle, DDSCategory
+from dds.cash_services import apply_cash_movement
 
 
 class PMSConflictError(Exception):
@@ -32,8 +35,39 @@ def _period_overlap_q(start_dt, end_dt):
     return Q(check_in__lt=end_dt) & Q(check_out__gt=start_dt)
 
 
+# статусы, которые НЕ занимают номер
+FREE_STATUSES = (Stay.CANCELED, Stay.NO_SHOW)
+
+
+def _format_period(check_in, check_out) -> str:
+    """12.01 14:00–13.01 12:00 — в локальном времени."""
+    return f"{timezone.localtime(check_in):%d.%m %H:%M}–{timezone.localtime(check_out):%d.%m %H:%M}"
+
+
+def lock_rooms(room_ids):
+    """
+    Блокировка номеров до конца транзакции (select_for_update строк Room).
+    Всё, что занимает номер, берёт её перед проверкой пересечений — проверка
+    и запись по одному номеру идут по очереди, брони других номеров не ждут.
+    В SQLite FOR UPDATE нет: пустой UPDATE строк номеров берёт блокировку
+    записи (она там одна на базу) только этой транзакции — вызывать до чтений.
+    """
+    ids = room_ids if isinstance(room_ids, QuerySet) else set(room_ids)  # queryset — подзапросом
+    rooms = Room.objects.filter(id__in=ids).order_by("id")
+    if connection.features.has_select_for_update:
+        list(rooms.select_for_update().values_list("id", flat=True))
+    else:
+        rooms.update(id=F("id"))
+
+
 def assert_no_overlap(*, room: Room, start_dt, end_dt, exclude_stay_id: Optional[int] = None):
-    qs = Stay.objects.filter(room=room).exclude(status__in=[Stay.CANCELED, Stay.NO_SHOW])
+    """
+    Номер занят, если есть проживание, пересекающееся по времени
+    (check_in < end AND check_out > start). Именно по времени, а не по ночам:
+    почасовые 10–12 и 14–16 в один день не пересекаются, а выезд в 12:00
+    и заезд в 10:00 того же дня — пересекаются.
+    """
+    qs = Stay.objects.filter(room=room).exclude(status__in=FREE_STATUSES)
     qs = qs.filter(_period_overlap_q(start_dt, end_dt))
     if exclude_stay_id:
         qs = qs.exclude(id=exclude_stay_id)
@@ -41,20 +75,210 @@ def assert_no_overlap(*, room: Room, start_dt, end_dt, exclude_stay_id: Optional
         raise PMSConflictError(f"Номер {room.number} уже занят в выбранный период.")
 
 
-def ensure_cash_register(hotel) -> CashRegister:
-    register, _ = CashRegister.objects.get_or_create(hotel=hotel)
-    return register
+def build_room_nights(stay: Stay) -> list:
+    """
+    Строки RoomNight для проживания (без сохранения).
+    Сумма к оплате делится по ночам, копейки-остаток — на последнюю ночь.
+    """
+    if stay.status in FREE_STATUSES:
+        return []
+
+    nights = stay_nights(stay.check_in, stay.check_out)
+    total = _money(stay.total_to_pay)
+    per_night = (total / len(nights)).quantize(Decimal("0.01"))
+    rest = total - per_night * (len(nights) - 1)
+
+    return [
+        RoomNight(
+            hotel_id=stay.hotel_id,
+            room_id=stay.room_id,
+            room_type_id=stay.room.room_type_id,
+            stay_id=stay.id,
+            date=d,
+            status=stay.status,
+            revenue=rest if i == len(nights) - 1 else per_night,
+        )
+        for i, d in enumerate(nights)
+    ]
 
 
-def _register_field_for_method(method: str) -> str:
-    # CashRegister поля: cash_balance/mkassa_balance/zadatok_balance/optima_balance
-    mapping = {
-        DDSOperation.CASH: "cash_balance",
-        DDSOperation.MKASSA: "mkassa_balance",
-        DDSOperation.ZADATOK: "zadatok_balance",
-        DDSOperation.OPTIMA: "optima_balance",
+@transaction.atomic
+def claim_room_nights(stay: Stay, nights: list):
+    """
+    Занять номер: блокировка номера, повторная проверка пересечений по времени
+    (уже внутри транзакции — параллельная бронь к этому моменту либо закоммичена
+    и видна, либо ждёт блокировку), затем строки RoomNight.
+    При пересечении — PMSConflictError, транзакция откатывается.
+    """
+    if not nights:
+        return
+    lock_rooms([stay.room_id])
+    assert_no_overlap(room=stay.room, start_dt=stay.check_in, end_dt=stay.check_out, exclude_stay_id=stay.pk)
+    RoomNight.objects.bulk_create(nights)
+
+
+@transaction.atomic
+def sync_room_nights(stay: Stay):
+    """Пересобираем ночи проживания (после создания/изменения/отмены) и KPI задетых дней (после коммита)."""
+    old = RoomNight.objects.filter(stay_id=stay.id)
+    touched = list(old.values_list("hotel_id", "date"))
+    old.delete()
+    nights = build_room_nights(stay)
+    claim_room_nights(stay, nights)
+    refresh_kpi_on_commit(touched + [(n.hotel_id, n.date) for n in nights])
+
+
+def _sync_room_nights_status(stay: Stay):
+    # даты не менялись — достаточно обновить статус
+    RoomNight.objects.filter(stay_id=stay.id).update(status=stay.status)
+
+
+@transaction.atomic
+def save_stay(stay: Stay) -> Stay:
+    """
+    Создание/редактирование проживания:
+    проверка пересечений -> сохранение -> ночи в RoomNight.
+    Номер блокируется до проверки — параллельная бронь этого номера ждёт коммита
+    и дальше видит это проживание (PMSConflictError из claim_room_nights).
+    """
+    lock_rooms([stay.room_id])
+    assert_no_overlap(room=stay.room, start_dt=stay.check_in, end_dt=stay.check_out, exclude_stay_id=stay.pk)
+    stay.save()
+    sync_room_nights(stay)
+    return stay
+
+
+def _bulk_row(item) -> dict:
+    # (room, check_in, check_out) или dict с room/check_in/check_out и полями Stay
+    if isinstance(item, dict):
+        row = dict(item)
+    else:
+        room, check_in, check_out = item
+        row = {"room": room, "check_in": check_in, "check_out": check_out}
+    room = row.pop("room")
+    row["room_id"] = getattr(room, "pk", room)
+    return row
+
+
+@transaction.atomic
+def bulk_create_stays(*, hotel, requests: Iterable, user, defaults: Optional[dict] = None, all_or_nothing: bool = False) -> list:
+    """
+    Групповая бронь: много (номер, заезд, выезд) за раз.
+
+    requests — [(room|room_id, check_in, check_out), ...] или dict-ы
+    {"room": ..., "check_in": ..., "check_out": ..., "guest_name": ...} (остальные ключи — поля Stay).
+    defaults — общие поля для всех строк (company, stay_type, amount, status...).
+
+    Номера-кандидаты блокируются (lock_rooms), пересечения по времени — одним
+    запросом к Stay за общий период + пересечения строк между собой; дальше
+    Stay и RoomNight — bulk_create в той же транзакции.
+    all_or_nothing=True — при любом конфликте не создаём ничего.
+
+    Возвращает по строке на запрос (в том же порядке):
+      {"index": i, "room_id", "check_in", "check_out", "stay": Stay|None,
+       "ok": bool, "error": str, "conflicts": [{"check_in", "check_out", "stay_id", "row"}]}
+    stay_id — пересекающееся проживание, row — индекс строки этого же пакета.
+    """
+    defaults = dict(defaults or {})
+    rows = [_bulk_row(item) for item in requests]
+    results = [
+        {"index": i, "room_id": r["room_id"], "check_in": r["check_in"], "check_out": r["check_out"],
+         "stay": None, "ok": False, "error": "", "conflicts": []}
+        for i, r in enumerate(rows)
+    ]
+    if not rows:
+        return results
+
+    # блокировка — первой, до любых чтений (см. lock_rooms)
+    lock_rooms({r["room_id"] for r in rows})
+    rooms = {
+        room.id: room
+        for room in Room.objects.filter(hotel=hotel, id__in={r["room_id"] for r in rows}).select_related("room_type")
     }
-    return mapping.get(method, "cash_balance")
+
+    valid = []
+    for res, row in zip(results, rows):
+        room = rooms.get(row["room_id"])
+        if room is None:
+            res["error"] = f"Номер #{row['room_id']} не найден в отеле."
+        elif not room.is_active:
+            res["error"] = f"Номер {room.number} не активен."
+        elif row["check_out"] <= row["check_in"]:
+            res["error"] = "Выезд должен быть позже заезда."
+        else:
+            valid.append(res["index"])
+
+    # занятость номеров-кандидатов — один запрос, уже под блокировкой
+    busy = {}  # номер -> [(заезд, выезд, проживание)]
+    if valid:
+        room_ids = {rows[i]["room_id"] for i in valid}
+        period = _period_overlap_q(
+            min(rows[i]["check_in"] for i in valid),
+            max(rows[i]["check_out"] for i in valid),
+        )
+        for room_id, check_in, check_out, stay_id in (
+            Stay.objects.filter(period, room_id__in=room_ids)
+            .exclude(status__in=FREE_STATUSES)
+            .values_list("room_id", "check_in", "check_out", "id")
+        ):
+            busy.setdefault(room_id, []).append((check_in, check_out, stay_id))
+
+    status = defaults.get("status", Stay.BOOKED)
+    claimed = {}  # номер -> [(заезд, выезд, индекс строки пакета)]
+    for i in valid:
+        res, row = results[i], rows[i]
+        room_id, check_in, check_out = row["room_id"], row["check_in"], row["check_out"]
+        res["conflicts"] = [
+            {"check_in": ci, "check_out": co, "stay_id": stay_id, "row": None}
+            for ci, co, stay_id in busy.get(room_id, ()) if ci < check_out and co > check_in
+        ] + [
+            {"check_in": ci, "check_out": co, "stay_id": None, "row": j}
+            for ci, co, j in claimed.get(room_id, ()) if ci < check_out and co > check_in
+        ]
+        if res["conflicts"]:
+            who = [
+                f"проживание #{c['stay_id']}" if c["stay_id"] else f"строка {c['row'] + 1} пакета"
+                for c in res["conflicts"]
+            ]
+            periods = ", ".join(_format_period(c["check_in"], c["check_out"]) for c in res["conflicts"])
+            res["error"] = f"Номер {rooms[room_id].number} занят: {periods} ({', '.join(who)})."
+            continue
+        # отменённые/no-show номер не занимают
+        if row.get("status", status) not in FREE_STATUSES:
+            claimed.setdefault(room_id, []).append((check_in, check_out, i))
+        res["ok"] = True
+
+    if all_or_nothing and not all(r["ok"] for r in results):
+        for res in results:
+            if res["ok"]:
+                res["ok"] = False
+                res["error"] = "Пакет не создан: есть конфликты в других строках."
+        return results
+
+    ok = [res for res in results if res["ok"]]
+    if not ok:
+        return results
+
+    stays = []
+    for res in ok:
+        fields = {**defaults, **rows[res["index"]]}
+        fields.setdefault("created_by", user)
+        stay = Stay(hotel=hotel, **fields)
+        stay.room = rooms[stay.room_id]
+        stays.append(stay)
+
+    Stay.objects.bulk_create(stays)
+    nights = RoomNight.objects.bulk_create([n for st in stays for n in build_room_nights(st)], batch_size=2000)
+    refresh_kpi_on_commit((n.hotel_id, n.date) for n in nights)
+
+    for res, stay in zip(ok, stays):
+        res["stay"] = stay
+    return results
+
+
+def ensure_cash_register(hotel) -> CashRegister:
+    register, _ = CashRegister.objects.get_or_create(hotel=hotel)
+    return register
 
 
 def _cash_account_for_method(method: str) -> str:
@@ -99,31 +323,23 @@ def apply_cash_in(
     dds_operation: Optional[DDSOperation] = None,
 ) -> CashMovement:
     """
-    Приход денег (увеличиваем баланс нужного счета + пишем CashMovement).
+    Приход денег (CashMovement + баланс нужного счета) — через общий
+    dds.cash_services.apply_cash_movement.
     """
     amount = _money(amount)
     if amount <= 0:
         raise ValueError("Сумма должна быть больше 0.")
 
-    reg = ensure_cash_register(hotel)
-    field = _register_field_for_method(method)
-    account = _cash_account_for_method(method)
-
-    # Обновляем баланс атомарно
-    CashRegister.objects.filter(id=reg.id).update(**{field: F(field) + amount})
-
-    move = CashMovement.objects.create(
-        register=reg,
+    return apply_cash_movement(
         hotel=hotel,
+        account=_cash_account_for_method(method),
         direction=CashMovement.IN,
-        account=account,
         amount=amount,
+        created_by=user,
         happened_at=happened_at,
         comment=comment,
         dds_operation=dds_operation,
-        created_by=user,
     )
-    return move
 
 
 @transaction.atomic
@@ -157,6 +373,82 @@ def make_dds_income(
     return op
 
 
+@transaction.atomic
+def post_folio_item(
+    *,
+    folio: CompanyFolio,
+    item_type: str,
+    amount,
+    user,
+    happened_at=None,
+    description: str = "",
+    stay_id=None,
+    dds_operation=None,
+    cash_movement=None,
+) -> CompanyFolioItem:
+    """
+    Единственная точка записи строк фолио: строка + баланс фолио одним UPDATE с F()
+    (без агрегата по строкам), last_item_at — максимум дат строк.
+    """
+    amount = _money(amount)
+    happened_at = happened_at or timezone.now()
+    signed = CompanyFolioItem.make_signed(item_type, amount)
+
+    item = CompanyFolioItem.objects.create(
+        folio=folio,
+        item_type=item_type,
+        happened_at=happened_at,
+        description=description or "",
+        amount=amount,
+        signed_amount=signed,
+        stay_id=stay_id,
+        dds_operation=dds_operation,
+        cash_movement=cash_movement,
+        created_by=user,
+    )
+
+    CompanyFolio.objects.filter(pk=folio.pk).update(
+        balance=F("balance") + signed,
+        aging_dirty=True,
+        last_item_at=Case(
+            When(Q(last_item_at__isnull=True) | Q(last_item_at__lt=happened_at), then=Value(happened_at)),
+            default=F("last_item_at"),
+        ),
+    )
+    folio.refresh_from_db(fields=["balance", "last_item_at"])
+    folio.refresh_closed_flag()
+    return item
+
+
+def recalc_folio_balances(folio_ids=None) -> int:
+    """
+    Пересчитать balance/last_item_at по строкам (одним GROUP BY).
+    Явно переданные фолио считаются изменёнными — старение долга по ним
+    тоже пересчитается (pms.aging). Возвращает число исправленных фолио.
+    """
+    folios = CompanyFolio.objects.all()
+    items = CompanyFolioItem.objects.all()
+    if folio_ids is not None:
+        folios = folios.filter(pk__in=folio_ids)
+        items = items.filter(folio_id__in=folio_ids)
+        folios.update(aging_dirty=True)
+
+    expected = {
+        r["folio_id"]: (r["s"] or Decimal("0.00"), r["last"])
+        for r in items.values("folio_id").annotate(s=Sum("signed_amount"), last=Max("happened_at")).order_by()
+    }
+
+    fixed = 0
+    for folio in folios.iterator():
+        balance, last = expected.get(folio.id, (Decimal("0.00"), None))
+        if folio.balance != balance or folio.last_item_at != last:
+            folio.balance, folio.last_item_at, folio.aging_dirty = balance, last, True
+            folio.save(update_fields=["balance", "last_item_at", "aging_dirty"])
+            fixed += 1
+        folio.refresh_closed_flag()
+    return fixed
+
+
 @transaction.atomic
 def folio_charge_for_stay(*, stay: Stay, user, description: str = "") -> CompanyFolioItem:
     """
@@ -168,17 +460,14 @@ def folio_charge_for_stay(*, stay: Stay, user, description: str = "") -> Company
 
     folio, _ = CompanyFolio.objects.get_or_create(hotel=stay.hotel, company=stay.company)
 
-    amt = _money(stay.total_to_pay)
-    item = CompanyFolioItem.objects.create(
+    return post_folio_item(
         folio=folio,
-        kind=CompanyFolioItem.CHARGE,
-        happened_at=timezone.now(),
+        item_type=CompanyFolioItem.CHARGE,
+        amount=stay.total_to_pay,
+        user=user,
         description=description or f"Начисление проживания (Stay #{stay.id})",
-        amount=amt,
-        stay=stay,
-        created_by=user,
+        stay_id=stay.id,
     )
-    return item
 
 
 @transaction.atomic
@@ -202,6 +491,7 @@ def check_in_stay(
 
     stay.status = Stay.IN
     stay.save(update_fields=["status"])
+    _sync_room_nights_status(stay)
 
     # Корпоративное "в долг" -> фолио (без денег)
     if stay.stay_type == Stay.CORPORATE and stay.company and not pay_now:
@@ -255,6 +545,7 @@ def check_out_stay(*, stay: Stay, user):
     """
     stay.status = Stay.OUT
     stay.save(update_fields=["status"])
+    _sync_room_nights_status(stay)
 
     room = stay.room
     room.clean_status = Room.DIRTY
@@ -270,6 +561,7 @@ def cancel_stay(*, stay: Stay, user, reason: str = "Отмена"):
     """
     stay.status = Stay.CANCELED
     stay.save(update_fields=["status"])
+    sync_room_nights(stay)  # отменённая бронь номер не занимает
 
     if stay.dds_operation and not stay.dds_operation.is_voided:
         stay.dds_operation.void(user=user, reason=reason)
@@ -284,14 +576,6 @@ from dds.models import DDSArticle, DDSOperation, CashRegister, CashMovement
 from .models import CompanyFolio, CompanyFolioItem
 
 
-ACCOUNT_FIELD = {
-    CashMovement.ACC_CASH: "cash_balance",
-    CashMovement.ACC_MKASSA: "mkassa_balance",
-    CashMovement.ACC_ZADATOK: "zadatok_balance",
-    CashMovement.ACC_OPTIMA: "optima_balance",
-}
-
-
 def _get_default_income_article():
     # максимально безопасный дефолт — первый INCOME
     art = DDSArticle.objects.filter(kind=DDSArticle.INCOME, is_active=True).order_by("id").first()
@@ -319,8 +603,6 @@ def folio_add_payment(*, folio: CompanyFolio, user, amount: Decimal, method: str
     if article is None:
         raise ValueError("Нет статьи дохода (DDSArticle INCOME). Создай хотя бы одну.")
 
-    reg, _ = CashRegister.objects.get_or_create(hotel=hotel)
-
     # 1) DDS
     dds_op = DDSOperation.objects.create(
         hotel=hotel,
@@ -334,38 +616,26 @@ def folio_add_payment(*, folio: CompanyFolio, user, amount: Decimal, method: str
         created_by=user,
     )
 
-    # 2) CashMovement
-    cash_mv = CashMovement.objects.create(
-        register=reg,
+    # 2) CashMovement + 3) баланс кассы
+    cash_mv = apply_cash_movement(
         hotel=hotel,
-        direction=CashMovement.IN,
         account=method,  # совпадает с choices cash/mkassa/zadatok/optima
+        direction=CashMovement.IN,
         amount=amount,
-        happened_at=timezone.now(),
+        created_by=user,
+        happened_at=dds_op.happened_at,
         comment=f"Оплата по фолио: {company.name}",
         dds_operation=dds_op,
-        created_by=user,
     )
 
-    # 3) обновляем баланс кассы (быстро и безопасно)
-    field = ACCOUNT_FIELD.get(method)
-    if field:
-        CashRegister.objects.filter(pk=reg.pk).update(**{field: F(field) + amount})
-
-    # 4) Folio item
-    item = CompanyFolioItem.objects.create(
+    # 4) Folio item + баланс фолио (и закрыть долг, если погашено)
+    return post_folio_item(
         folio=folio,
         item_type=CompanyFolioItem.PAYMENT,
-        happened_at=timezone.now(),
-        description=f"Оплата ({method})",
         amount=amount,
-        signed_amount=CompanyFolioItem.make_signed(CompanyFolioItem.PAYMENT, amount),
+        user=user,
+        happened_at=dds_op.happened_at,
+        description=f"Оплата ({method})",
         dds_operation=dds_op,
         cash_movement=cash_mv,
-        created_by=user,
     )
-
-    # 5) закрыть долг если погашено
-    folio.refresh_closed_flag()
-
-    return item
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .channels import booking_months, invalidate_booking_months
+from .kpi import refresh_kpi
+from .models import Booking, DailyKPI, Room
+
+
+def _refresh_future_kpi(hotel_id):
+    # номера в продаже меняются с сегодняшнего дня; прошлые дни не трогаем
+    today = timezone.localdate()
+    last = DailyKPI.objects.filter(hotel_id=hotel_id, day__gte=today).aggregate(m=Max("day"))["m"]
+    if last:
+        refresh_kpi(hotel_ids=[hotel_id], date_from=today, date_to=last)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def refresh_kpi_on_room_change(sender, instance, **kwargs):
+    # новый номер, ремонт, снятие с продажи — меняют «номеров в продаже» в своде KPI
+    update_fields = kwargs.get("update_fields")
+    if update_fields and not {"is_active", "is_out_of_service", "room_type"} & set(update_fields):
+        return  # например, clean_status при выезде
+    hotel_id = instance.hotel_id
+    transaction.on_commit(lambda: _refresh_future_kpi(hotel_id))
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_months(sender, instance, **kwargs):
+    # при переносе даты брони/заезда сбросить надо и старые месяцы
+    instance._channel_old_months = []
+    if instance.pk:
+        old = Booking.objects.filter(pk=instance.pk).only("hotel_id", "booked_at", "check_in").first()
+        if old:
+            instance._channel_old_months = [(old.hotel_id, m) for m in booking_months(old)]
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def reset_channel_stats(sender, instance, **kwargs):
+    # закэшированные закрытые месяцы отчёта по каналам (pms.channels)
+    touched = getattr(instance, "_channel_old_months", []) + [(instance.hotel_id, m) for m in booking_months(instance)]
+
+    def reset():
+        for hotel_id in {h for h, _ in touched}:
+            invalidate_booking_months(hotel_id, [m for h, m in touched if h == hotel_id])
+
+    transaction.on_commit(reset)
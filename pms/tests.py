@@ -1,3 +1,242 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from dds.models import Hotel
+
+from .aging import aging_report, fifo_open_charges, refresh_aging
+from .models import Company, CompanyFolio, CompanyFolioItem, Room, RoomNight, RoomType, Stay
+from .services import PMSConflictError, bulk_create_stays, post_folio_item, save_stay, sync_room_nights
+
+DAY = date(2026, 3, 10)
+
+
+def at(days, hour=0):
+    """Момент DAY + days, hour:00 в текущей зоне."""
+    return timezone.make_aware(datetime.combine(DAY + timedelta(days=days), datetime.min.time()) + timedelta(hours=hour))
+
+
+class PMSTestData(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("frontdesk")
+        cls.hotel = Hotel.objects.create(name="Тестовый")
+        cls.room_type = RoomType.objects.create(hotel=cls.hotel, name="Стандарт")
+        cls.room = Room.objects.create(hotel=cls.hotel, number="101", room_type=cls.room_type)
+        cls.room2 = Room.objects.create(hotel=cls.hotel, number="102", room_type=cls.room_type)
+        cls.closed_room = Room.objects.create(hotel=cls.hotel, number="103", room_type=cls.room_type, is_active=False)
+
+    def make_stay(self, check_in, check_out, room=None, **fields):
+        return Stay.objects.create(
+            hotel=self.hotel, room=room or self.room, check_in=check_in, check_out=check_out,
+            created_by=self.user, **fields,
+        )
+
+
+class BulkCreateStaysTests(PMSTestData):
+    def create(self, requests, **kwargs):
+        return bulk_create_stays(hotel=self.hotel, requests=requests, user=self.user, **kwargs)
+
+    def test_creates_stays_and_nights(self):
+        rows = self.create([
+            (self.room, at(0, 14), at(2, 12)),
+            {"room": self.room2.id, "check_in": at(0, 14), "check_out": at(1, 12), "guest_name": "Иванов"},
+        ], defaults={"amount": Decimal("3000.00")})
+
+        self.assertEqual([r["ok"] for r in rows], [True, True])
+        self.assertEqual(rows[1]["stay"].guest_name, "Иванов")
+        nights = RoomNight.objects.filter(stay=rows[0]["stay"]).order_by("date")
+        self.assertEqual([n.date for n in nights], [DAY, DAY + timedelta(days=1)])
+        self.assertEqual(sum(n.revenue for n in nights), Decimal("3000.00"))
+
+    def test_per_row_errors_do_not_block_other_rows(self):
+        other_hotel = Hotel.objects.create(name="Чужой")
+        foreign = Room.objects.create(
+            hotel=other_hotel, number="1", room_type=RoomType.objects.create(hotel=other_hotel, name="Люкс"),
+        )
+        rows = self.create([
+            (foreign, at(0, 14), at(1, 12)),
+            (self.closed_room, at(0, 14), at(1, 12)),
+            (self.room, at(1, 12), at(1, 12)),
+            (self.room2, at(0, 14), at(1, 12)),
+        ])
+
+        self.assertEqual([r["ok"] for r in rows], [False, False, False, True])
+        self.assertIn("не найден", rows[0]["error"])
+        self.assertIn("не активен", rows[1]["error"])
+        self.assertIn("позже заезда", rows[2]["error"])
+        self.assertEqual(Stay.objects.filter(hotel=self.hotel).count(), 1)
+
+    def test_conflict_with_existing_stay(self):
+        existing = self.make_stay(at(0, 14), at(2, 12))
+
+        rows = self.create([(self.room, at(1, 14), at(3, 12)), (self.room, at(2, 12), at(3, 12))])
+
+        self.assertFalse(rows[0]["ok"])
+        self.assertEqual([c["stay_id"] for c in rows[0]["conflicts"]], [existing.id])
+        self.assertIn(f"проживание #{existing.id}", rows[0]["error"])
+        # заезд ровно в момент выезда — не пересечение
+        self.assertTrue(rows[1]["ok"])
+
+    def test_conflict_between_rows_of_batch(self):
+        rows = self.create([
+            (self.room, at(0, 14), at(2, 12)),
+            (self.room, at(1, 10), at(1, 20)),
+            (self.room2, at(1, 10), at(1, 20)),
+        ])
+
+        self.assertEqual([r["ok"] for r in rows], [True, False, True])
+        self.assertEqual(rows[1]["conflicts"][0]["row"], 0)
+        self.assertIn("строка 1 пакета", rows[1]["error"])
+
+    def test_hourly_stays_on_same_day(self):
+        rows = self.create([
+            (self.room, at(0, 10), at(0, 12)),
+            (self.room, at(0, 14), at(0, 16)),
+            (self.room, at(0, 11), at(0, 15)),
+        ])
+
+        self.assertEqual([r["ok"] for r in rows], [True, True, False])
+        self.assertEqual(len(rows[2]["conflicts"]), 2)
+        self.assertEqual(RoomNight.objects.filter(room=self.room, date=DAY).count(), 2)
+
+    def test_free_statuses_do_not_block(self):
+        self.make_stay(at(0, 14), at(2, 12), status=Stay.CANCELED)
+
+        rows = self.create([
+            {"room": self.room, "check_in": at(0, 14), "check_out": at(1, 12), "status": Stay.NO_SHOW},
+            (self.room, at(0, 14), at(1, 12)),
+        ])
+
+        self.assertEqual([r["ok"] for r in rows], [True, True])
+        # no-show номер не занимает и ночей не пишет
+        self.assertFalse(RoomNight.objects.filter(stay=rows[0]["stay"]).exists())
+
+    def test_all_or_nothing(self):
+        self.make_stay(at(0, 14), at(1, 12), room=self.room2)
+
+        rows = self.create([
+            (self.room, at(0, 14), at(1, 12)),
+            (self.room2, at(0, 14), at(1, 12)),
+        ], all_or_nothing=True)
+
+        self.assertEqual([r["ok"] for r in rows], [False, False])
+        self.assertIn("Пакет не создан", rows[0]["error"])
+        self.assertEqual(Stay.objects.filter(room=self.room).count(), 0)
+
+
+class SaveStayOverlapTests(PMSTestData):
+    def save(self, check_in, check_out, room=None, **fields):
+        return save_stay(Stay(
+            hotel=self.hotel, room=room or self.room, check_in=check_in, check_out=check_out,
+            created_by=self.user, **fields,
+        ))
+
+    def test_overlap_rejected_and_rolled_back(self):
+        self.save(at(0, 14), at(2, 12))
+
+        with self.assertRaises(PMSConflictError):
+            self.save(at(1, 14), at(3, 12))
+        self.assertEqual(Stay.objects.filter(room=self.room).count(), 1)
+
+    def test_check_in_before_check_out_on_same_day(self):
+        # A: 14:00 — 12:00 следующего дня; B заезжает в 10:00 того же дня выезда
+        self.save(at(0, 14), at(1, 12))
+
+        with self.assertRaises(PMSConflictError):
+            self.save(at(1, 10), at(1, 20))
+        self.save(at(1, 12), at(1, 20))
+
+    def test_hourly_stays_on_same_day(self):
+        self.save(at(0, 10), at(0, 12))
+        self.save(at(0, 14), at(0, 16))
+
+        with self.assertRaises(PMSConflictError):
+            self.save(at(0, 11), at(0, 15))
+        self.assertEqual(RoomNight.objects.filter(room=self.room, date=DAY).count(), 2)
+
+    def test_other_room_and_free_statuses_do_not_block(self):
+        self.save(at(0, 14), at(2, 12))
+        self.save(at(0, 14), at(2, 12), room=self.room2)
+        self.make_stay(at(3, 14), at(4, 12), status=Stay.CANCELED)
+
+        self.save(at(3, 14), at(4, 12))
+
+    def test_edit_does_not_conflict_with_itself(self):
+        stay = self.save(at(0, 14), at(2, 12))
+        stay.check_out = at(3, 12)
+        save_stay(stay)
+
+        self.assertEqual(RoomNight.objects.filter(stay=stay).count(), 3)
+
+    def test_claim_rechecks_inside_transaction(self):
+        # запись в обход предварительной проверки (как параллельная бронь) — ловит claim_room_nights
+        self.save(at(0, 14), at(2, 12))
+        with self.assertRaises(PMSConflictError), transaction.atomic():
+            stay = self.make_stay(at(1, 14), at(3, 12))
+            sync_room_nights(stay)
+        self.assertEqual(Stay.objects.filter(room=self.room).count(), 1)
+
+
+class AgingTests(PMSTestData):
+    def setUp(self):
+        self.folio = CompanyFolio.objects.create(hotel=self.hotel, company=Company.objects.create(name="ООО Ромашка"))
+
+    def post(self, item_type, amount, days):
+        post_folio_item(folio=self.folio, item_type=item_type, amount=amount, user=self.user, happened_at=at(days, 12))
+
+    def test_fifo_pays_oldest_first(self):
+        rows = fifo_open_charges([
+            (Decimal("1000"), at(-100, 12)),
+            (Decimal("500"), at(-45, 12)),
+            (Decimal("200"), at(-5, 12)),
+            (Decimal("-1200"), at(-1, 12)),
+        ])
+
+        self.assertEqual(rows, [(DAY - timedelta(days=45), Decimal("300")), (DAY - timedelta(days=5), Decimal("200"))])
+
+    def test_fifo_overpayment_is_credit_and_absorbs_next_charge(self):
+        rows = fifo_open_charges([
+            (Decimal("100"), at(-10, 12)),
+            (Decimal("-150"), at(-8, 12)),
+            (Decimal("30"), at(-3, 12)),
+        ])
+
+        self.assertEqual(rows, [(DAY - timedelta(days=8), Decimal("-20"))])
+
+    def test_fifo_merges_charges_of_one_day(self):
+        rows = fifo_open_charges([(Decimal("100"), at(0, 9)), (Decimal("50"), at(0, 18))])
+
+        self.assertEqual(rows, [(DAY, Decimal("150"))])
+
+    def test_report_buckets_after_refresh(self):
+        self.post(CompanyFolioItem.CHARGE, "1000.00", -100)
+        self.post(CompanyFolioItem.CHARGE, "500.00", -45)
+        self.post(CompanyFolioItem.CHARGE, "200.00", -5)
+        self.post(CompanyFolioItem.PAYMENT, "1200.00", -1)
+
+        self.assertEqual(refresh_aging(hotel_ids=[self.hotel.id]), 1)
+        rows, totals = aging_report(hotels=[self.hotel], as_of=DAY)
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(
+            {code: rows[0][code] for code in ("d0_30", "d31_60", "d61_90", "d90_plus", "credit", "total")},
+            {"d0_30": Decimal("200"), "d31_60": Decimal("300"), "d61_90": 0, "d90_plus": 0, "credit": 0, "total": Decimal("500")},
+        )
+        self.assertEqual(totals["total"], Decimal("500"))
+
+    def test_refresh_only_dirty_folios(self):
+        self.post(CompanyFolioItem.CHARGE, "100.00", -1)
+        self.assertEqual(refresh_aging(), 1)
+        # флаг снят — повторный пересчёт ничего не делает, пустой список отелей — тоже
+        self.assertEqual(refresh_aging(), 0)
+        self.assertEqual(refresh_aging(hotel_ids=[]), 0)
 
-# Create your tests here.
+        self.post(CompanyFolioItem.PAYMENT, "150.00", 0)
+        self.assertEqual(refresh_aging(), 1)
+        _, totals = aging_report(hotels=[self.hotel], as_of=DAY)
+        self.assertEqual((totals["credit"], totals["total"]), (Decimal("-50"), Decimal("-50")))
@@ -5,8 +5,11 @@
 
 from collections import defaultdict
 from datetime import date, datetime, time, timedelta
+from urllib.parse import urlencode
+
 from django.urls import reverse
 from django import forms
+from django.http import Http404, HttpResponse, JsonResponse
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
@@ -15,21 +18,16 @@ from django.utils import timezone
 from .models import Room, RoomType, Stay, Booking
 from .services import (
     PMSConflictError,
-    assert_no_overlap,
+    save_stay,
     check_in_stay,
     check_out_stay,
     cancel_stay,
 )
+from .occupancy import build_board_rows
+from .availability import search_availability
+from dds.catalog import catalog_field, get_catalog
 from dds.models import DDSOperation, DDSArticle
-
-
-# если у тебя есть ограничение "какие отели доступны пользователю" — используй свой helper
-try:
-    from dds.utils import _user_hotels_qs  # если у тебя так
-except Exception:
-    from dds.models import Hotel
-    def _user_hotels_qs(user):
-        return Hotel.objects.filter(is_active=True)
+from dds.scope import get_scope
 
 from typing import Optional
 def _parse_date(s: str) -> Optional[date]:
@@ -83,6 +81,11 @@ class StayCreateForm(forms.ModelForm):
             "check_out": forms.DateTimeInput(attrs={"type": "datetime-local"}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # подпись номера — «отель — номер»: без select_related по запросу на каждый вариант
+        self.fields["room"].queryset = Room.objects.select_related("hotel")
+
 
 class CheckInForm(forms.Form):
     pay_now = forms.BooleanField(required=False, initial=True, label="Оплата сейчас?")
@@ -94,6 +97,11 @@ class CheckInForm(forms.Form):
         label="Статья ДДС (доход)",
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        articles = get_catalog().articles_for(kind=DDSArticle.INCOME, any_hotel=True, order=("kind", "category_id", "name"))
+        self.fields["article"] = catalog_field(self.fields["article"], articles)
+
 
 from datetime import datetime, time, timedelta
 from django.db.models import Q
@@ -101,48 +109,31 @@ from django.utils import timezone
 from django.shortcuts import get_object_or_404, render
 from django.contrib.auth.decorators import login_required
 
-@login_required
-def board(request):
-    hotels = _user_hotels_qs(request.user)
+# статусы, которые НЕ показываем на шахматке
+# (чтобы не зависеть от твоих констант в модели)
+BOARD_HIDDEN_STATUSES = {"canceled", "cancelled", "no_show"}
 
-    hotel_id = request.GET.get("hotel") or ""
-    if hotel_id:
-        selected_hotel = get_object_or_404(hotels, id=hotel_id)
-    else:
-        selected_hotel = hotels.first()
 
-    if not selected_hotel:
-        return render(request, "pms/board.html", {"hotels": hotels, "selected_hotel": None})
-
-    view_mode = request.GET.get("view") or "week"   # week|month
-    start_param = request.GET.get("start") or ""
-    start_date = _parse_date(start_param) or timezone.localdate()
+def _board_params(request) -> dict:
+    """Параметры шахматки из GET: вид, дата начала, фильтры."""
+    return {
+        "view_mode": request.GET.get("view") or "week",   # week|month
+        "start_date": _parse_date(request.GET.get("start") or "") or timezone.localdate(),
+        "floor": (request.GET.get("floor") or "").strip(),
+        "room_type_id": request.GET.get("room_type") or "",
+    }
 
-    floor = (request.GET.get("floor") or "").strip()
-    room_type_id = request.GET.get("room_type") or ""
 
-    # период
+def _board_period(view_mode: str, start_date: date):
     if view_mode == "month":
-        period_start, period_end = _month_range(start_date)  # end = первый день след. месяца (exclusive)
-    else:
-        period_start, period_end = _week_range(start_date)   # end = +7 дней (exclusive)
+        return _month_range(start_date)  # end = первый день след. месяца (exclusive)
+    return _week_range(start_date)       # end = +7 дней (exclusive)
 
-    days = list(_daterange(period_start, period_end))
 
-    # главное: month -> делим на недели по 7 дней (без горизонтального скролла)
-    if view_mode == "month":
-        day_chunks = [days[i:i+7] for i in range(0, len(days), 7)]
-    else:
-        day_chunks = [days]
-
-    tz = timezone.get_current_timezone()
-    period_start_dt = timezone.make_aware(datetime.combine(period_start, time.min), timezone=tz)
-    period_end_dt = timezone.make_aware(datetime.combine(period_end, time.min), timezone=tz)
-
-    # номера
+def _board_rooms_qs(hotel, floor="", room_type_id=""):
     rooms_qs = (
         Room.objects
-        .filter(hotel=selected_hotel, is_active=True)
+        .filter(hotel=hotel, is_active=True)
         .select_related("room_type")
         .order_by("floor", "number")
     )
@@ -153,38 +144,102 @@ def board(request):
             pass
     if room_type_id:
         rooms_qs = rooms_qs.filter(room_type_id=room_type_id)
+    return rooms_qs
+
 
+def _board_rows(hotel, rooms_qs, days):
+    """Строки шахматки по номерам rooms_qs за дни days: два запроса (номера + проживания)."""
     rooms = list(rooms_qs)
+    if not days:
+        return rooms, build_board_rows(rooms=rooms, stays=(), days=days, period_start_dt=None, period_end_dt=None)
 
-    # статусы, которые НЕ показываем на шахматке
-    # (чтобы не зависеть от твоих констант в модели)
-    hidden_statuses = {"canceled", "cancelled", "no_show"}
+    tz = timezone.get_current_timezone()
+    period_start_dt = timezone.make_aware(datetime.combine(days[0], time.min), timezone=tz)
+    period_end_dt = timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min), timezone=tz)
 
     # проживание/брони, которые пересекаются с периодом
     stays_qs = (
         Stay.objects
-        .filter(hotel=selected_hotel, room__in=rooms_qs)
-        .exclude(status__in=hidden_statuses)
+        .filter(hotel=hotel, room_id__in=[r.id for r in rooms])
+        .exclude(status__in=BOARD_HIDDEN_STATUSES)
         .filter(check_in__lt=period_end_dt, check_out__gt=period_start_dt)
         .select_related("room", "company", "booking")
         .order_by("check_in")
     )
-    stays = list(stays_qs)
 
-    # cell_map: ключ "room_id:YYYY-MM-DD" -> stay
-    cell_map = {}
-    for st in stays:
-        s = max(st.check_in, period_start_dt)
-        e = min(st.check_out, period_end_dt)
+    # строки шахматки: по номеру — пустые дни + занятые отрезки (colspan)
+    board_rows = build_board_rows(
+        rooms=rooms,
+        stays=list(stays_qs),
+        days=days,
+        period_start_dt=period_start_dt,
+        period_end_dt=period_end_dt,
+        tz=tz,
+    )
+    return rooms, board_rows
+
+
+def _board_qs(view_mode: str, start_date: date) -> str:
+    """view/start для ссылок из ячеек: после действия вернуться на тот же период."""
+    return urlencode({"view": view_mode, "start": start_date.isoformat()})
+
+
+def _board_url(request, hotel_id) -> str:
+    """Шахматка отеля с тем же видом и периодом, что в GET запроса (если были)."""
+    params = {"hotel": hotel_id}
+    for key in ("view", "start"):
+        if request.GET.get(key):
+            params[key] = request.GET[key]
+    return f"{reverse('pms:board')}?{urlencode(params)}"
+
+
+def _is_fragment(request) -> bool:
+    """Частичное обновление шахматки: запрос из её скрипта (HX-Request, как у htmx) или ?fragment=1."""
+    return request.headers.get("HX-Request") == "true" or request.GET.get("fragment") == "1"
+
+
+def _board_row_response(request, room_id, *, status=200):
+    """Одна строка шахматки (<tr>) для номера — за вид/период из GET."""
+    room = get_object_or_404(Room.objects.select_related("room_type"), id=room_id, hotel_id__in=get_scope(request).ids)
+    params = _board_params(request)
+    period_start, period_end = _board_period(params["view_mode"], params["start_date"])
+    days = list(_daterange(period_start, period_end))
 
-        start_day = timezone.localtime(s, tz).date()
-        end_day = timezone.localtime(e - timedelta(seconds=1), tz).date()
+    _, board_rows = _board_rows(room.hotel_id, [room], days)
+    return render(request, "pms/_board_row.html", {
+        "row": board_rows[0],
+        "view_mode": params["view_mode"],
+        "board_qs": _board_qs(params["view_mode"], period_start),
+        "stay_create_url": reverse("pms:stay_create"),
+    }, status=status)
 
-        for d in days:
-            if start_day <= d <= end_day:
-                k = f"{st.room_id}:{d.isoformat()}"
-                # если вдруг пересечение (не должно быть) — оставляем первую запись
-                cell_map.setdefault(k, st)
+
+@login_required
+def board(request):
+    scope = get_scope(request)
+    hotels = scope.hotels()
+
+    selected_hotel = scope.selected_or_first(request.GET.get("hotel") or "")
+
+    if not selected_hotel:
+        return render(request, "pms/board.html", {"hotels": hotels, "selected_hotel": None})
+
+    params = _board_params(request)
+    view_mode = params["view_mode"]
+    floor = params["floor"]
+    room_type_id = params["room_type_id"]
+
+    # период
+    period_start, period_end = _board_period(view_mode, params["start_date"])
+    days = list(_daterange(period_start, period_end))
+
+    # главное: month -> делим на недели по 7 дней (без горизонтального скролла)
+    if view_mode == "month":
+        day_chunks = [days[i:i+7] for i in range(0, len(days), 7)]
+    else:
+        day_chunks = [days]
+
+    rooms, board_rows = _board_rows(selected_hotel, _board_rooms_qs(selected_hotel, floor, room_type_id), days)
 
     room_types = RoomType.objects.filter(hotel=selected_hotel, is_active=True).order_by("name")
 
@@ -197,30 +252,72 @@ def board(request):
         "period_end": period_end,
         "days": days,
         "day_chunks": day_chunks,   # ВАЖНО для шаблона без горизонтального скролла
+        "board_qs": _board_qs(view_mode, period_start),
 
         "floor": floor,
         "room_type_id": room_type_id,
         "room_types": room_types,
 
         "rooms": rooms,
-        "cell_map": cell_map,
+        "board_rows": board_rows,
+        "stay_create_url": reverse("pms:stay_create"),
     }
     return render(request, "pms/board.html", context)
 
 
+@login_required
+def board_row(request, room_id: int):
+    """
+    Фрагмент: строка шахматки одного номера.
+    /pms/board/row/<room_id>/?view=week&start=2026-01-12
+    """
+    return _board_row_response(request, room_id)
+
+
+@login_required
+def board_chunk(request):
+    """
+    Фрагмент: таблица шахматки на одну неделю (7 дней с start) по всем номерам отеля.
+    /pms/board/chunk/?hotel=1&start=2026-01-12&floor=&room_type=
+    Листание недель без перезагрузки страницы; в месяце — подгрузка по неделе.
+    """
+    scope = get_scope(request)
+    hotel = scope.selected_or_first(request.GET.get("hotel") or "")
+    if not hotel:
+        raise Http404("Нет доступных отелей.")
+
+    params = _board_params(request)
+    start = params["start_date"]
+    if params["view_mode"] == "week":
+        start, _ = _week_range(start)
+    days = list(_daterange(start, start + timedelta(days=7)))
+
+    rooms, board_rows = _board_rows(hotel, _board_rooms_qs(hotel, params["floor"], params["room_type_id"]), days)
+    return render(request, "pms/_board_table.html", {
+        "selected_hotel": hotel,
+        "view_mode": "week",
+        "period_start": start,
+        "period_end": start + timedelta(days=7),
+        "days": days,
+        "board_qs": _board_qs("week", start),
+        "board_rows": board_rows,
+        "stay_create_url": reverse("pms:stay_create"),
+    })
+
+
 
 @login_required
 def stay_create(request):
-    hotels = _user_hotels_qs(request.user)
+    scope = get_scope(request)
     hotel_id = request.GET.get("hotel") or ""
     room_id = request.GET.get("room") or ""
     day_s = request.GET.get("day") or ""
 
     initial = {}
     if hotel_id:
-        initial["hotel"] = get_object_or_404(hotels, id=hotel_id)
+        initial["hotel"] = scope.get_hotel(hotel_id)
     if room_id:
-        initial["room"] = get_object_or_404(Room, id=room_id)
+        initial["room"] = get_object_or_404(Room.objects.select_related("hotel"), id=room_id, hotel_id__in=scope.ids)
         initial["hotel"] = initial["room"].hotel
 
     # если кликнули на конкретный день — подставим чек-ин/чек-аут
@@ -241,12 +338,11 @@ def stay_create(request):
             stay.created_by = request.user
 
             try:
-                assert_no_overlap(room=stay.room, start_dt=stay.check_in, end_dt=stay.check_out, exclude_stay_id=None)
+                save_stay(stay)
             except PMSConflictError as e:
                 form.add_error(None, str(e))
                 return render(request, "pms/stay_form.html", {"form": form})
 
-            stay.save()
             messages.success(request, "Запись создана.")
             url = reverse("pms:board")
             return redirect(f"{url}?hotel={stay.hotel_id}")
@@ -260,8 +356,7 @@ def stay_create(request):
 @login_required
 def stay_edit(request, pk: int):
     stay = get_object_or_404(Stay, pk=pk)
-    hotels = _user_hotels_qs(request.user)
-    if stay.hotel_id not in hotels.values_list("id", flat=True):
+    if stay.hotel_id not in get_scope(request):
         return redirect("pms:board")
 
     if request.method == "POST":
@@ -270,14 +365,13 @@ def stay_edit(request, pk: int):
             st = form.save(commit=False)
 
             try:
-                assert_no_overlap(room=st.room, start_dt=st.check_in, end_dt=st.check_out, exclude_stay_id=st.id)
+                save_stay(st)
             except PMSConflictError as e:
                 form.add_error(None, str(e))
                 return render(request, "pms/stay_form.html", {"form": form, "stay": stay})
 
-            st.save()
             messages.success(request, "Сохранено.")
-            return redirect("pms:board") + f"?hotel={st.hotel_id}"
+            return redirect(_board_url(request, st.hotel_id))
     else:
         form = StayCreateForm(instance=stay)
 
@@ -287,8 +381,7 @@ def stay_edit(request, pk: int):
 @login_required
 def stay_checkin(request, pk: int):
     stay = get_object_or_404(Stay, pk=pk)
-    hotels = _user_hotels_qs(request.user)
-    if stay.hotel_id not in hotels.values_list("id", flat=True):
+    if stay.hotel_id not in get_scope(request):
         return redirect("pms:board")
 
     if request.method == "POST":
@@ -308,43 +401,104 @@ def stay_checkin(request, pk: int):
                     paid_amount=paid_amount,
                     dds_article=article,
                 )
-                messages.success(request, "Заселение выполнено.")
-                return redirect("pms:board") + f"?hotel={stay.hotel_id}"
             except Exception as e:
+                if _is_fragment(request):
+                    return HttpResponse(str(e), status=409)
                 messages.error(request, str(e))
+            else:
+                if _is_fragment(request):
+                    return _board_row_response(request, stay.room_id)
+                messages.success(request, "Заселение выполнено.")
+                return redirect(_board_url(request, stay.hotel_id))
     else:
         form = CheckInForm(initial={"method": DDSOperation.CASH, "pay_now": True})
 
-    return render(request, "pms/stay_checkin.html", {"stay": stay, "form": form})
+    return render(request, "pms/stay_checkin.html", {
+        "stay": stay,
+        "form": form,
+        "board_url": _board_url(request, stay.hotel_id),
+    })
 
 
 @login_required
 def stay_checkout(request, pk: int):
     stay = get_object_or_404(Stay, pk=pk)
-    hotels = _user_hotels_qs(request.user)
-    if stay.hotel_id not in hotels.values_list("id", flat=True):
+    if stay.hotel_id not in get_scope(request):
         return redirect("pms:board")
 
     try:
         check_out_stay(stay=stay, user=request.user)
-        messages.success(request, "Выезд выполнен. Номер помечен как 'Не убран'.")
     except Exception as e:
+        if _is_fragment(request):
+            return HttpResponse(str(e), status=409)
         messages.error(request, str(e))
+    else:
+        # изменилась только строка этого номера — её и отдаём
+        if _is_fragment(request):
+            return _board_row_response(request, stay.room_id)
+        messages.success(request, "Выезд выполнен. Номер помечен как 'Не убран'.")
 
-    return redirect("pms:board") + f"?hotel={stay.hotel_id}"
+    return redirect(_board_url(request, stay.hotel_id))
 
 
 @login_required
 def stay_cancel(request, pk: int):
     stay = get_object_or_404(Stay, pk=pk)
-    hotels = _user_hotels_qs(request.user)
-    if stay.hotel_id not in hotels.values_list("id", flat=True):
+    if stay.hotel_id not in get_scope(request):
         return redirect("pms:board")
 
     try:
         cancel_stay(stay=stay, user=request.user, reason="Отмена из шахматки")
-        messages.success(request, "Отменено.")
     except Exception as e:
+        if _is_fragment(request):
+            return HttpResponse(str(e), status=409)
         messages.error(request, str(e))
+    else:
+        if _is_fragment(request):
+            return _board_row_response(request, stay.room_id)
+        messages.success(request, "Отменено.")
+
+    return redirect(_board_url(request, stay.hotel_id))
 
-    return redirect("pms:board") + f"?hotel={stay.hotel_id}"
+
+@login_required
+def availability_json(request):
+    """
+    /pms/availability/?hotel=1&room_type=2&room_type=3&window=2026-01-10:2026-01-15&window=...
+    (или date_from/date_to вместо window)
+    Свободные номера по каждому типу и каждому периоду.
+    """
+    hotel = get_scope(request).selected_or_first(request.GET.get("hotel") or "")
+    if not hotel:
+        return JsonResponse({"error": "Нет доступных отелей."}, status=404)
+
+    windows = []
+    for w in request.GET.getlist("window"):
+        a, _, b = w.partition(":")
+        windows.append((_parse_date(a), _parse_date(b)))
+    date_from = _parse_date(request.GET.get("date_from") or "")
+    date_to = _parse_date(request.GET.get("date_to") or "")
+    if date_from and date_to:
+        windows.append((date_from, date_to))
+
+    if not windows:
+        return JsonResponse({"error": "Укажите период: window=YYYY-MM-DD:YYYY-MM-DD или date_from/date_to."}, status=400)
+
+    room_type_ids = [int(x) for x in request.GET.getlist("room_type") if x.isdigit()]
+
+    results = search_availability(hotel=hotel, windows=windows, room_type_ids=room_type_ids)
+
+    return JsonResponse({
+        "hotel": hotel.id,
+        "results": [
+            {
+                "room_type": {"id": r["room_type"].id, "name": r["room_type"].name},
+                "date_from": r["date_from"].isoformat(),
+                "date_to": r["date_to"].isoformat(),
+                "total": r["total"],
+                "free_count": len(r["free"]),
+                "free": [{"id": room.id, "number": room.number, "floor": room.floor} for room in r["free"]],
+            }
+            for r in results
+        ],
+    })
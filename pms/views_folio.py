@@ -2,8 +2,11 @@ from django.contrib.auth.decorators import login_required
 from django.db.models import Q
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
+from django.utils import timezone
 
-from dds.views import _user_hotels_qs  # или твоя функция user_hotels_qs
+from dds.scope import get_scope
+from dds.views import _parse_date
+from .aging import BUCKETS, aging_report, refresh_aging
 from .models import CompanyFolio
 from .forms import FolioPaymentForm
 from .services import folio_add_payment
@@ -11,13 +14,13 @@ from .services import folio_add_payment
 
 @login_required
 def folio_list(request):
-    hotels_qs = _user_hotels_qs(request.user)
+    scope = get_scope(request)
 
     hotel_id = request.GET.get("hotel") or ""
     q = (request.GET.get("q") or "").strip()
     status = request.GET.get("status") or "open"  # open/closed/all
 
-    qs = CompanyFolio.objects.select_related("hotel", "company").filter(hotel__in=hotels_qs)
+    qs = CompanyFolio.objects.select_related("hotel", "company").filter(hotel_id__in=scope.ids)
 
     if hotel_id:
         qs = qs.filter(hotel_id=hotel_id)
@@ -29,9 +32,9 @@ def folio_list(request):
     elif status == "closed":
         qs = qs.filter(is_closed=True)
 
-    # баланс посчитаем на странице через property (MVP). Если много данных — оптимизируем позже.
+    # баланс хранится в фолио (post_folio_item) — список одним запросом
     return render(request, "pms/folio_list.html", {
-        "hotels": hotels_qs,
+        "hotels": scope.hotels(),
         "rows": qs.order_by("-id")[:500],
         "hotel_id": hotel_id,
         "q": q,
@@ -41,12 +44,10 @@ def folio_list(request):
 
 @login_required
 def folio_detail(request, pk: int):
-    hotels_qs = _user_hotels_qs(request.user)
-
     folio = get_object_or_404(
         CompanyFolio.objects.select_related("hotel", "company"),
         pk=pk,
-        hotel__in=hotels_qs,
+        hotel_id__in=get_scope(request).ids,
     )
 
     items = folio.items.select_related("dds_operation", "cash_movement").order_by("-happened_at", "-id")[:300]
@@ -60,12 +61,10 @@ def folio_detail(request, pk: int):
 
 @login_required
 def folio_payment(request, pk: int):
-    hotels_qs = _user_hotels_qs(request.user)
-
     folio = get_object_or_404(
         CompanyFolio.objects.select_related("hotel", "company"),
         pk=pk,
-        hotel__in=hotels_qs,
+        hotel_id__in=get_scope(request).ids,
     )
 
     if request.method == "POST":
@@ -88,3 +87,28 @@ def folio_payment(request, pk: int):
         "form": form,
         "balance": folio.balance,
     })
+
+
+@login_required
+def folio_aging(request):
+    scope = get_scope(request)
+
+    hotel_id = request.GET.get("hotel") or ""
+    as_of = _parse_date(request.GET.get("as_of", "")) or timezone.localdate()
+
+    hotel_ids = scope.ids
+    if hotel_id:
+        hotel_ids = (int(hotel_id),) if hotel_id in scope else ()
+
+    # досчитать только фолио, изменённые после прошлого расчёта
+    refresh_aging(hotel_ids=hotel_ids)
+    rows, totals = aging_report(hotels=hotel_ids, as_of=as_of)
+
+    return render(request, "pms/folio_aging.html", {
+        "hotels": scope.hotels(),
+        "hotel_id": hotel_id,
+        "as_of": as_of,
+        "buckets": BUCKETS,
+        "rows": rows,
+        "totals": totals,
+    })
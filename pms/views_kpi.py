@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import render
+from django.utils import timezone
+
+from dds.scope import get_scope
+from dds.views import _parse_date
+from .channels import BASES, channel_report, month_start
+from .kpi import GROUPS, kpi_report
+
+
+@login_required
+def kpi_view(request):
+    scope = get_scope(request)
+
+    hotel_id = request.GET.get("hotel") or ""
+    group_by = request.GET.get("by") or "hotel"
+    if group_by not in GROUPS:
+        group_by = "hotel"
+
+    # по умолчанию — текущий месяц целиком (будущие дни — уже забронированное)
+    today = timezone.localdate()
+    month_start = today.replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    date_from = _parse_date(request.GET.get("date_from", "")) or month_start
+    date_to = _parse_date(request.GET.get("date_to", "")) or month_end
+    if date_to < date_from:
+        date_from, date_to = date_to, date_from
+    # не больше года за раз — свод досчитывается по дням
+    date_to = min(date_to, date_from + timedelta(days=366))
+
+    hotel_ids = scope.ids
+    if hotel_id:
+        hotel_ids = (int(hotel_id),) if hotel_id in scope else ()
+
+    rows, totals = kpi_report(hotel_ids=hotel_ids, date_from=date_from, date_to=date_to, group_by=group_by)
+
+    return render(request, "pms/kpi.html", {
+        "hotels": scope.hotels(),
+        "hotel_id": hotel_id,
+        "group_by": group_by,
+        "date_from": date_from,
+        "date_to": date_to,
+        "rows": rows,
+        "totals": totals,
+    })
+
+
+@login_required
+def channel_view(request):
+    scope = get_scope(request)
+
+    hotel_id = request.GET.get("hotel") or ""
+    basis = request.GET.get("basis") or "booked"
+    if basis not in BASES:
+        basis = "booked"
+
+    # по умолчанию — последние 12 месяцев, включая текущий
+    current = month_start(timezone.localdate())
+    month_from = _parse_date(request.GET.get("month_from", "") + "-01") or current.replace(year=current.year - 1)
+    month_to = _parse_date(request.GET.get("month_to", "") + "-01") or current
+    if month_to < month_from:
+        month_from, month_to = month_to, month_from
+
+    hotel_ids = scope.ids
+    if hotel_id:
+        hotel_ids = (int(hotel_id),) if hotel_id in scope else ()
+
+    rows, channels, totals = channel_report(hotel_ids=hotel_ids, month_from=month_from, month_to=month_to, basis=basis)
+
+    return render(request, "pms/channels.html", {
+        "hotels": scope.hotels(),
+        "hotel_id": hotel_id,
+        "basis": basis,
+        "month_from": month_from,
+        "month_to": month_to,
+        "rows": rows,
+        "channels": channels,
+        "totals": totals,
+    })